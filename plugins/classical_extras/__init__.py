@@ -88,16 +88,21 @@ PLUGIN_LICENSE_URL = "https://www.gnu.org/licenses/gpl-2.0.html"
 
 from picard.ui.options import register_options_page, OptionsPage
 from picard.plugins.classical_extras.ui_options_classical_extras import Ui_ClassicalExtrasOptionsPage
-import picard.plugins.classical_extras.suffixtree
+import picard.plugins.classical_extras.workscache
+import picard.plugins.classical_extras.logwriter
+import picard.plugins.classical_extras.pathquery
+import picard.plugins.classical_extras.synonyms
+import picard.plugins.classical_extras.references
+import picard.plugins.classical_extras.workdag
+import picard.plugins.classical_extras.lifecycle
+import picard.plugins.classical_extras.timing
+import picard.plugins.classical_extras.lyrics
 from picard import config, log
 from picard.config import ConfigSection, BoolOption, IntOption, TextOption
 from picard.util import LockableObject, uniqify
-
-# note that in 2.0 picard.webservice changed to picard.util.xml
-from picard.util.xml import XmlNode
 from picard.util import translate_from_sortname
 from picard.metadata import register_track_metadata_processor, Metadata
-from functools import partial
+from functools import partial, lru_cache
 from datetime import datetime
 import collections
 import re
@@ -105,10 +110,11 @@ import unicodedata
 import json
 import copy
 import os
-from PyQt5.QtCore import QXmlStreamReader
+from PyQt5.QtCore import QTimer
 from picard.const import USER_DIR
 import operator
 import ast
+from types import MappingProxyType
 import picard.plugins.classical_extras.const
 
 
@@ -132,23 +138,77 @@ RE_SCALES = r'(major|minor)?(?:\b|$)'
 RE_KEYS = re.compile(
     RE_NOTES + RE_ACCENTS + RE_SCALES,
     re.UNICODE | re.IGNORECASE)
+RE_SHARP = re.compile(r'\-sharp|\u266F', re.IGNORECASE)
+RE_FLAT = re.compile(r'\-flat|\u266D', re.IGNORECASE)
+# OPUS (CATALOGUE) NUMBERS
+RE_OPUS = re.compile(
+    r'\b((?:op|no|k|kk|kv|L|B|Hob|S|D|M)|\w+WV)\W?\s?(\d+\-?\u2013?\u2014?\d*\w*)\b',
+    re.IGNORECASE)
+RE_OPUS_NO = re.compile(r'^\W*no\b', re.IGNORECASE)
+# BOILING (see normalize)
+RE_PUNCTUATION = re.compile(r'\W*', re.ASCII)
+RE_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+# in this order, as the later replacements apply to the results of the earlier ones
+BOIL_REPLACEMENTS = (
+    ('sch', 'sh'),
+    ('\xdf', 'ss'),
+    ('sz', 'ss'),
+    ('\u0153', 'oe'),
+    ('oe', 'o'),
+    ('\u00fc', 'ue'),
+    ('ue', 'u'),
+    ('\u00e6', 'ae'),
+    ('ae', 'a'))
+# ... followed by these single characters
+BOIL_TRANSLATION = str.maketrans({
+    '\u266F': 'sharp',
+    '\u266D': 'flat',
+    '\u2013': '-',
+    '\u2014': '-'})
+
+# PERSISTENT WORKS CACHE
+# only opened on first use (if the cwp_persistent_cache option is set)
+WORKS_STORE = workscache.WorksStore(
+    os.path.join(USER_DIR, "Classical_Extras", const.WORKS_CACHE_FILE),
+    const.WORKS_CACHE_TTL,
+    const.WORKS_CACHE_MAX_ENTRIES)
 
 # LOGGING
 
 # If logging occurs before any album is loaded, the startup log file will
 # be written
-log_files = collections.defaultdict(dict)
+LOG_WRITER = logwriter.LogWriter(os.path.join(USER_DIR, "Classical_Extras"))
+# all log files are written by a background thread
+log_files = {}
 # entries are release-ids: to keep track of which log files are open
+# log_files[release_id] holds the lines not yet passed to LOG_WRITER
 release_status = collections.defaultdict(dict)
 # release_status[release_id]['works'] = True indicates that we are still processing works for release_id
 # & similarly for 'artists'
 # release_status[release_id]['start'] holds start time of release processing
 # release_status[release_id]['name'] holds the album name
 # release_status[release_id]['lookups'] holds number of lookups for this release
-# release_status[release_id]['file_objects'] holds a cumulative list of file objects (tagger seems a bit unreliable)
+# release_status[release_id]['work-ids'] holds the set of works looked up for this release
+# release_status[release_id]['prefetched'] and ['stored'] hold the number of works looked up in advance
+# and the number read from the persistent works cache
+# release_status[release_id]['debug'], ['warnings'] and ['errors'] hold the (unique) messages for the session log
+# release_status[release_id]['base_options'], ['shared_options'] and ['track_options'] hold the options
+# used for the release's tracks (see get_options)
+# release_status[release_id]['release_index'] holds the parts of the release data used on the first track
+# (see release_index)
+# release_status[release_id]['file_objects'] holds a cumulative (ordered) dict of file objects, keyed by filename
+# (tagger seems a bit unreliable)
+# release_status[release_id]['file_index'] holds the filename for each (discnumber, tracknumber)
 # release_status[release_id]['file_found'] = False indicates that "No file
 # with matching trackid" has (yet) been found
 
+lcs_cache = collections.defaultdict(dict)
+# lcs_cache[release_id] holds the results of longest_common_substring for the release
+
+RELEASES = lifecycle.ReleaseLifecycle()
+# albums being (or having been) processed - all the state above (and in PartLevels and ExtraArtists)
+# for a release is discarded when its album is removed
+
 
 def write_log(release_id, log_type, message, *args):
     """
@@ -157,6 +217,8 @@ def write_log(release_id, log_type, message, *args):
     to aid in debugging - the log file is release_id.log. Any startup messages (i.e. before a release has been loaded)
     are written to session.log. Summary information for each release is also written to session.log even if log_info
     is not set.
+    The message is only formatted if it is going to be used. Lines for a release log are held in log_files and passed
+    to LOG_WRITER (which writes them in a background thread) in batches.
     :param release_id: name for log file - usually =musicbrainz_albumid
         unless called outside metadata processor
     :param log_type: 'error', 'warning', 'debug' or 'info'
@@ -165,6 +227,21 @@ def write_log(release_id, log_type, message, *args):
     :return:
     """
     options = config.setting
+    to_file = options["log_info"] or log_type == "basic"
+    # if log_info is True, all log messages will be written to the custom log, regardless of other log_... settings
+    # basic session log will always be written (summary of releases and
+    # processing times)
+    to_status = (log_type == 'debug' and options["log_debug"]) or (
+        log_type == 'warning' and options["log_warning"]) or (
+        log_type == 'error' and options["log_error"])
+    if not (to_file or to_status):
+        return
+    _write_log(release_id, log_type, message, args, to_file, to_status)
+
+
+@timing.timed('logging')
+def _write_log(release_id, log_type, message, args, to_file, to_status):
+    # the part of write_log which runs if the message is to be written
     if not isinstance(message, str):
         msg = repr(message)
     else:
@@ -172,86 +249,39 @@ def write_log(release_id, log_type, message, *args):
     if args:
         msg = msg % args
 
-    if options["log_info"] or log_type == "basic":
-        # if log_info is True, all log messages will be written to the custom log, regardless of other log_... settings
-        # basic session log will always be written (summary of releases and
-        # processing times)
-        filename = release_id + ".log"
-        log_dir = os.path.join(USER_DIR, "Classical_Extras")
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+    if to_file:
         if release_id not in log_files:
-            try:
-                if release_id == 'session':
-                    log_file = open(
-                        os.path.join(
-                            log_dir,
-                            filename),
-                        'w',
-                        encoding='utf8',
-                        buffering=1)
-                    # buffering=1 so that session log (low volume) is up to
-                    # date even if not closed
-                else:
-                    log_file = open(
-                        os.path.join(
-                            log_dir,
-                            filename),
-                        'w',
-                        encoding='utf8')  # , buffering=1)
-                    # default buffering for speed, buffering = 1 for currency
-                log_files[release_id] = log_file
-                log_file.write(
-                    PLUGIN_NAME +
-                    ' Version:' +
-                    PLUGIN_VERSION +
-                    '\n')
-                if release_id == 'session':
-                    log_file.write('session' + '\n')
-                else:
-                    log_file.write('Release id: ' + release_id + '\n')
-                    if release_id in release_status and 'name' in release_status[release_id]:
-                        log_file.write(
-                            'Album name: ' + release_status[release_id]['name'] + '\n')
-            except IOError:
-                log.error('Unable to open file %s for writing log', filename)
-                return
-        else:
-            log_file = log_files[release_id]
-        try:
-            log_file.write(log_type[0].upper() + ': ')
-            log_file.write(str(datetime.now()) + ' : ')
-            log_file.write(msg)
-            log_file.write("\n")
-        except IOError:
-            log.error('Unable to write to log file %s', filename)
-            return
+            header = [PLUGIN_NAME + ' Version:' + PLUGIN_VERSION]
+            if release_id == 'session':
+                header.append('session')
+            else:
+                header.append('Release id: ' + release_id)
+                if release_id in release_status and 'name' in release_status[release_id]:
+                    header.append('Album name: ' + release_status[release_id]['name'])
+            LOG_WRITER.open(release_id, header)
+            log_files[release_id] = []
+        log_buffer = log_files[release_id]
+        log_buffer.append(log_type[0].upper() + ': ' + str(datetime.now()) + ' : ' + msg)
+        # session log (low volume) is kept up to date, release logs are written in batches
+        if release_id == 'session' or len(log_buffer) >= const.LOG_BUFFER_LINES:
+            LOG_WRITER.write(release_id, log_buffer)
+            log_files[release_id] = []
+    if not to_status:
+        return
     # Only debug, warning and error messages will be written to the main
     # Picard log, if those options have been set
-    if log_type != 'info' and log_type != 'basic':  # i.e. non-custom log items
-        message2 = PLUGIN_NAME + ': ' + message
-    else:
-        message2 = message
-    if log_type == 'debug' and options["log_debug"]:
-        if release_id in release_status and 'debug' in release_status[release_id]:
-            add_list_uniquely(release_status[release_id]['debug'], msg)
-        else:
-            release_status[release_id]['debug'] = [msg]
+    message2 = PLUGIN_NAME + ': ' + message
+    if log_type == 'debug':
+        release_status[release_id].setdefault('debug', collections.OrderedDict())[msg] = None
         log.debug(message2, *args)
-    if log_type == 'warning' and options["log_warning"]:
-        if release_id in release_status and 'warnings' in release_status[release_id]:
-            add_list_uniquely(release_status[release_id]['warnings'], msg)
-        else:
-            release_status[release_id]['warnings'] = [msg]
+    elif log_type == 'warning':
+        release_status[release_id].setdefault('warnings', collections.OrderedDict())[msg] = None
         if args:
             log.warning(message2, *args)
         else:
             log.warning(message2)
-    if log_type == 'error' and options["log_error"]:
-        if release_id in release_status and 'errors' in release_status[release_id]:
-            add_list_uniquely(release_status[release_id]['errors'], msg)
-        else:
-            release_status[release_id]['errors'] = [msg]
+    else:
+        release_status[release_id].setdefault('errors', collections.OrderedDict())[msg] = None
         if args:
             log.error(message2, *args)
         else:
@@ -268,8 +298,14 @@ def close_log(release_id, caller):
             (caller == 'artists' and release_status[release_id]['works']):
         # log.error('exiting close_log. only %s done', caller) # debug line
         return
+    profile_path = timing.stop_profile(
+        release_id, os.path.join(USER_DIR, "Classical_Extras", release_id + '.prof'))
+    session_report = 'session' in log_files and release_id in release_status
     duration = 'N/A'
     lookups = 'N/A'
+    works_required = 'N/A'
+    prefetched = 0
+    stored = 0
     artists_time = 0
     works_time = 0
     lookup_time = 0
@@ -277,6 +313,9 @@ def close_log(release_id, caller):
     if release_id in release_status:
         duration = datetime.now() - release_status[release_id]['start']
         lookups = release_status[release_id]['lookups']
+        works_required = len(release_status[release_id].get('work-ids', ()))
+        prefetched = release_status[release_id].get('prefetched', 0)
+        stored = release_status[release_id].get('stored', 0)
         done_lookups = release_status[release_id]['done-lookups']
         lookup_time = done_lookups - release_status[release_id]['start']
         album_process_time = duration - lookup_time
@@ -296,10 +335,17 @@ def close_log(release_id, caller):
             'Duration = %s. Number of lookups = %s.',
             duration,
             lookups)
+        write_log(
+            release_id,
+            'info',
+            'Works required = %s. Lookups made in advance = %s. Works from saved cache = %s.',
+            works_required,
+            prefetched,
+            stored)
         write_log(release_id, 'info', 'Closing log file for %s', release_id)
-        log_files[release_id].close()
-        del log_files[release_id]
-    if 'session' in log_files and release_id in release_status:
+        LOG_WRITER.write(release_id, log_files.pop(release_id))
+        LOG_WRITER.close(release_id)
+    if session_report:
         write_log(
             'session',
             'basic',
@@ -343,40 +389,70 @@ def close_log(release_id, caller):
             lookup_time,
             album_process_time,
             lookups)
+        write_log(
+            'session',
+            'basic',
+            'Works required = %s (i.e. lookups without caching). Of the %s lookups, %s were made in advance. '
+            'Works from saved cache = %s.',
+            works_required,
+            lookups,
+            prefetched,
+            stored)
     if release_id in release_status:
         del release_status[release_id]
+    if release_id in lcs_cache:
+        del lcs_cache[release_id]
+    write_log('session', 'info', 'Cache sizes: %s', RELEASES.cache_sizes())
+    # close_log is called from within timed functions, so the timings are only complete once they have returned
+    timing.report_when_done(release_id, partial(log_phases, release_id, session_report, profile_path))
 
 
-# FILE READING AND OBJECT PARSING
+def log_phases(release_id, session_report, profile_path, phases):
+    """
+    Write the timings for a release to the session log (see close_log)
+    :param release_id:
+    :param session_report: True if the release has been reported in the session log
+    :param profile_path: profile statistics file, or None
+    :param phases: list of (phase, seconds, calls), from timing.report
+    :return:
+    """
+    if not session_report or 'session' not in log_files:
+        return
+    if phases:
+        # times include those of any phases within them
+        write_log('session', 'basic', 'Time by phase for release id %s:', release_id)
+        for name, seconds, calls in phases:
+            write_log('session', 'basic', '    %s: %.3f s (%s calls)', name, seconds, calls)
+    if profile_path:
+        write_log('session', 'basic', 'Profile saved in %s', profile_path)
 
-_node_name_re = re.compile('[^a-zA-Z0-9]')
 
+def purge_release_status(release_id, album, tracks):
+    """
+    Discard the module-level state for a release whose album has been removed (see lifecycle.ReleaseLifecycle)
+    :param release_id:
+    :param album:
+    :param tracks:
+    :return:
+    """
+    if release_id in log_files:
+        LOG_WRITER.write(release_id, log_files.pop(release_id))
+        LOG_WRITER.close(release_id)
+    release_status.pop(release_id, None)
+    lcs_cache.pop(release_id, None)
+    timing.discard(release_id)
 
-def _node_name(n):
-    return _node_name_re.sub('_', str(n))
 
+def release_cache_sizes():
+    sizes = {
+        'release status': len(release_status),
+        'open logs': len(log_files),
+        'lcs cache': len(lcs_cache)}
+    sizes.update(timing.sizes())
+    return sizes
 
-def _read_xml(stream):
-    document = XmlNode()
-    current_node = document
-    path = []
-    while not stream.atEnd():
-        stream.readNext()
-        if stream.isStartElement():
-            node = XmlNode()
-            attrs = stream.attributes()
-            for i in range(attrs.count()):
-                attr = attrs.at(i)
-                node.attribs[_node_name(attr.name())] = str(attr.value())
-            current_node.append_child(_node_name(stream.name()), node)
-            path.append(current_node)
-            current_node = node
-        elif stream.isEndElement():
-            current_node = path.pop()
-        elif stream.isCharacters():
-            current_node.text += str(stream.text())
-    return document
 
+# FILE READING AND OBJECT PARSING
 
 def parse_data(release_id, obj, response_list, *match):
     """
@@ -387,7 +463,7 @@ def parse_data(release_id, obj, response_list, *match):
     :param release_id: name for log file - usually =musicbrainz_albumid
         unless called outside metadata processor
     :param obj: an XmlNode or JSON object, list or dictionary containing nodes
-    :param response_list: working memory for recursive calls
+    :param response_list: list to which the matching items are appended
     :param match: list of items to search for in node (see detailed notes below)
     :return: a list of matching items (always a list, even if only one item)
 
@@ -398,135 +474,17 @@ def parse_data(release_id, obj, response_list, *match):
       (Note: childname can be a dot-list if the text is more than one level down - e.g. child1.child2
       # TODO - Check this works fully )
     """
-    if '!log' in response_list:
-        DEBUG = True
-        INFO = True
-    else:
-        DEBUG = False
-        INFO = False
-    # Normally logging options are off as these can be VERY wordy
-    # They can be turned on by using !log in the call
-
-    # XmlNode instances are not iterable, so need to convert to dict
-    if isinstance(obj, XmlNode):
-        obj = obj.__dict__
-    if DEBUG or INFO:
+    # The query is compiled (and cached) by pathquery, so repeated calls with the same match are cheap.
+    # Normally logging is off as it can be VERY wordy
+    # It can be turned on by using !log in the call
+    verbose = '!log' in response_list
+    if verbose:
         write_log(release_id, 'debug', 'Parsing data - looking for %s', match)
-    if INFO:
         write_log(release_id, 'info', 'Looking in object: %s', obj)
-    if isinstance(obj, list):
-        objlen = len(obj)
-        for i, item in enumerate(obj):
-            if isinstance(item, XmlNode):
-                item = item.__dict__
-            if INFO:
-                write_log(
-                    release_id,
-                    'info',
-                    'Getting response for list item no.%s of %s - object is: %s',
-                    i + 1,
-                    objlen,
-                    item)
-            parse_data(release_id, item, response_list, *match)
-            if INFO:
-                write_log(
-                    release_id,
-                    'info',
-                    'response_list for list item no.%s of %s is %s',
-                    i + 1,
-                    objlen,
-                    response_list)
-        return response_list
-    elif isinstance(obj, dict):
-        if match[0] in obj:
-            if len(match) == 1:
-                response = obj[match[0]]
-                if response is not None:  # To prevent adding NoneTypes to list
-                    response_list.append(response)
-                if INFO:
-                    write_log(
-                        release_id,
-                        'info',
-                        'response_list (last match item): %s',
-                        response_list)
-            else:
-                match_list = list(match)
-                match_list.pop(0)
-                parse_data(release_id, obj[match[0]],
-                           response_list, *match_list)
-                if INFO:
-                    write_log(
-                        release_id,
-                        'info',
-                        'response_list (passing up): %s',
-                        response_list)
-            return response_list
-        elif ':' in match[0]:
-            test = match[0].split(':')
-            match2 = test[0].split('.')
-            test_data = parse_data(release_id, obj, [], *match2)
-            if INFO:
-                write_log(
-                    release_id,
-                    'info',
-                    'Value comparison - looking in %s for value %s',
-                    test_data,
-                    test[1])
-            if len(test) > 1:
-                # latter is because Booleans are stored as such, not as
-                # strings, in JSON
-                if (test[1] in test_data) or (
-                        (test[1] == 'True') in test_data):
-                    if len(match) == 1:
-                        response = obj
-                        if response is not None:
-                            response_list.append(response)
-                    else:
-                        match_list = list(match)
-                        match_list.pop(0)
-                        parse_data(release_id, obj, response_list, *match_list)
-            else:
-                parse_data(release_id, obj, response_list, *match2)
-            if INFO:
-                write_log(
-                    release_id,
-                    'info',
-                    'response_list (from value look-up): %s',
-                    response_list)
-            return response_list
-        else:
-            if 'children' in obj:
-                parse_data(release_id, obj['children'], response_list, *match)
-            if INFO:
-                write_log(
-                    release_id,
-                    'info',
-                    'response_list (from children): %s',
-                    response_list)
-            return response_list
-    else:
-        if INFO:
-            write_log(
-                release_id,
-                'info',
-                'response_list (obj is not a list or dict): %s',
-                response_list)
-        return response_list
-
-
-def create_dict_from_ref_list(options, release_id, ref_list, keys, tags):
-    ref_dict_list = []
-    for refs in ref_list:
-        for ref in refs:
-            parsed_refs = [
-                parse_data(
-                    release_id,
-                    ref,
-                    [],
-                    t,
-                    'text') for t in tags]
-            ref_dict_list.append(dict(zip(keys, parsed_refs)))
-    return ref_dict_list
+    response_list.extend(pathquery.evaluate(pathquery.compile_query(match), obj))
+    if verbose:
+        write_log(release_id, 'info', 'response_list: %s', response_list)
+    return response_list
 
 
 def get_references_from_file(release_id, path, filename):
@@ -538,46 +496,22 @@ def get_references_from_file(release_id, path, filename):
     :return:
     """
     options = config.setting
-    composer_dict_list = []
-    period_dict_list = []
-    genre_dict_list = []
-    xml_file = None
+    ref_dict = {
+        'composers': [],
+        'periods': [],
+        'genres': []}
     try:
-        xml_file = open(os.path.join(path, filename), encoding="utf8")
-        reply = xml_file.read()
-        xml_file.close()
-        document = _read_xml(QXmlStreamReader(reply))
-        # Composers
-        composer_list = parse_data(
-            release_id, document, [], 'ReferenceDB', 'Composer')
-        keys = ['name', 'sort', 'birth', 'death', 'country', 'core']
-        tags = ['Name', 'Sort', 'Birth', 'Death', 'CountryCode', 'Core']
-        composer_dict_list = create_dict_from_ref_list(
-            options, release_id, composer_list, keys, tags)
-        # Periods
-        period_list = parse_data(
-            release_id,
-            document,
-            [],
-            'ReferenceDB',
-            'ClassicalPeriod')
-        keys = ['name', 'start', 'end']
-        tags = ['Name', 'Start_x0020_Date', 'End_x0020_Date']
-        period_dict_list = create_dict_from_ref_list(
-            options, release_id, period_list, keys, tags)
-        # Genres
-        genre_list = parse_data(
-            release_id,
-            document,
-            [],
-            'ReferenceDB',
-            'ClassicalGenre')
-        keys = ['name']
-        tags = ['Name']
-        genre_dict_list = create_dict_from_ref_list(
-            options, release_id, genre_list, keys, tags)
-
-    except (IOError, FileNotFoundError, UnicodeDecodeError):
+        ref_dict, error = references.read_references(os.path.join(path, filename))
+        if error:
+            write_log(
+                release_id,
+                'error',
+                'Error in reference file %s: %s',
+                os.path.join(
+                    path,
+                    filename),
+                error)
+    except (IOError, FileNotFoundError):
         if options['cwp_muso_genres'] or options['cwp_muso_classical'] or options['cwp_muso_dates'] or options['cwp_muso_periods']:
             write_log(
                 release_id,
@@ -586,13 +520,52 @@ def get_references_from_file(release_id, path, filename):
                 os.path.join(
                     path,
                     filename))
-    finally:
-        if xml_file:
-            xml_file.close()
-    return {
-            'composers': composer_dict_list,
-            'periods': period_dict_list,
-            'genres': genre_dict_list}
+    return ref_dict
+
+
+def muso_references(options):
+    """
+    Get the Muso reference data, reading it on first use
+    (from the snapshot saved the last time the reference file was read, if the file has not changed since)
+    :param options:
+    :return: dict of
+        'composers': composer records, keyed by lower-case name
+        'periods': PeriodMap
+        'genres': list of classical genres
+    """
+    path = os.path.join(options['cwp_muso_path'], options['cwp_muso_refdb'])
+    if path not in MUSO_REFERENCES:
+        snapshot_path = os.path.join(USER_DIR, "Classical_Extras", const.REFERENCES_SNAPSHOT_FILE)
+        ref_dict = references.read_snapshot(snapshot_path, path)
+        if ref_dict is not None:
+            write_log('session', 'info', 'External references (Muso) read from snapshot %s', snapshot_path)
+        else:
+            ref_dict = get_references_from_file(
+                'session',
+                options['cwp_muso_path'],
+                options['cwp_muso_refdb'])
+            if any(ref_dict.values()):
+                references.write_snapshot(snapshot_path, path, ref_dict)
+        write_log(
+            'session',
+            'info',
+            'External references (Muso) from %s: %d composers, %d periods, %d genres',
+            path,
+            len(ref_dict['composers']),
+            len(ref_dict['periods']),
+            len(ref_dict['genres']))
+        if options['cwp_muso_classical'] and not ref_dict['composers']:
+            write_log('session', 'error', 'No composer roster found')
+        if (options['cwp_muso_dates']
+                or options['cwp_muso_periods']) and not ref_dict['periods']:
+            write_log('session', 'error', 'No period map found')
+        if options['cwp_muso_genres'] and not ref_dict['genres']:
+            write_log('session', 'error', 'No classical genre list found')
+        MUSO_REFERENCES[path] = {
+            'composers': references.composer_index(ref_dict['composers']),
+            'periods': references.PeriodMap(references.muso_periods(ref_dict['periods'])),
+            'genres': references.muso_genres(ref_dict['genres'])}
+    return MUSO_REFERENCES[path]
 
 # OPTIONS
 
@@ -604,6 +577,26 @@ def get_preserved_tags():
     return preserved
 
 
+def index_album_files(release_id, album):
+    """
+    Add any files now attached to the album to release_status[release_id]['file_objects'] and ['file_index']
+    :param release_id:
+    :param album:
+    :return: number of files added
+    """
+    file_objects = release_status[release_id].setdefault('file_objects', collections.OrderedDict())
+    file_index = release_status[release_id].setdefault('file_index', {})
+    files_added = 0
+    for album_file in album.tagger.get_files_from_objects([album]):
+        if album_file.filename not in file_objects:
+            file_objects[album_file.filename] = album_file
+            # if more than one file has the same numbers, the first one is used
+            file_index.setdefault(
+                (str(album_file.discnumber), str(album_file.tracknumber)), album_file.filename)
+            files_added += 1
+    return files_added
+
+
 def get_options(release_id, album, track):
     """
     Get the saved options from a release and use them according to flags set on the "advanced" tab
@@ -616,7 +609,6 @@ def get_options(release_id, album, track):
     this function so that the results are available to both (via a track metadata item)
     """
     release_status[release_id]['done'] = False
-    set_options = collections.defaultdict(dict)
     main_sections = ['artists', 'workparts']
     all_sections = ['artists', 'tag', 'workparts', 'genres']
     parent_sections = {
@@ -635,26 +627,26 @@ def get_options(release_id, album, track):
     sect_text = {'artists': 'Artists', 'workparts': 'Works'}
     prefix = {'artists': 'cea', 'workparts': 'cwp'}
 
-    if album.tagger.config.setting['ce_options_overwrite'] and all(
-            album.tagger.config.setting[override[sect]] for sect in main_sections):
-        set_options[track] = album.tagger.config.setting  # mutable
+    overwrite = album.tagger.config.setting['ce_options_overwrite'] and all(
+            album.tagger.config.setting[override[sect]] for sect in main_sections)
+    if overwrite:
+        options = album.tagger.config.setting  # mutable
     else:
-        set_options[track] = option_settings(
-            album.tagger.config.setting)  # make a copy
-        if set_options[track]["log_info"]:
+        # overrides for the track go in the first map - the UI options underneath are shared by all tracks
+        options = collections.ChainMap({}, base_options(release_id))
+        if options["log_info"]:
             write_log(
                 release_id,
                 'info',
                 'Default (i.e. per UI) options for track %s are %r',
                 track,
-                set_options[track])
+                dict(options))
 
     # As we use some of the main Picard options and may over-write them, save them here
-    # set_options[track]['translate_artist_names'] = config.setting['translate_artist_names']
-    # set_options[track]['standardize_artists'] = config.setting['standardize_artists']
+    # options['translate_artist_names'] = config.setting['translate_artist_names']
+    # options['standardize_artists'] = config.setting['standardize_artists']
     # (not sure this is needed - TODO reconsider)
 
-    options = set_options[track]
     tm = track.metadata
     new_metadata = None
     orig_metadata = None
@@ -669,52 +661,31 @@ def get_options(release_id, album, track):
     trackno = tm['tracknumber']
     discno = tm['discnumber']
 
-    album_filenames = album.tagger.get_files_from_objects([album])
-    if options["log_info"]:
-        write_log(
-            release_id,
-            'info',
-            'No. of album files found = %s',
-            len(album_filenames))
     # Note that sometimes Picard fails to get all the file objects, even if they are there (network issues)
-    # so we will cache whatever we can get!
-    if release_id in release_status and 'file_objects' in release_status[release_id]:
-        add_list_uniquely(
-            release_status[release_id]['file_objects'],
-            album_filenames)
-    else:
-        release_status[release_id]['file_objects'] = album_filenames
+    # so we will cache whatever we can get! The index is only refreshed if it has no file for this track.
+    if (discno, trackno) not in release_status[release_id].get('file_index', {}):
+        files_added = index_album_files(release_id, album)
+        if options["log_info"]:
+            write_log(
+                release_id,
+                'info',
+                'No. of album files added to cache = %s',
+                files_added)
     if options["log_info"]:
         write_log(release_id, 'info', 'No. of album files cached = %s',
                   len(release_status[release_id]['file_objects']))
-    track_file = None
-    for album_file in release_status[release_id]['file_objects']:
-        if options["log_info"]:
-            write_log(release_id,
-                      'info',
-                      'Track file = %s, tracknumber = %s, discnumber = %s. Metadata trackno = %s, discno = %s',
-                      album_file.filename,
-                      str(album_file.tracknumber),
-                      str(album_file.discnumber),
-                      trackno,
-                      discno)
-        if str(
-                album_file.tracknumber) == trackno and str(
-                album_file.discnumber) == discno:
-            if options["log_info"]:
-                write_log(
-                    release_id,
-                    'info',
-                    'Track file found = %r',
-                    album_file.filename)
-            track_file = album_file.filename
-            break
+    track_file = release_status[release_id]['file_index'].get((discno, trackno))
+    if track_file and options["log_info"]:
+        write_log(
+            release_id,
+            'info',
+            'Track file found = %r',
+            track_file)
 
     # Note: It would have been nice to do a rough check beforehand of total tracks,
     # but ~totalalbumtracks is not yet populated
     if not track_file:
-        album_fullnames = [
-            x.filename for x in release_status[release_id]['file_objects']]
+        album_fullnames = list(release_status[release_id]['file_objects'])
         if options["log_info"]:
             write_log(
                 release_id,
@@ -910,6 +881,10 @@ def get_options(release_id, album, track):
                                             append_tag(
                                                 release_id, tm, '003_information:options_overridden', str(
                                                     ea_opt['name']) + ' = ' + opt_text)
+        if not overwrite:
+            # tracks with the same saved options share them; anything else set for the track goes in a new map
+            options = collections.ChainMap(
+                {}, shared_options(release_id, options.maps[0]), *options.maps[1:])
 
         if orig_metadata:
             keep_list = options['cea_keep'].split(",")
@@ -956,21 +931,25 @@ def get_options(release_id, album, track):
                 append_tag(release_id, tm, mirror_name, orig_metadata[tag_item])
             append_tag(release_id, tm, '~ce_mirror_tags', mirror_tags)
 
-        if not isinstance(options, dict):
-            options_dict = option_settings(config.setting)
-            write_log(
-                'session',
-                'info',
-                'Using option_settings(config.setting): %s',
-                options_dict)
-        else:
-            options_dict = options
-            write_log(
-                'session',
-                'info',
-                'Using options: %s',
-                options_dict)
-        tm['~ce_options'] = str(options_dict)
+        if overwrite:
+            options = MappingProxyType(option_settings(config.setting))
+        # the options are only copied (for a readable log) if they are to be logged
+        if config.setting['log_info']:
+            if overwrite:
+                write_log(
+                    'session',
+                    'info',
+                    'Using option_settings(config.setting): %s',
+                    dict(options))
+            else:
+                write_log(
+                    'session',
+                    'info',
+                    'Using options: %s',
+                    dict(options))
+        release_status[release_id].setdefault('track_options', {})[track] = options
+        # the options themselves are read with get_track_options
+        tm['~ce_options'] = 'saved'
         tm['~ce_file'] = music_file_found
 
 
@@ -1010,6 +989,78 @@ def option_settings(config_settings):
     return options
 
 
+def base_options(release_id):
+    """
+    :param release_id:
+    :return: a read-only copy of the options, made once for the release and shared by all its tracks
+    """
+    if 'base_options' not in release_status[release_id]:
+        release_status[release_id]['base_options'] = MappingProxyType(option_settings(config.setting))
+    return release_status[release_id]['base_options']
+
+
+def shared_options(release_id, overrides):
+    """
+    :param release_id:
+    :param overrides: dict of options read from the saved tags of a file
+    :return: a read-only copy of overrides - the same object for all tracks of the release with the same overrides
+    """
+    try:
+        key = frozenset(overrides.items())
+    except TypeError:  # unhashable option values - just don't share them
+        return MappingProxyType(dict(overrides))
+    shared = release_status[release_id].setdefault('shared_options', {})
+    if key not in shared:
+        shared[key] = MappingProxyType(dict(overrides))
+    return shared[key]
+
+
+def get_track_options(release_id, track):
+    """
+    :param release_id:
+    :param track:
+    :return: the options set for the track by get_options (None if there are none)
+    Each call returns a new ChainMap, so any changes the caller makes are not seen elsewhere
+    """
+    options = release_status.get(release_id, {}).get('track_options', {}).get(track)
+    if options is None:
+        return None
+    if isinstance(options, collections.ChainMap):
+        return collections.ChainMap({}, *options.maps)
+    return collections.ChainMap({}, options)
+
+
+def release_index(release_id, releaseXmlNode):
+    """
+    The parts of the release data used (on processing the first track) by both ExtraArtists and PartLevels
+    Found in one walk of the release and kept in release_status until the release is closed
+    :param release_id:
+    :param releaseXmlNode: all the metadata for the release
+    :return: dict:
+        'relations': release relationships
+        'tracks': track nodes of all media, in order
+        'recordings': for each track, the list of its recording nodes
+        'release-group': release group nodes
+        'release artists sort': sort names of the release artists
+    """
+    index = release_status[release_id].get('release_index')
+    # a new release node means that the release has been refreshed
+    if index is None or index['node'] is not releaseXmlNode:
+        tracks = []
+        for media_tracks in parse_data(release_id, releaseXmlNode, [], 'media', 'tracks'):
+            tracks.extend(media_tracks)
+        index = {
+            'node': releaseXmlNode,
+            'relations': parse_data(release_id, releaseXmlNode, [], 'relations'),
+            'tracks': tracks,
+            'recordings': [parse_data(release_id, t, [], 'recording') for t in tracks],
+            'release-group': parse_data(release_id, releaseXmlNode, [], 'release-group'),
+            'release artists sort': parse_data(
+                release_id, releaseXmlNode, [], 'artist-credit', 'artist', 'sort-name')}
+        release_status[release_id]['release_index'] = index
+    return index
+
+
 def get_aliases(self, release_id, album, options, releaseXmlNode):
     """
     :param release_id: name for log file - usually =musicbrainz_albumid
@@ -1041,34 +1092,25 @@ def get_aliases(self, release_id, album, options, releaseXmlNode):
         locale = config.setting["artist_locale"]
         lang = locale.split("_")[0]  # NB this is the Picard code in /util
 
-        # Track and recording aliases/credits are gathered by parsing the
-        # media, track and recording nodes
+        # Track and recording aliases/credits are gathered from the
+        # media, track and recording nodes (listed once in the release index)
+        index = release_index(release_id, releaseXmlNode)
         # Do the recording relationship first as it may apply to multiple releases, so release and track data
         # is more specific.
-        media = parse_data(release_id, releaseXmlNode, [], 'media')
-        for m in media:
-            # disc_num = int(parse_data(options, m, [], 'position', 'text')[0])
-            # not currently used
-            tracks = parse_data(release_id, m, [], 'tracks')
-            for track in tracks:
-                for t in track:
-                    # track_num = int(parse_data(options, t, [], 'number',
-                    # 'text')[0]) # not currently used
-
-                    # Recording artists
-                    obj = parse_data(release_id, t, [], 'recording')
-                    get_aliases_and_credits(
-                        self,
-                        options,
-                        release_id,
-                        album,
-                        obj,
-                        lang,
-                        options['cea_recording_credited'])
+        for obj in index['recordings']:
+            # Recording artists
+            get_aliases_and_credits(
+                self,
+                options,
+                release_id,
+                album,
+                obj,
+                lang,
+                options['cea_recording_credited'])
 
         # Get the release data before the recording relationshiops and track data
         # Release group artists
-        obj = parse_data(release_id, releaseXmlNode, [], 'release-group')
+        obj = index['release-group']
         get_aliases_and_credits(
             self,
             options,
@@ -1088,8 +1130,7 @@ def get_aliases(self, release_id, album, options, releaseXmlNode):
             lang,
             options['cea_credited'])
         # Next bit needed to identify artists who are album artists
-        self.release_artists_sort[album] = parse_data(
-            release_id, releaseXmlNode, [], 'artist-credit', 'artist', 'sort-name')
+        self.release_artists_sort[album] = index['release artists sort'][:]
         # Release relationship artists
         get_relation_credits(
             self,
@@ -1101,29 +1142,25 @@ def get_aliases(self, release_id, album, options, releaseXmlNode):
             options['cea_release_relationship_credited'])
 
         # Now get the rest:
-        for m in media:
-            tracks = parse_data(release_id, m, [], 'tracks')
-            for track in tracks:
-                for t in track:
-                    # Recording relationship artists
-                    obj = parse_data(release_id, t, [], 'recording')
-                    get_relation_credits(
-                        self,
-                        options,
-                        release_id,
-                        album,
-                        obj,
-                        lang,
-                        options['cea_recording_relationship_credited'])
-                    # Track artists
-                    get_aliases_and_credits(
-                        self,
-                        options,
-                        release_id,
-                        album,
-                        t,
-                        lang,
-                        options['cea_track_credited'])
+        for t, obj in zip(index['tracks'], index['recordings']):
+            # Recording relationship artists
+            get_relation_credits(
+                self,
+                options,
+                release_id,
+                album,
+                obj,
+                lang,
+                options['cea_recording_relationship_credited'])
+            # Track artists
+            get_aliases_and_credits(
+                self,
+                options,
+                release_id,
+                album,
+                t,
+                lang,
+                options['cea_track_credited'])
 
     if options['log_info']:
         write_log(release_id, 'info', 'Alias and credits info for %s', self)
@@ -1135,6 +1172,7 @@ def get_aliases(self, release_id, album, options, releaseXmlNode):
             self.artist_credits[album])
 
 
+@timing.timed('artists: get_artists')
 def get_artists(options, release_id, tm, relations, relation_type):
     """
     Get artist info from XML lookup
@@ -1158,15 +1196,21 @@ def get_artists(options, release_id, tm, relations, relation_type):
         'log_info': options['log_info']}
     artists = []
     instruments = []
+    # sort the artist relationships by type in one pass, rather than searching them for each type
+    relations_by_type = collections.defaultdict(list)
+    for relation in parse_data(release_id, relations, [], 'target-type:artist'):
+        for artist_type in collections.OrderedDict.fromkeys(parse_data(release_id, relation, [], 'type')):
+            relations_by_type[artist_type].append(relation)
     artist_types = const.RELATION_TYPES[relation_type]
     for artist_type in artist_types:
-        artists, instruments = create_artist_data(release_id, options, log_options, tm, relations,
+        artists, instruments = create_artist_data(release_id, options, log_options, tm,
+                                                  relations_by_type.get(artist_type, []),
                                                   relation_type, artist_type, artists, instruments)
     artist_dict = {'artists': artists, 'instruments': instruments}
     return artist_dict
 
 
-def create_artist_data(release_id, options, log_options, tm, relations,
+def create_artist_data(release_id, options, log_options, tm, type_list,
                        relation_type, artist_type, artists, instruments):
     """
     Update the artists and instruments
@@ -1174,20 +1218,13 @@ def create_artist_data(release_id, options, log_options, tm, relations,
     :param options:
     :param log_options:
     :param tm: track metadata
-    :param relations:
+    :param type_list: the artist relationships of type artist_type
     :param relation_type: release', 'recording' or 'work' (NB 'work' does not pass a param for tm)
     :param artist_type: from const.RELATION_TYPES[relation_type]
     :param artists: current artist list - updated with each call
     :param instruments: current instruments list - updated with each call
     :return: artists, instruments
     """
-    type_list = parse_data(
-        release_id,
-        relations,
-        [],
-        'target-type:artist',
-        'type:' +
-        artist_type)
     for type_item in type_list:
         artist_name_list = parse_data(
             release_id, type_item, [], 'artist', 'name')
@@ -1728,6 +1765,93 @@ def replace_roman_numerals(s):
     return s
 
 
+def boil_text(s):
+    """
+    Remove punctuation, spaces, capitals and accents for string comparisons
+    :param s: string
+    :return: boiled string
+    """
+    s = replace_roman_numerals(s.lower())
+    for old, new in BOIL_REPLACEMENTS:
+        s = s.replace(old, new)
+    s = s.translate(BOIL_TRANSLATION)
+    if RE_NON_ASCII.search(s):
+        s = ''.join(
+            c for c in unicodedata.normalize(
+                'NFD',
+                s) if unicodedata.category(c) != 'Mn')
+    return RE_PUNCTUATION.sub('', s).strip().lower().rstrip("s'")
+
+
+def canonical_opus(s):
+    """
+    Make opus numbers etc. into one-word items (e.g. turn K. 126 into K126 or K 345a into K345a or op. 144 into op144)
+    :param s: string
+    :return: canonized string
+    """
+    regex_match = RE_OPUS.search(s)
+    if regex_match and regex_match.group(1) and regex_match.group(2):
+        return RE_OPUS_NO.sub('', regex_match.group(1)) + regex_match.group(2)
+    elif regex_match:
+        return (regex_match.group(1) or '') + (regex_match.group(2) or '')
+    return s
+
+
+def canonical_key(s):
+    """
+    Make keys into standardized one-word items
+    :param s: string
+    :return: canonized string
+    """
+    match = RE_KEYS.search(s)
+    if not match:
+        return s
+    if match.group(2):
+        k2 = RE_SHARP.sub('sharp', match.group(2))
+        k2 = RE_FLAT.sub('flat', k2)
+        k2 = k2.replace('-', '')
+    else:
+        k2 = ''
+    if not match.group(3) or match.group(
+            3).strip() == '':  # if the scale is not given, assume it is the major key
+        if match.group(1).isupper(
+        ) or k2 != '':  # but only if it is upper case or has an accent
+            k3 = 'major'
+        else:
+            k3 = ''
+    else:
+        k3 = match.group(3).strip()
+    return match.group(1).strip() + k2.strip() + k3
+
+
+NORMALIZERS = {
+    'boil': boil_text,
+    'opus': canonical_opus,
+    'key': canonical_key}
+
+
+@lru_cache(maxsize=const.NORMALIZE_CACHE_SIZE)
+def normalize(form, s):
+    """
+    Normalize a string for comparisons. The same strings (titles, parent work names etc.) are normalized over and over,
+    so the results are cached
+    :param form: 'boil', 'opus' or 'key' - see NORMALIZERS
+    :param s: string
+    :return: normalized string
+    """
+    return NORMALIZERS[form](s)
+
+
+@lru_cache(maxsize=const.NORMALIZE_CACHE_SIZE)
+def compiled_regex(pattern, flags=0):
+    """
+    :param pattern: regex string
+    :param flags: re flags
+    :return: compiled regex (cached - re's own cache is small and is cleared when full)
+    """
+    return re.compile(pattern, flags)
+
+
 def from_roman(s):
     romanNumeralMap = (('M', 1000),
                        ('CM', 900),
@@ -1764,88 +1888,69 @@ def from_roman(s):
     return result
 
 
-def turbo_lcs(release_id, multi_list):
-    """
-    Picks the best longest common string method to use
-    Works with a list of lists or a list of strings
-    :param release_id:
-    :param multi_list: a list of strings or a list of lists
-    :return: longest common substring/list
-    """
-    write_log(release_id, 'debug', 'In turbo_lcs')
-    if not isinstance(multi_list, list):
-        return None
-    list_sum = sum([len(x) for x in multi_list])
-    list_len = len(multi_list)
-    if list_len < 2:
-        if list_len == 1:
-            return multi_list[0]  # Nothing to do!
-        else:
-            return []
-    # for big matches, use the generalised suffix tree method
-    if ((list_sum / list_len) ** 2) * list_len > 1000:
-        # heuristic: may need to tweak the 1000 in the light of results
-        lcs_dict = suffixtree.multi_lcs(multi_list)
-        # NB suffixtree may be shown as an unresolved reference in the IDE,
-        # but it should work provided it is included in the package
-        if "error" not in lcs_dict:
-            if "response" in lcs_dict:
-                write_log(
-                        release_id,
-                        'info',
-                        'Longest common string was returned from suffix tree algo')
-                return lcs_dict['response']
-
-     ## If suffix tree fails, write errors to log before proceeding with alternative
-            else:
-                write_log(
-                        release_id,
-                        'error',
-                        'Suffix tree failure for release %s. Error unknown. Using standard lcs algo instead',
-                        release_id)
-        else:
-            write_log(
-                    release_id,
-                    'error',
-                    'Suffix tree failure for release %s. Error message: %s. Using standard lcs algo instead',
-                    release_id,
-                    lcs_dict['error'])
-    # otherwise, or if gst fails, use the standard algorithm
-    first = True
-    common = []
-    for item in multi_list:
-        if first:
-            common = item
-            first = False
-        else:
-            lcs = longest_common_substring(
-                item, common)
-            common = lcs['string']
-    write_log(release_id, 'debug', 'LCS returned from standard algo')
-    return common
-
-
-def longest_common_substring(s1, s2):
+def longest_common_substring(s1, s2, release_id=None):
     """
-    Standard lcs algo for short strings, or if suffix tree does not work
+    Standard lcs algo for short strings
     :param s1: substring 1
     :param s2: substring 2
+    :param release_id: if given, the result is remembered (in lcs_cache) until the release is finished
     :return: {'string': the longest common substring,
         'start': the start position in s1,
         'length': the length of the common substring}
     NB this also works on list arguments - i.e. it will find the longest common sub-list
+    If there is more than one longest common substring, the one which ends first in s1 is returned
+    """
+    if release_id is None:
+        return lcs_rows(s1, s2)
+    key = (tuple(s1) if isinstance(s1, list) else s1,
+           tuple(s2) if isinstance(s2, list) else s2)
+    cache = lcs_cache[release_id]
+    try:
+        result = cache[key]
+    except KeyError:
+        result = cache[key] = lcs_rows(s1, s2)
+    except TypeError:  # unhashable list items
+        return lcs_rows(s1, s2)
+    # copy, in case the caller changes the list
+    return {'string': result['string'][:],
+            'start': result['start'], 'length': result['length']}
+
+
+def lcs_rows(s1, s2):
+    """
+    Longest common substring by dynamic programming, keeping only the previous row of the matrix
+    Only the cells where items of s1 and s2 are equal are visited (and stored)
+    :param s1: substring 1
+    :param s2: substring 2
+    :return: as longest_common_substring
     """
-    m = [[0] * (1 + len(s2)) for i in range(1 + len(s1))]
     longest, x_longest = 0, 0
-    for x in range(1, 1 + len(s1)):
-        for y in range(1, 1 + len(s2)):
-            if s1[x - 1] == s2[y - 1]:
-                m[x][y] = m[x - 1][y - 1] + 1
-                if m[x][y] > longest:
-                    longest = m[x][y]
+    try:
+        positions = {}
+        for y, item in enumerate(s2, 1):
+            positions.setdefault(item, []).append(y)
+        prev_row = {}
+        no_positions = ()
+        for x, item in enumerate(s1, 1):
+            row = {}
+            for y in positions.get(item, no_positions):
+                length = row[y] = prev_row.get(y - 1, 0) + 1
+                if length > longest:
+                    longest = length
                     x_longest = x
-            else:
-                m[x][y] = 0
+            prev_row = row
+    except TypeError:  # unhashable list items - visit every cell
+        longest, x_longest = 0, 0
+        prev_row = [0] * (1 + len(s2))
+        for x in range(1, 1 + len(s1)):
+            row = [0] * (1 + len(s2))
+            for y in range(1, 1 + len(s2)):
+                if s1[x - 1] == s2[y - 1]:
+                    length = row[y] = prev_row[y - 1] + 1
+                    if length > longest:
+                        longest = length
+                        x_longest = x
+            prev_row = row
     return {'string': s1[x_longest - longest: x_longest],
             'start': x_longest - longest, 'length': longest}
 
@@ -1898,6 +2003,7 @@ def get_ui_tags():
     return ui_tags
 
 
+@timing.timed('map_tags')
 def map_tags(options, release_id, album, tm):
     """
     Do the common tag processing - including for the genres and tag-mapping sections
@@ -1972,7 +2078,8 @@ def map_tags(options, release_id, album, tm):
     arranger_died_list = []
     no_composer_in_metadata = False
     if options['cwp_use_muso_refdb'] and options['cwp_muso_classical'] or options['cwp_muso_dates']:
-        if COMPOSER_DICT:
+        composer_index = muso_references(options)['composers']
+        if composer_index:
             composersort_list = []
             if '~cwp_composer_names' in tm:
                 composer_list = str_to_list(tm['~cwp_composer_names'])
@@ -1986,23 +2093,22 @@ def map_tags(options, release_id, album, tm):
                           composer_list)
             lc_composer_list = [c.lower() for c in composer_list]
             for ind, composer in enumerate(lc_composer_list):
-                for classical_composer in COMPOSER_DICT:
-                    if composer in classical_composer['lc_name']:
-                        if options['cwp_muso_classical']:
-                            candidate_genres.append('Classical')
-                            is_classical = True
-                        if options['cwp_muso_dates']:
-                            composer_born_list = classical_composer['birth']
-                            composer_died_list = classical_composer['death']
-                        composer_found = True
-                        if no_composer_in_metadata:
-                            composersort = composersort_list[ind]
-                            append_tag(release_id, tm, 'composer', composer_list[ind])
-                            append_tag(release_id, tm, '~cwp_composer_names', composer_list[ind])
-                            append_tag(release_id, tm, 'composersort', composersort)
-                            append_tag(release_id, tm, '~cwp_composers_sort', composersort)
-                            append_tag(release_id, tm, '~cwp_composer_lastnames', composersort.split(', ')[0])
-                        break
+                classical_composer = composer_index.get(composer)
+                if classical_composer:
+                    if options['cwp_muso_classical']:
+                        candidate_genres.append('Classical')
+                        is_classical = True
+                    if options['cwp_muso_dates']:
+                        composer_born_list = classical_composer['birth']
+                        composer_died_list = classical_composer['death']
+                    composer_found = True
+                    if no_composer_in_metadata:
+                        composersort = composersort_list[ind]
+                        append_tag(release_id, tm, 'composer', composer_list[ind])
+                        append_tag(release_id, tm, '~cwp_composer_names', composer_list[ind])
+                        append_tag(release_id, tm, 'composersort', composersort)
+                        append_tag(release_id, tm, '~cwp_composers_sort', composersort)
+                        append_tag(release_id, tm, '~cwp_composer_lastnames', composersort.split(', ')[0])
                 if not composer_found:
                     composer_index = lc_composer_list.index(composer)
                     orig_composer = composer_list[composer_index]
@@ -2027,16 +2133,15 @@ def map_tags(options, release_id, album, tm):
                     tm['~cea_arranger_names']) + str_to_list(tm['~cwp_arranger_names'])
                 lc_arranger_list = [c.lower() for c in arranger_list]
                 for arranger in lc_arranger_list:
-                    for classical_arranger in COMPOSER_DICT:
-                        if arranger in classical_arranger['lc_name']:
-                            if options['cwp_muso_classical'] and options['cwp_genres_arranger_as_composer']:
-                                candidate_genres.append('Classical')
-                                is_classical = True
-                            if options['cwp_muso_dates'] and options['cwp_periods_arranger_as_composer']:
-                                arranger_born_list = classical_arranger['birth']
-                                arranger_died_list = classical_arranger['death']
-                            arranger_found = True
-                            break
+                    classical_arranger = composer_index.get(arranger)
+                    if classical_arranger:
+                        if options['cwp_muso_classical'] and options['cwp_genres_arranger_as_composer']:
+                            candidate_genres.append('Classical')
+                            is_classical = True
+                        if options['cwp_muso_dates'] and options['cwp_periods_arranger_as_composer']:
+                            arranger_born_list = classical_arranger['birth']
+                            arranger_died_list = classical_arranger['death']
+                        arranger_found = True
                     if not arranger_found:
                         arranger_index = lc_arranger_list.index(arranger)
                         orig_arranger = arranger_list[arranger_index]
@@ -2062,18 +2167,13 @@ def map_tags(options, release_id, album, tm):
                 '001_errors:8',
                 '8. No composer reference file. Check log for error messages re path name.')
 
-    if options['cwp_use_muso_refdb'] and options['cwp_muso_genres'] and GENRE_DICT:
-        main_classical_genres_list = [list_to_str(
-            mg['name']).strip() for mg in GENRE_DICT]
+    if options['cwp_use_muso_refdb'] and options['cwp_muso_genres'] and muso_references(options)['genres']:
+        main_classical_genres_list = muso_references(options)['genres']
     else:
-        main_classical_genres_list = [
-            sg.strip() for sg in options['cwp_genres_classical_main'].split(',')]
-    sub_classical_genres_list = [
-        sg.strip() for sg in options['cwp_genres_classical_sub'].split(',')]
-    main_other_genres_list = [
-        sg.strip() for sg in options['cwp_genres_other_main'].split(',')]
-    sub_other_genres_list = [sg.strip()
-                             for sg in options['cwp_genres_other_sub'].split(',')]
+        main_classical_genres_list = references.text_genres(options['cwp_genres_classical_main'])
+    sub_classical_genres_list = references.text_genres(options['cwp_genres_classical_sub'])
+    main_other_genres_list = references.text_genres(options['cwp_genres_other_main'])
+    sub_other_genres_list = references.text_genres(options['cwp_genres_other_sub'])
     main_classical_genres = []
     sub_classical_genres = []
     main_other_genres = []
@@ -2085,12 +2185,11 @@ def map_tags(options, release_id, album, tm):
     write_log(release_id, 'info', "Candidate genres: %r", candidate_genres)
     untagged_genres = []
     if candidate_genres:
+        lc_candidate_genres = {genre.lower() for genre in candidate_genres}
         main_classical_genres = [
-            val for val in main_classical_genres_list if val.lower() in [
-                genre.lower() for genre in candidate_genres]]
+            val for val in main_classical_genres_list if val.lower() in lc_candidate_genres]
         sub_classical_genres = [
-            val for val in sub_classical_genres_list if val.lower() in [
-                genre.lower() for genre in candidate_genres]]
+            val for val in sub_classical_genres_list if val.lower() in lc_candidate_genres]
 
         if main_classical_genres or sub_classical_genres or options['cwp_genres_classical_all']:
             is_classical = True
@@ -2100,27 +2199,24 @@ def map_tags(options, release_id, album, tm):
             candidate_genres += str_to_list(tm['~cea_work_type_if_classical'])
             # next two are repeated statements, but a separate fn would be
             # clumsy too!
+            lc_candidate_genres = {genre.lower() for genre in candidate_genres}
             main_classical_genres = [
-                val for val in main_classical_genres_list if val.lower() in [
-                    genre.lower() for genre in candidate_genres]]
+                val for val in main_classical_genres_list if val.lower() in lc_candidate_genres]
             sub_classical_genres = [
-                val for val in sub_classical_genres_list if val.lower() in [
-                    genre.lower() for genre in candidate_genres]]
+                val for val in sub_classical_genres_list if val.lower() in lc_candidate_genres]
         if options['cwp_genres_classical_exclude']:
             main_classical_genres = [
                 g for g in main_classical_genres if g.lower() != 'classical']
 
         main_other_genres = [
-            val for val in main_other_genres_list if val.lower() in [
-                genre.lower() for genre in candidate_genres]]
+            val for val in main_other_genres_list if val.lower() in lc_candidate_genres]
         sub_other_genres = [
-            val for val in sub_other_genres_list if val.lower() in [
-                genre.lower() for genre in candidate_genres]]
+            val for val in sub_other_genres_list if val.lower() in lc_candidate_genres]
         all_genres = main_classical_genres + sub_classical_genres + \
             main_other_genres + sub_other_genres
+        lc_all_genres = {genre.lower() for genre in all_genres}
         untagged_genres = [
-            un for un in candidate_genres if un.lower() not in [
-                genre.lower() for genre in all_genres]]
+            un for un in candidate_genres if un.lower() not in lc_all_genres]
 
     if options['cwp_genre_tag']:
         if not options['cwp_genres_filter']:
@@ -2241,53 +2337,13 @@ def map_tags(options, release_id, album, tm):
                 prem)
 
     # periods
-    PERIODS = {}
+    periods = None
     if options['cwp_period_map']:
-        if options['cwp_use_muso_refdb'] and options['cwp_muso_periods'] and PERIOD_DICT:
-            for p_item in PERIOD_DICT:
-                if 'start' not in p_item or p_item['start'] == []:
-                    p_item['start'] = [u'-9999']
-                if 'end' not in p_item or p_item['end'] == []:
-                    p_item['end'] = [u'2525']
-                if 'name' not in p_item or p_item['name'] == []:
-                    p_item['name'] = ['NOT SPECIFIED']
-            PERIODS = {list_to_str(mp['name']).strip(): (
-                list_to_str(mp['start']),
-                list_to_str(mp['end']))
-                for mp in PERIOD_DICT}
-            for period in PERIODS:
-                if PERIODS[period][0].lstrip(
-                        '-').isdigit() and PERIODS[period][1].lstrip('-').isdigit():
-                    PERIODS[period] = (int(PERIODS[period][0]),
-                                       int(PERIODS[period][1]))
-                else:
-                    PERIODS[period] = (
-                        9999,
-                        'ERROR - start and/or end of ' +
-                        period +
-                        ' are not integers')
-
+        if options['cwp_use_muso_refdb'] and options['cwp_muso_periods'] and muso_references(options)['periods']:
+            periods = muso_references(options)['periods']
         else:
-            periods = [p.strip() for p in options['cwp_period_map'].split(';')]
-            for p in periods:
-                p = p.split(',')
-                if len(p) == 3:
-                    period = p[0].strip()
-                    start = p[1].strip()
-                    end = p[2].strip()
-                    if start.lstrip(
-                            '-').isdigit() and end.lstrip('-').isdigit():
-                        PERIODS[period] = (int(start), int(end))
-                    else:
-                        PERIODS[period] = (
-                            9999,
-                            'ERROR - start and/or end of ' +
-                            period +
-                            ' are not integers')
-                else:
-                    PERIODS[p[0]] = (
-                        9999, 'ERROR in period map - each item must contain 3 elements')
-    if options['cwp_period_tag'] and PERIODS:
+            periods = references.text_periods(options['cwp_period_map'])
+    if options['cwp_period_tag'] and periods:
         if earliest_date == 9999:  # i.e. no work date found
             if options['cwp_use_muso_refdb'] and options['cwp_muso_dates']:
                 for composer_born in composer_born_list + arranger_born_list:
@@ -2301,35 +2357,30 @@ def map_tags(options, release_id, album, tm):
                                 latest_date = max(latest_date, deathdate)
                             else:
                                 latest_date = datetime.now().year
-        # sort into start date order before writing tags
-        sorted_periods = collections.OrderedDict(
-            sorted(PERIODS.items(), key=lambda t: t[1]))
-        for period in sorted_periods:
-            if isinstance(
-                    sorted_periods[period][1],
-                    str) and 'ERROR' in sorted_periods[period][1]:
-                tm[options['cwp_period_tag']] = ''
+        # periods are in start date order
+        earliest_periods = periods.including(earliest_date) if earliest_date < 9999 else set()
+        latest_periods = periods.including(latest_date) if latest_date > -9999 else set()
+        for ind in sorted(earliest_periods | latest_periods):
+            if ind in earliest_periods:
                 append_tag(
                     release_id,
                     tm,
-                    '001_errors:9',
-                    '9. ' +
-                    sorted_periods[period])
-                break
-            if earliest_date < 9999:
-                if sorted_periods[period][0] <= earliest_date <= sorted_periods[period][1]:
-                    append_tag(
-                        release_id,
-                        tm,
-                        options['cwp_period_tag'],
-                        period)
-            if latest_date > -9999:
-                if sorted_periods[period][0] <= latest_date <= sorted_periods[period][1]:
-                    append_tag(
-                        release_id,
-                        tm,
-                        options['cwp_period_tag'],
-                        period)
+                    options['cwp_period_tag'],
+                    periods.names[ind])
+            if ind in latest_periods:
+                append_tag(
+                    release_id,
+                    tm,
+                    options['cwp_period_tag'],
+                    periods.names[ind])
+        if periods.error:
+            tm[options['cwp_period_tag']] = ''
+            append_tag(
+                release_id,
+                tm,
+                '001_errors:9',
+                '9. ' +
+                periods.error)
 
     # generic tag mapping
     sort_tags = options['cea_tag_sort']
@@ -3003,8 +3054,8 @@ class ExtraArtists():
         # collection of instruments which have release relationships, not track
         # relationships
 
-        self.artist_aliases = {}
-        # collection of alias names - format is {sort_name: alias_name, ...}
+        self.artist_aliases = collections.OrderedDict()
+        # collection of alias names - format is {sort_name: alias_name, ...} - oldest first (see purge_release)
 
         self.artist_credits = collections.defaultdict(dict)
         # collection of credited-as names - format is {album: {sort_name: credit_name,
@@ -3023,6 +3074,36 @@ class ExtraArtists():
         self.album_series_list = collections.defaultdict(dict)
         # series relationships - format is {'name_list': series names, 'id_list': series ids, 'number_list': number within series}
 
+    def purge_release(self, release_id, album, tracks):
+        """
+        Discard the data kept for an album which has been removed (see lifecycle.ReleaseLifecycle)
+        :param release_id:
+        :param album:
+        :param tracks: the album's tracks
+        :return:
+        """
+        tracks = set(tracks).union(self.track_listing.get(album, ()))
+        for album_dict in (
+                self.album_artists,
+                self.track_listing,
+                self.album_performers,
+                self.album_instruments,
+                self.artist_credits,
+                self.release_artists_sort):
+            album_dict.pop(album, None)
+        for track in tracks:
+            for track_dict in (self.options, self.globals, self.lyricist_filled):
+                track_dict.pop(track, None)
+        lifecycle.remove_oldest(
+            self.artist_aliases, len(self.artist_aliases) - const.ALIASES_MEMORY_MAX_ENTRIES)
+
+    def cache_sizes(self):
+        return {
+            'artist albums': len(self.track_listing),
+            'artist tracks': len(self.options),
+            'artist aliases': len(self.artist_aliases)}
+
+    @timing.timed('artists: track', lambda self, album, track_metadata, *args: track_metadata['musicbrainz_albumid'])
     def add_artist_info(
             self,
             album,
@@ -3044,6 +3125,9 @@ class ExtraArtists():
             release_status[release_id]['lookups'] = 0
         release_status[release_id]['name'] = track_metadata['album']
         release_status[release_id]['artists'] = True
+        RELEASES.register(release_id, album)
+        if config.setting['ce_profile_release'] == release_id:
+            timing.start_profile(release_id)
         if config.setting['log_debug'] or config.setting['log_info']:
             write_log(
                 release_id,
@@ -3065,7 +3149,7 @@ class ExtraArtists():
             if config.setting['log_debug'] or config.setting['log_info']:
                 write_log(release_id, 'debug', 'Artists gets track first...')
             get_options(release_id, album, track)
-        options = interpret(tm['~ce_options'])
+        options = get_track_options(release_id, track)
         if not options:
             if config.setting["log_error"]:
                 write_log(
@@ -3074,7 +3158,7 @@ class ExtraArtists():
                     'Artists. Failure to read saved options for track %s. options = %s',
                     track,
                     tm['~ce_options'])
-            options = option_settings(config.setting)
+            options = collections.ChainMap({}, base_options(release_id))
         self.options[track] = options
 
         # CONSTANTS
@@ -3131,13 +3215,12 @@ class ExtraArtists():
 
                 # xml_type = 'release'
                 # get performers etc who are related at the release level
-                relation_list = parse_data(
-                    release_id, releaseXmlNode, [], 'relations')
-                album_performerList = get_artists(
-                    options, release_id, tm, relation_list, 'release')['artists']
+                relation_list = release_index(release_id, releaseXmlNode)['relations']
+                album_artists = get_artists(
+                    options, release_id, tm, relation_list, 'release')
+                album_performerList = album_artists['artists']
                 self.album_performers[album] = album_performerList
-                album_instrumentList = get_artists(
-                    options, release_id, tm, relation_list, 'release')['instruments']
+                album_instrumentList = album_artists['instruments']
                 self.album_instruments[album] = album_instrumentList
 
                 # get series information
@@ -3423,6 +3506,7 @@ class ExtraArtists():
                 return 'Group'
         return False
 
+    @timing.timed('artists: process_album')
     def process_album(self, release_id, album):
         """
         Perform final processing after all tracks read
@@ -3463,9 +3547,8 @@ class ExtraArtists():
                     first_track = lyric_tuple[0]
                 ref_track[lyric_tuple[0]] = first_track
                 prev = lyric_tuple[1]
-            common = turbo_lcs(
-                release_id,
-                unique_lyrics)
+            # lyrics can be very long (e.g. a libretto in every track), so use the near-linear method
+            common = lyrics.common_words(unique_lyrics)
 
         if common:
             unique = []
@@ -3716,6 +3799,7 @@ class ExtraArtists():
                 tag)
         append_tag(release_id, tm, tag, source, self.SEPARATORS)
 
+    @timing.timed('artists: set_performer')
     def set_performer(self, release_id, album, track, performerList, tm):
         """
         Sets the performer-related tags
@@ -4066,9 +4150,10 @@ class PartLevels():
         # INITIALISATION
 
     def __init__(self):
-        self.works_cache = {}
+        self.works_cache = workdag.WorkDag()
         # maintains list of parent of each workid, or None if no parent found,
         # so that XML lookup need only executed if no existing record
+        # (also keeps the inverse links and the ancestors of each work, shared by all albums)
 
         self.partof = collections.defaultdict(dict)
         # the inverse of the above (immediate children of each parent)
@@ -4080,6 +4165,16 @@ class PartLevels():
         # lookup queue - holds track/album pairs for each queued workid (may be
         # more than one pair per id, especially for higher-level parts)
 
+        self.prefetching = {}
+        # workids being looked up in advance (see prefetch_works) - {workid: album}
+
+        self.prefetched = {}
+        # responses to advance lookups which have not yet been asked for by a track -
+        # {workid: (album, response)}
+
+        self.work_use = collections.OrderedDict()
+        # workids in the order in which albums last used them (least recent first) - see trim_works
+
         self.parts = collections.defaultdict(
             lambda: collections.defaultdict(dict))
         # metadata collection for all parts - structure is {workid: {name: ,
@@ -4110,6 +4205,9 @@ class PartLevels():
         self.synonyms = collections.defaultdict(dict)
         # active synonym options for current track
 
+        self.synonym_tables = collections.defaultdict(dict)
+        # compiled synonyms for current track (the same SynonymTable for tracks with the same synonym options)
+
         self.replacements = collections.defaultdict(dict)
         # active synonym options for current track
 
@@ -4121,8 +4219,8 @@ class PartLevels():
             lambda: collections.defaultdict(dict))
         # collection of artists to be applied at album level
 
-        self.artist_aliases = {}
-        # collection of alias names - format is {sort_name: alias_name, ...}
+        self.artist_aliases = collections.OrderedDict()
+        # collection of alias names - format is {sort_name: alias_name, ...} - oldest first (see purge_release)
 
         self.artist_credits = collections.defaultdict(dict)
         # collection of credited-as names - format is {album: {sort_name: credit_name,
@@ -4146,10 +4244,77 @@ class PartLevels():
         # {track1: {movement-group: movementgroup, movement-number: movementnumber},
         #  track2: {}, ..., etc}, album2: etc}
 
+    def purge_release(self, release_id, album, tracks):
+        """
+        Discard the data kept for an album which has been removed (see lifecycle.ReleaseLifecycle)
+        The album's works stay in memory for other albums, subject to trim_works
+        :param release_id:
+        :param album:
+        :param tracks: the album's tracks
+        :return:
+        """
+        tracks = set(tracks).union(self.tracks.get(album, ()), self.orphan_tracks.get(album, ()))
+        # works which were never used by a finished album are the first to go
+        for workId in self.work_listing.get(album, ()):
+            if workId not in self.work_use:
+                self.work_use[workId] = None
+                self.work_use.move_to_end(workId, last=False)
+        for album_dict in (
+                self.partof,
+                self.trackback,
+                self.work_listing,
+                self.top,
+                self.album_artists,
+                self.artist_credits,
+                self.release_artists_sort,
+                self.orphan_tracks,
+                self.tracks):
+            album_dict.pop(album, None)
+        for track in tracks:
+            for track_dict in (
+                    self.options,
+                    self.synonyms,
+                    self.synonym_tables,
+                    self.replacements,
+                    self.lyricist_filled):
+                track_dict.pop(track, None)
+            self.file_works.pop((album, track), None)
+            self.top_works.pop((track, album), None)
+        self.drop_prefetches(album)
+        self.trim_works()
+        lifecycle.remove_oldest(
+            self.artist_aliases, len(self.artist_aliases) - const.ALIASES_MEMORY_MAX_ENTRIES)
+
+    def trim_works(self):
+        """
+        Keep the number of works in memory within const.WORKS_MEMORY_MAX_ENTRIES by discarding those least recently
+        used by an album (but not any listed for an album which is still loaded)
+        :return:
+        """
+        excess = len(self.parts) - const.WORKS_MEMORY_MAX_ENTRIES
+        if excess <= 0:
+            return
+        in_use = set()
+        for works in self.work_listing.values():
+            in_use.update(works)
+        for workId in lifecycle.remove_oldest(self.work_use, excess, in_use):
+            self.works_cache.discard(workId)
+            self.parts.pop(workId, None)
+            self.child_listing.pop(workId, None)
+
+    def cache_sizes(self):
+        return {
+            'works cache': len(self.works_cache),
+            'work parts': len(self.parts),
+            'work albums': len(self.work_listing),
+            'work tracks': len(self.options),
+            'work aliases': len(self.artist_aliases)}
+
     ########################################
     # SECTION 1 - Initial track processing #
     ########################################
 
+    @timing.timed('works: track', lambda self, album, track_metadata, *args: track_metadata['musicbrainz_albumid'])
     def add_work_info(
             self,
             album,
@@ -4171,6 +4336,9 @@ class PartLevels():
             release_status[release_id]['lookups'] = 0
         release_status[release_id]['name'] = track_metadata['album']
         release_status[release_id]['works'] = True
+        RELEASES.register(release_id, album)
+        if config.setting['ce_profile_release'] == release_id:
+            timing.start_profile(release_id)
         if config.setting['log_debug'] or config.setting['log_info']:
             write_log(
                 release_id,
@@ -4198,7 +4366,7 @@ class PartLevels():
             if config.setting['log_debug'] or config.setting['log_info']:
                 write_log(release_id, 'debug', 'Workparts gets track first...')
             get_options(release_id, album, track)
-        options = interpret(tm['~ce_options'])
+        options = get_track_options(release_id, track)
 
         if not options:
             if config.setting['log_error']:
@@ -4208,11 +4376,11 @@ class PartLevels():
                     'Work Parts. Failure to read saved options for track %s. options = %s',
                     track,
                     tm['~ce_options'])
-            options = option_settings(config.setting)
+            options = collections.ChainMap({}, base_options(release_id))
         self.options[track] = options
 
         # CONSTANTS
-        write_log(release_id, 'basic', 'Options: %s' ,options)
+        write_log(release_id, 'basic', 'Options: %s', dict(options))
         self.ERROR = options["log_error"]
         self.WARNING = options["log_warning"]
         self.SEPARATORS = ['; ']
@@ -4220,7 +4388,8 @@ class PartLevels():
 
         self.get_sk_tags(release_id, album, track, tm, options)
         self.synonyms[track] = self.get_text_tuples(
-            release_id, track, 'synonyms')  # a list of tuples
+            release_id, track, 'synonyms')  # a tuple of tuples
+        self.synonym_tables[track] = synonyms.synonym_table(self.synonyms[track])
         self.replacements[track] = self.get_text_tuples(
             release_id, track, 'replacements')  # a list of tuples
 
@@ -4232,6 +4401,7 @@ class PartLevels():
         # Maximum number of XML- lookup retries if error returned from server
         self.MAX_RETRIES = options["cwp_retries"]
         self.USE_CACHE = options["use_cache"]
+        self.PERSISTENT_CACHE = options["cwp_persistent_cache"]
         if options["cwp_partial"] and options["cwp_partial_text"] and options["cwp_level0_works"]:
             options["cwp_removewords_p"] = options["cwp_removewords"] + \
                 ", " + options["cwp_partial_text"] + ' '
@@ -4256,6 +4426,9 @@ class PartLevels():
             # get artist aliases - these are cached so can be re-used across
             # releases, but are reloaded with each refresh
             get_aliases(self, release_id, album, options, releaseXmlNode)
+            # works from file tags, or tracks without files, may not need lookups
+            if not (options['cwp_use_sk'] or options['ce_no_run']):
+                self.prefetch_works(release_id, album, releaseXmlNode)
 
         # fix titles which include composer name
         composersort =[]
@@ -4757,46 +4930,43 @@ class PartLevels():
                 "Added lookup request for id %s. Requests = %s",
                 workId,
                 album._requests)
+        if release_id in release_status:
+            release_status[release_id].setdefault('work-ids', set()).add(workId)
         if self.works_queue.append(
                 workId,
                 (track,
                  album)):  # All work combos are queued, but only new workIds are passed to XML lookup
-            host = config.setting["server_host"]
-            port = config.setting["server_port"]
-            path = "/ws/2/%s/%s" % ('work', workId)
-            if config.setting['cwp_aliases'] and config.setting['cwp_aliases_tag_text']:
-                if config.setting['cwp_aliases_tags_user'] and user_data:
-                    login = True
-                    tag_type = '+tags +user-tags'
-                else:
-                    login = False
-                    tag_type = '+tags'
-            else:
-                login = False
-                tag_type = ''
-            queryargs = {
-                "inc": "work-rels+artist-rels+label-rels+place-rels+aliases" +
-                tag_type}
+            if workId in self.prefetched:
+                write_log(
+                        release_id,
+                        'debug',
+                        "Using prefetched work record for %s",
+                        workId)
+                # Process it as if it had come back from the server, i.e. after this
+                # track has been dealt with, so that the album is not finalised mid-way
+                QTimer.singleShot(
+                    0, partial(self.work_process, workId, tries, self.prefetched.pop(workId)[1], None, None))
+                return
+            login, queryargs = self.work_queryargs(user_data)
+            if self.PERSISTENT_CACHE and self.USE_CACHE:
+                response = WORKS_STORE.get(workId, queryargs['inc'])
+                if response is not None:
+                    write_log(
+                            release_id,
+                            'debug',
+                            "Using stored work record for %s",
+                            workId)
+                    if release_id in release_status:
+                        release_status[release_id]['stored'] = release_status[release_id].get('stored', 0) + 1
+                    QTimer.singleShot(
+                        0, partial(self.work_process, workId, tries, response, None, None))
+                    return
             write_log(
                     release_id,
                     'debug',
                     "Initiating XML lookup for %s......",
                     workId)
-            if release_id in release_status and 'lookups' in release_status[release_id]:
-                release_status[release_id]['lookups'] += 1
-            return album.tagger.webservice.get(
-                host,
-                port,
-                path,
-                partial(
-                    self.work_process,
-                    workId,
-                    tries),
-                # parse_response_type="xml",
-                priority=True,
-                important=False,
-                mblogin=login,
-                queryargs=queryargs)
+            return self.work_lookup(release_id, album, workId, tries, login, queryargs)
         else:
             write_log(
                     release_id,
@@ -4804,12 +4974,128 @@ class PartLevels():
                     "Work is already in queue: %s",
                     workId)
 
+    def work_lookup(self, release_id, album, workId, tries, login, queryargs):
+        """
+        Send the webservice request for a work - the response is passed to work_process
+        :param release_id:
+        :param album:
+        :param workId:
+        :param tries: number of lookup attempts
+        :param login: authentication required
+        :param queryargs:
+        :return:
+        """
+        host = config.setting["server_host"]
+        port = config.setting["server_port"]
+        path = "/ws/2/%s/%s" % ('work', workId)
+        # the include list is the version stamp for stored works
+        version = queryargs['inc'] if self.PERSISTENT_CACHE else None
+        if release_id in release_status and 'lookups' in release_status[release_id]:
+            release_status[release_id]['lookups'] += 1
+        return album.tagger.webservice.get(
+            host,
+            port,
+            path,
+            partial(
+                self.work_process,
+                workId,
+                tries,
+                version=version),
+            # parse_response_type="xml",
+            priority=True,
+            important=False,
+            mblogin=login,
+            queryargs=queryargs)
+
+    def prefetch_works(self, release_id, album, releaseXmlNode):
+        """
+        Look up all the works of the release, and the parents of those works which are shown in the release
+        relationships, in one go - rather than waiting for each lookup response before looking up the next level.
+        The lookups are not attached to any track: if a track asks for the work while the lookup is in progress,
+        it joins the queue in the usual way, otherwise the response is held in self.prefetched until it is asked for.
+        :param release_id:
+        :param album:
+        :param releaseXmlNode:
+        :return:
+        """
+        work_rels = parse_data(
+            release_id,
+            release_index(release_id, releaseXmlNode)['recordings'],
+            [],
+            'relations',
+            'target-type:work',
+            'work')
+        workIds = parse_data(release_id, work_rels, [], 'id')
+        workIds += parse_data(
+            release_id,
+            work_rels,
+            [],
+            'relations',
+            'target-type:work',
+            'type:parts',
+            'direction:backward',
+            'work',
+            'id')
+        login, queryargs = self.work_queryargs()
+        for workId in uniqify(workIds):
+            if workId in self.works_queue or workId in self.prefetched or (
+                    self.USE_CACHE and (workId,) in self.works_cache):
+                continue
+            if self.PERSISTENT_CACHE and self.USE_CACHE and WORKS_STORE.get(
+                    workId, queryargs['inc']) is not None:
+                continue
+            write_log(
+                    release_id,
+                    'debug',
+                    "Prefetching work %s",
+                    workId)
+            self.works_queue[workId] = []
+            self.prefetching[workId] = album
+            release_status[release_id]['prefetched'] = release_status[release_id].get('prefetched', 0) + 1
+            self.work_lookup(release_id, album, workId, 0, login, queryargs)
+
+    def drop_prefetches(self, album):
+        """
+        Discard the advance lookups for an album which no track has asked for - including any still in progress,
+        whose responses are then ignored when they arrive (unless a track has joined the queue for the work)
+        :param album:
+        :return:
+        """
+        for workId in [w for w, prefetch in self.prefetched.items() if prefetch[0] == album]:
+            del self.prefetched[workId]
+        for workId in [w for w, prefetch_album in self.prefetching.items() if prefetch_album == album]:
+            del self.prefetching[workId]
+            if not self.works_queue[workId]:
+                self.works_queue.remove(workId)
+
+    @staticmethod
+    def work_queryargs(user_data=True):
+        """
+        Query arguments for a work lookup
+        :param user_data: include user-specific data (requires authentication)
+        :return: (login required, queryargs)
+        """
+        if config.setting['cwp_aliases'] and config.setting['cwp_aliases_tag_text']:
+            if config.setting['cwp_aliases_tags_user'] and user_data:
+                login = True
+                tag_type = '+tags +user-tags'
+            else:
+                login = False
+                tag_type = '+tags'
+        else:
+            login = False
+            tag_type = ''
+        queryargs = {
+            "inc": "work-rels+artist-rels+label-rels+place-rels+aliases" +
+            tag_type}
+        return login, queryargs
+
     ##########################################################################
     # SECTION 2 - Works processing                                                                     #
     # NB These functions may operate asynchronously over multiple albums (as well as multiple tracks)  #
     ##########################################################################
 
-    def work_process(self, workId, tries, response, reply, error):
+    def work_process(self, workId, tries, response, reply, error, version=None):
         """
         Top routine to process the XML/JSON node response from the lookup
         NB This function may operate over multiple albums (as well as multiple tracks)
@@ -4818,10 +5104,12 @@ class PartLevels():
         :param response:
         :param reply:
         :param error:
+        :param version: if set, the response is saved in the persistent works cache with this version stamp
         :return:
         """
 
         if error:
+            self.prefetching.pop(workId, None)
             tuples = self.works_queue.remove(workId)
             for track, album in tuples:
                 release_id = track.metadata['musicbrainz_albumid']
@@ -4865,7 +5153,13 @@ class PartLevels():
                 self.album_remove_request(release_id, album)
             return
 
+        if version and response:
+            WORKS_STORE.put(workId, version, response)
         tuples = self.works_queue.remove(workId)
+        prefetch_album = self.prefetching.pop(workId, None)
+        if prefetch_album is not None and not tuples and RELEASES.is_live(prefetch_album):
+            # no track has asked for this work yet (and the album has not been removed)
+            self.prefetched[workId] = (prefetch_album, response)
         if tuples:
             new_queue = []
             prev_album = None
@@ -5143,6 +5437,7 @@ class PartLevels():
                 release_status[release_id]['works-done'] = datetime.now()
                 close_log(release_id, 'works')
 
+    @timing.timed('works: lookup metadata')
     def work_process_metadata(self, release_id, workId, wid, track, response):
         """
         Process XML node
@@ -5273,6 +5568,7 @@ class PartLevels():
         return self.work_process_relations(
             release_id, track, workId, wid, relation_list)
 
+    @timing.timed('works: lookup relations')
     def work_process_relations(
             self,
             release_id,
@@ -5453,6 +5749,7 @@ class PartLevels():
     # SECTION 3 - Organise tracks and works in album #
     ##################################################
 
+    @timing.timed('works: process_album')
     def process_album(self, release_id, album):
         """
         Top routine to run end-of-album processes
@@ -5463,13 +5760,24 @@ class PartLevels():
         """
         write_log(release_id, 'debug', "PROCESS ALBUM %s", album)
         release_status[release_id]['done-lookups'] = datetime.now()
+        # the works for this album and all their parents - nothing else needs to be revisited
+        album_works = collections.OrderedDict.fromkeys(self.work_listing[album])
+        for workId in self.work_listing[album]:
+            album_works.update(collections.OrderedDict.fromkeys(self.works_cache.lineage(workId)))
+        for workId in album_works:
+            self.work_use[workId] = None
+            self.work_use.move_to_end(workId)
         # De-duplicate names in self.parts, maintaining order (in case part names have been arrived at via multiple paths)
-        for part_item in self.parts:
-            if 'name' in self.parts[part_item]:
+        for part_item in album_works:
+            if part_item in self.parts and 'name' in self.parts[part_item]:
                 self.parts[part_item]['name'] = list(collections.OrderedDict.fromkeys(str_to_list(self.parts[part_item]['name'])))
         # populate the inverse hierarchy
-        write_log(release_id, 'info', "Cache: %s", self.works_cache)
-        write_log(release_id, 'info', "Work listing %s", self.work_listing)
+        write_log(
+            release_id,
+            'info',
+            "Cache: %s",
+            {workId: self.works_cache[workId] for workId in album_works if workId in self.works_cache})
+        write_log(release_id, 'info', "Work listing %s", self.work_listing[album])
         alias_tag_list = config.setting['cwp_aliases_tag_text'].split(',')
         for i, tag_item in enumerate(alias_tag_list):
             alias_tag_list[i] = tag_item.strip()
@@ -5480,11 +5788,6 @@ class PartLevels():
                     'info',
                     'Processing workid: %s',
                     workId)
-                write_log(
-                    release_id,
-                    'info',
-                    'self.work_listing[album]: %s',
-                    self.work_listing[album])
                 if len(workId) > 1:
                     # fix the order of names using ordering keys gathered in
                     # work_process
@@ -5512,13 +5815,8 @@ class PartLevels():
                         if 'alias' in self.parts[workId] and self.parts[workId]['alias']:
                             self.parts[workId]['name'] = self.parts[workId]['alias'][:]
                 topId = None
-                write_log(
-                        release_id,
-                        'info',
-                        'Works_cache: %s',
-                        self.works_cache)
-                if workId in self.works_cache:
-                    parentIds = tuple(self.works_cache[workId])
+                parentIds = self.works_cache.parents(workId)
+                if parentIds is not None:
                     # for parentId in parentIds:
                     write_log(
                             release_id,
@@ -5685,6 +5983,8 @@ class PartLevels():
                     tm['~cwp_part'] = tm['~cwp_extended_part'] = tm['~cwp_title_part_0'] = movt
                     tm['~cwp_inter_work'] = tm['~cwp_extended_inter_work'] = tm['~cwp_inter_title_work'] = inter_work
                 self.publish_metadata(release_id, album, track)
+        # discard any advance lookups for this album which no track asked for
+        self.drop_prefetches(album)
         write_log(release_id, 'debug', "PROCESS ALBUM function complete")
 
     def create_trackback(self, release_id, album, parentId):
@@ -5723,7 +6023,8 @@ class PartLevels():
         write_log(release_id, 'debug', "In append_trackback...")
         if parentId in self.trackback[album]:  # NB parentId is a tuple
             if 'children' in self.trackback[album][parentId]:
-                if child not in self.trackback[album][parentId]['children']:
+                # children are the trackback dicts themselves, so compare identities rather than (deep) contents
+                if not any(x is child for x in self.trackback[album][parentId]['children']):
                     write_log(release_id, 'info', "TRYING TO APPEND...")
                     self.trackback[album][parentId]['children'].append(child)
                     write_log(
@@ -5794,6 +6095,7 @@ class PartLevels():
         # SECTION 4 - Process tracks within album #
         ###########################################
 
+    @timing.timed('works: process_trackback')
     def process_trackback(
             self,
             release_id,
@@ -6513,15 +6815,12 @@ class PartLevels():
                     self.parts[wid]['name'])
             # add all the parent names to the string for checking -
             work_name = list_to_str(self.parts[wid]['name'])
-            work_chk = wid
-            while work_chk in self.works_cache:
-                parent_chk = tuple(self.works_cache[work_chk])
+            for parent_chk in self.works_cache.lineage(wid):
                 if parent_chk in self.parts and self.parts[parent_chk] and 'name' in self.parts[parent_chk] and self.parts[parent_chk]['name']:
                     parent_name = list_to_str(self.parts[parent_chk]['name'])
                     p_name_orig = self.parts[parent_chk]['name']
                     p_chk = self.parts[parent_chk]
                     work_name = parent_name + ': ' + work_name
-                work_chk = parent_chk
             # now see if the key has been mentioned in the work or its parents
             for key in self.parts[wid]['key']:
                 # if not any([key.lower() in x.lower() for x in
@@ -6654,6 +6953,7 @@ class PartLevels():
     # SECTION 5 - Extend work metadata using titles #
     #################################################
 
+    @timing.timed('works: extend_metadata')
     def extend_metadata(self, release_id, top_info, track, ref_height, depth):
         """
         Combine MB work and title data according to user options
@@ -7151,6 +7451,7 @@ class PartLevels():
     # SECTION 6- Write metadata to tags according to options #
     ##########################################################
 
+    @timing.timed('works: publish_metadata')
     def publish_metadata(self, release_id, album, track, movement_info={}):
         """
         Write out the metadata according to user options
@@ -7549,7 +7850,7 @@ class PartLevels():
                     for w, word in enumerate(clean_work_words):
                         clean_work_words[w] = self.boil(release_id, word)
                     common_dets = longest_common_substring(
-                        clean_work_words, clean_parent_words)
+                        clean_work_words, clean_parent_words, release_id)
                     # this is actually a list, not a string, since list
                     # arguments were supplied
                     common_seq = common_dets['string']
@@ -7643,6 +7944,7 @@ class PartLevels():
         write_log(release_id, 'info', "Stripped work after punctuation removal: %s", stripped_work)
         return stripped_work, parent
 
+    @timing.timed('works: diff_pair')
     def diff_pair(
             self,
             release_id,
@@ -7729,7 +8031,7 @@ class PartLevels():
         write_log(release_id, 'info', "Replacement: %s", replacements)
         for tup in replacements:
             for ind in range(0, len(tup) - 1):
-                ti = re.sub(tup[ind], tup[-1], ti, flags=re.IGNORECASE)
+                ti = compiled_regex(tup[ind], re.IGNORECASE).sub(tup[-1], ti)
         write_log(
                 release_id,
                 'debug',
@@ -8021,7 +8323,7 @@ class PartLevels():
             sub_len = compare_length * substring_proportion
             if substring_proportion < 1:
                 write_log(release_id, 'info', "test sub....")
-                lcs = longest_common_substring(nopunc_mb, nopunc_ti)['string']
+                lcs = longest_common_substring(nopunc_mb, nopunc_ti, release_id)['string']
                 write_log(
                         release_id,
                         'info',
@@ -8114,23 +8416,7 @@ class PartLevels():
         :return:
         """
         write_log(release_id, 'debug', 'Canonizing: %s', s)
-        # Canonize catalogue & opus numbers (e.g. turn K. 126 into K126 or K
-        # 345a into K345a or op. 144 into op144):
-        regex = re.compile(
-            r'\b((?:op|no|k|kk|kv|L|B|Hob|S|D|M)|\w+WV)\W?\s?(\d+\-?\u2013?\u2014?\d*\w*)\b',
-            re.IGNORECASE)
-        regex_match = regex.search(s)
-        s_canon = s
-        if regex_match and len(regex_match.groups()) == 2:
-            pt1 = regex_match.group(1) or ''
-            pt2 = regex_match.group(2) or ''
-            if regex_match.group(1) and regex_match.group(2):
-                pt1 = re.sub(
-                    r'^\W*no\b',
-                    '',
-                    regex_match.group(1),
-                    flags=re.IGNORECASE)
-            s_canon = pt1 + pt2
+        s_canon = normalize('opus', s)
         write_log(release_id, 'info', 'canonized item = %s', s_canon)
         return s_canon
 
@@ -8144,87 +8430,24 @@ class PartLevels():
         :return:
         """
         write_log(release_id, 'debug', 'Canonizing: %s', s)
-        match = RE_KEYS.search(s)
-        s_canon = s
-        if match:
-            if match.group(2):
-                k2 = re.sub(
-                    r'\-sharp|\u266F',
-                    'sharp',
-                    match.group(2),
-                    flags=re.IGNORECASE)
-                k2 = re.sub(r'\-flat|\u266D', 'flat', k2, flags=re.IGNORECASE)
-                k2 = k2.replace('-', '')
-            else:
-                k2 = ''
-            if not match.group(3) or match.group(
-                    3).strip() == '':  # if the scale is not given, assume it is the major key
-                if match.group(1).isupper(
-                ) or k2 != '':  # but only if it is upper case or has an accent
-                    k3 = 'major'
-                else:
-                    k3 = ''
-            else:
-                k3 = match.group(3).strip()
-            s_canon = match.group(1).strip() + k2.strip() + k3
+        s_canon = normalize('key', s)
         write_log(release_id, 'info', 'canonized item = %s', s_canon)
         return s_canon
 
     @staticmethod
-    def canonize_synonyms(release_id, tuples, s):
+    def canonize_synonyms(release_id, table, s):
         """
         make synonyms equal
         :param release_id:
-        :param tuples
+        :param table: SynonymTable
         :param s: A string
         :return:
         """
         write_log(release_id, 'debug', 'Canonizing: %s', s)
-        s_canon = s
-        syn_patterns = []
-        syn_subs = []
-        for syn_tup in tuples:
-            syn_pattern = r'((?:^|\W)' + \
-                r'(?:$|\W)|(?:^|\W)'.join(syn_tup) + r'(?:$|\W))'
-            syn_patterns.append(syn_pattern)
-            # to get the last synonym in the tuple - the canonical form
-            syn_sub = syn_tup[-1:][0]
-            syn_subs.append(syn_sub)
-        for syn_ind, pattern in enumerate(syn_patterns):
-            regex = re.compile(pattern, re.IGNORECASE)
-            regex_match = regex.search(s)
-            if regex_match:
-                test_reg = regex_match.group().strip()
-                s_canon = s_canon.replace(test_reg, syn_subs[syn_ind])
-
+        s_canon = table.canonize(s)
         write_log(release_id, 'info', 'canonized item = %s', s_canon)
         return s_canon
 
-    def find_synonyms(self, release_id, track, reg_item):
-        """
-        extend regex item to include synonyms
-        :param release_id:
-        :param track:
-        :param reg_item: A regex portion
-        :return: reg_new: A replacement for reg_item that includes all its synonyms
-         (if reg_item matches the last in a synonym tuple)
-        """
-        write_log(release_id, 'debug', 'Finding synonyms of: %s', reg_item)
-        syn_others = []
-        syn_all = []
-        for syn_tup in self.synonyms[track]:
-            # to get the last synonym in the tuple - the canonical form
-            syn_last = syn_tup[-1:][0]
-            if re.match(r'^\s*' + reg_item + r'\s*$', syn_last, re.IGNORECASE):
-                syn_others += syn_tup[:-1]
-                syn_all += syn_tup
-        if syn_others:
-            reg_item = '(?:' + ')|(?:'.join(syn_others) + \
-                ')|(?:' + reg_item + ')'
-
-        write_log(release_id, 'info', 'new regex item = %s', reg_item)
-        return reg_item, syn_all
-
     def listify(self, release_id, track, s):
         """
         Turn a string into a list of 'words', where words may also be phrases which
@@ -8235,61 +8458,14 @@ class PartLevels():
         :return: s_tuple: a tuple of all the **match objects** (re words and defined phrases)
                  s_test_tuple: a tuple of the matched and canonized words and phrases (i.e. a tuple of strings, not objects)
         """
-        tuples = self.synonyms[track]
-        # just list anything that is a synonym (with word boundary markers)
-        syn_pattern = '|'.join(
-            [r'(?:^|\W|\b)' + x + r'(?:$|\W)' for y in self.synonyms[track] for x in y])
-        op = self.find_synonyms(
-            release_id,
-            track,
-            r'(?:op|no|k|kk|kv|L|B|Hob|S|D|M|\w+WV)')
-        op_groups = op[0]
-        op_all = op[1]
-        notes = self.find_synonyms(release_id, track, r'[ABCDEFG]')
-        notes_groups = notes[0]
-        notes_all = notes[1]
-        sharp = self.find_synonyms(release_id, track, r'sharp')
-        sharp_groups = sharp[0]
-        sharp_all = sharp[1]
-        flat = self.find_synonyms(release_id, track, r'flat')
-        flat_groups = flat[0]
-        flat_all = flat[1]
-        major = self.find_synonyms(release_id, track, r'major')
-        major_groups = major[0]
-        major_all = major[1]
-        minor = self.find_synonyms(release_id, track, r'minor')
-        minor_groups = minor[0]
-        minor_all = minor[1]
-        opus_pattern = r"(?:\b((?:(" + op_groups + \
-            r"))\W?\s?\d+\-?\u2013?\u2014?\d*\w*)\b)"
-        note_pattern = r"(\b" + notes_groups + r")"
-        accent_pattern = r"(?:\-(" + sharp_groups + r")(?:\s+|\b)|\-(" + flat_groups + r")(?:\s+|\b)|\s(" + sharp_groups + \
-                         r")(?:\s+|\b)|\s(" + flat_groups + r")(?:\s+|\b)|\u266F(?:\s+|\b)|\u266D(?:\s+|\b)|(?:[:,.]?\s+|$|\-))"
-        scale_pattern = r"(?:((" + major_groups + \
-            r")|(" + minor_groups + r"))?\b)"
-        key_pattern = note_pattern + accent_pattern + scale_pattern
-        hyphen_split_pattern = r"(?:\b|\"|\')(\w+['’]?\w*)|(?:\b\w+\b)|(\B\&\B)"
-        # treat em-dash and en-dash as hyphens
-        hyphen_embed_pattern = r"(?:\b|\"|\')(\w+['’\-\u2013\u2014]?\w*)|(?:\b\w+\b)|(\B\&\B)"
-
-        # The regex is split into two iterations as putting it all together can have unpredictable consequences
-        # - may match synonyms before op's even though that is later in the string
-
-        # First match the op's and keys
-        regex_1 = opus_pattern + r"|(" + key_pattern + r")"
-        matches_1 = re.finditer(regex_1, s, re.UNICODE | re.IGNORECASE)
+        table = self.synonym_tables[track]
+        # the regexes depend only on the synonyms and the hyphen option, so are only compiled once
+        regexes = table.get_listify_regexes(self.options[track]["cwp_split_hyphenated"])
+        matches_1 = regexes['regex_1'].finditer(s)
         s_list = []
         s_test_list = []
         s_scrubbed = s
-        all_synonyms_lists = [
-            op_all,
-            notes_all,
-            sharp_all,
-            flat_all,
-            sharp_all,
-            flat_all,
-            major_all,
-            minor_all]
+        all_synonyms_lists = regexes['all_synonyms_lists']
         matches_list = [2, 4, 5, 6, 7, 8, 10, 11]
         for match in matches_1:
             test_a = match.group()
@@ -8311,15 +8487,15 @@ class PartLevels():
             # 11. minor match
             for i, all_synonyms_list in enumerate(all_synonyms_lists):
                 if all_synonyms_list and match_a[matches_list[i]]:
-                    match_regex = [re.match(pattern, match_a[matches_list[i]], re.IGNORECASE).group()
+                    match_regex = [compiled_regex(pattern, re.IGNORECASE).match(match_a[matches_list[i]]).group()
                                    for pattern in all_synonyms_list
-                                   if re.match(pattern, match_a[matches_list[i]], re.IGNORECASE)]
+                                   if compiled_regex(pattern, re.IGNORECASE).match(match_a[matches_list[i]])]
                     if match_regex:
                         match_a[matches_list[i]] = self.canonize_synonyms(
-                            release_id, tuples, match_a[matches_list[i]])
-                        test_a = re.sub(r"\b" + match_regex[0] + r"(?:\b|$|\s|\.)",
-                                        match_a[matches_list[i]],
-                                        test_a, flags=re.IGNORECASE)
+                            release_id, table, match_a[matches_list[i]])
+                        test_a = compiled_regex(r"\b" + match_regex[0] + r"(?:\b|$|\s|\.)", re.IGNORECASE).sub(
+                            match_a[matches_list[i]],
+                            test_a)
             if match_a[1]:
                 clean_opus = test_a.strip(' ,.:;/-?"')
                 test_a = re.sub(
@@ -8350,23 +8526,13 @@ class PartLevels():
             s_scrubbed = ''.join(s_scrubbed_list)
 
         # Then match the synonyms and remaining words
-        if self.options[track]["cwp_split_hyphenated"]:
-            regex_2 = r"(" + syn_pattern + r")|" + hyphen_split_pattern
-            # allow ampersands and non-latin characters as word characters. Treat apostrophes as part of words.
-            # Treat opus and catalogue entries - e.g. K. 657 or OP.5 or op. 35a or CD 144 or BWV 243a - as one word
-            # also treat ranges of opus numbers (connected by dash, en dash or
-            # em dash) as one word
-        else:
-            regex_2 = r"(" + syn_pattern + r")|" + hyphen_embed_pattern
-            # as previous but also treat embedded hyphens as part of words.
-        matches_2 = re.finditer(
-            regex_2, s_scrubbed, re.UNICODE | re.IGNORECASE)
+        matches_2 = regexes['regex_2'].finditer(s_scrubbed)
         for match in matches_2:
             if match.group(1) and match.group(1) == match.group():
                 s_test_list.append(
                     self.canonize_synonyms(
                         release_id,
-                        tuples,
+                        table,
                         match.group(1)))  # synonym
             else:
                 s_test_list.append(match.group())
@@ -8389,78 +8555,15 @@ class PartLevels():
         :return:
         """
         tm = track.metadata
-        strsyns = re.split(r'(?<!\\)/',
-                           self.options[track]["cwp_" + text_type])
-        synonyms = []
-        for syn in strsyns:
-            tup_match = re.search(r'\((.*)\)', syn)
-            if tup_match:
-                # to ignore escaped commas
-                tup = re.split(r'(?<!\\),', tup_match.group(1))
-            else:
-                tup = ''
-            if len(tup) >= 2:
-                for i, ts in enumerate(tup):
-                    tup[i] = ts.strip("' ").strip('"')
-                    if len(
-                            tup[i]) > 4 and tup[i][0] == "!" and tup[i][1] == "!" and tup[i][-1] == "!" and tup[i][-2] == "!":
-                        # we have a reg ex inside - this deals with legacy
-                        # replacement text where enclosure in double-shouts was
-                        # required
-                        tup[i] = tup[i][2:-2]
-                    if (i < len(tup) - 1 or text_type ==
-                            'synonyms') and not tup[i]:
-                        write_log(
-                            release_id,
-                            'warning',
-                            '%s: entries must not be blank - error in %s',
-                            text_type,
-                            syn)
-                        if self.WARNING:
-                            self.append_tag(
-                            release_id,
-                            tm,
-                            '~cwp_warning',
-                            '7. ' + text_type + ': entries must not be blank - error in ' + syn)
-                        tup[i] = "**BAD**"
-                    elif [tup for t in synonyms if tup[i] in t]:
-                        write_log(
-                            release_id,
-                            'warning',
-                            '%s: keys cannot duplicate any in existing %s - error in %s '
-                            '- omitted from %s. To fix, place all %s in one tuple.',
-                            text_type,
-                            text_type,
-                            syn,
-                            text_type,
-                            text_type)
-                        if self.WARNING:
-                            self.append_tag(release_id, tm, '~cwp_warning',
-                                        '7. ' + text_type + ': keys cannot duplicate any in existing ' + text_type + ' - error in ' +
-                                        syn + ' - omitted from ' + text_type + '. To fix, place all ' + text_type + ' in one tuple.')
-                        tup[i] = "**BAD**"
-                if "**BAD**" in tup:
-                    continue
-                else:
-                    synonyms.append(tup)
-            else:
-                write_log(
-                    release_id,
-                    'warning',
-                    'Error in %s format for %s',
-                    text_type,
-                    syn)
-                if self.WARNING:
-                    self.append_tag(
-                    release_id,
-                    tm,
-                    '~cwp_warning',
-                    '7. Error in ' +
-                    text_type +
-                    ' format for ' +
-                    syn)
-        write_log(release_id, 'info', "%s: %s", text_type, synonyms)
-        return synonyms
+        # the text is only parsed once, but any problems are reported for each track
+        text_tuples, problems = synonyms.parse_text_tuples(
+            self.options[track]["cwp_" + text_type], text_type)
+        for message, args, warning in problems:
+            write_log(release_id, 'warning', message, *args)
+            if self.WARNING:
+                self.append_tag(release_id, tm, '~cwp_warning', warning)
+        write_log(release_id, 'info', "%s: %s", text_type, text_tuples)
+        return text_tuples
 
     @staticmethod
     def stencil(release_id, matches_tuple, test_string):
@@ -8515,29 +8618,7 @@ class PartLevels():
         :return:
         """
         write_log(release_id, 'debug', "boiling %s", s)
-        s = s.lower()
-        s = replace_roman_numerals(s)
-        s = s.replace('sch', 'sh')\
-            .replace(u'\xdf', 'ss')\
-            .replace('sz', 'ss')\
-            .replace(u'\u0153', 'oe')\
-            .replace('oe', 'o')\
-            .replace(u'\u00fc', 'ue')\
-            .replace('ue', 'u')\
-            .replace(u'\u00e6', 'ae')\
-            .replace('ae', 'a')\
-            .replace(u'\u266F', 'sharp')\
-            .replace(u'\u266D', 'flat')\
-            .replace(u'\u2013', '-')\
-            .replace(u'\u2014', '-')
-        # first term above is to remove the markers used for synonyms, to
-        # enable a true comparison
-        punc = re.compile(r'\W*', re.ASCII)
-        s = ''.join(
-            c for c in unicodedata.normalize(
-                'NFD',
-                s) if unicodedata.category(c) != 'Mn')
-        boiled = punc.sub('', s).strip().lower().rstrip("s'")
+        boiled = normalize('boil', s)
         write_log(release_id, 'debug', "boiled result = %s", boiled)
         return boiled
 
@@ -8554,7 +8635,9 @@ class ClassicalExtrasOptionsPage(OptionsPage):
         plugin_options('workparts') + plugin_options('genres') + plugin_options('other')
 
     options = [
-        IntOption("persist", 'ce_tab', 0)
+        IntOption("persist", 'ce_tab', 0),
+        # not on the page - set to a release id to profile the processing of that release
+        TextOption("setting", 'ce_profile_release', "")
     ]
     # custom logging for non-album-related messages is written to session.log
     for opt in opts:
@@ -8576,32 +8659,65 @@ class ClassicalExtrasOptionsPage(OptionsPage):
                     "Error in setting options for option = %s",
                     opt['option'])
 
+    # option type -> (widget method to set the value, widget method to get it, conversion of the value got)
+    widget_methods = {
+        'Boolean': ('setChecked', 'isChecked', None),
+        'Text': ('setText', 'text', str),
+        'PlainText': ('setPlainText', 'toPlainText', str),
+        'Combo': ('setEditText', 'currentText', str),
+        'Integer': ('setValue', 'value', None)}
+    # widgets with a different name from their option
+    widget_names = {
+        'classical_work_parts': 'use_cwp',
+        'classical_extra_artists': 'use_cea'}
+    # (option, widget name, setter, getter, conversion) for each option on the page
+    bindings = []
+    for opt in opts:
+        if opt.get('type') in widget_methods:
+            bindings.append((opt['option'], widget_names.get(opt['option'], opt['option'])) +
+                            widget_methods[opt['type']])
+        else:
+            write_log(
+                'session',
+                'error',
+                "Error in binding options for option = %s",
+                opt['option'])
+
+    # To force a toggle so that signal given
+    toggle_list = ['use_cwp',
+                   'use_cea',
+                   'cea_override',
+                   'cwp_override',
+                   'cea_ra_use',
+                   'cea_split_lyrics',
+                   'cwp_partial',
+                   'cwp_arrangements',
+                   'cwp_medley',
+                   'cwp_use_muso_refdb',
+                   'ce_show_ui_tags',]
+
     def __init__(self, parent=None):
         super(ClassicalExtrasOptionsPage, self).__init__(parent)
-        self.ui = Ui_ClassicalExtrasOptionsPage()
-        self.ui.setupUi(self)
+        # the widgets are only built when the page is first shown
+        self.ui = None
+
+    def showEvent(self, event):
+        if self.ui is None:
+            self.ui = Ui_ClassicalExtrasOptionsPage()
+            self.ui.setupUi(self)
+            self.load_widgets()
+        super(ClassicalExtrasOptionsPage, self).showEvent(event)
 
     def load(self):
         """
         Load the options - NB all options are set in plugin_options, so this just parses that
+        (If the page has not been shown yet, this is done when it is)
         :return:
         """
-        opts = plugin_options('artists') + plugin_options('tag') + plugin_options('tag_detail') +\
-            plugin_options('workparts') + plugin_options('genres') + plugin_options('other')
-
-        # To force a toggle so that signal given
-        toggle_list = ['use_cwp',
-                       'use_cea',
-                       'cea_override',
-                       'cwp_override',
-                       'cea_ra_use',
-                       'cea_split_lyrics',
-                       'cwp_partial',
-                       'cwp_arrangements',
-                       'cwp_medley',
-                       'cwp_use_muso_refdb',
-                       'ce_show_ui_tags',]
+        if self.ui is not None:
+            self.load_widgets()
 
+    def load_widgets(self):
         # open at last used tab
         if 'ce_tab' in config.persist:
             cfg_val = config.persist['ce_tab'] or 0
@@ -8610,74 +8726,28 @@ class ClassicalExtrasOptionsPage(OptionsPage):
         else:
             self.ui.tabWidget.setCurrentIndex(0)
 
-        for opt in opts:
-            if opt['option'] == 'classical_work_parts':
-                ui_name = 'use_cwp'
-            elif opt['option'] == 'classical_extra_artists':
-                ui_name = 'use_cea'
-            else:
-                ui_name = opt['option']
-            if ui_name in toggle_list:
-                not_setting = not self.config.setting[opt['option']]
-                self.ui.__dict__[ui_name].setChecked(not_setting)
-
-            if opt['type'] == 'Boolean':
-                self.ui.__dict__[ui_name].setChecked(
-                    self.config.setting[opt['option']])
-            elif opt['type'] == 'Text':
-                self.ui.__dict__[ui_name].setText(
-                    self.config.setting[opt['option']])
-            elif opt['type'] == 'PlainText':
-                self.ui.__dict__[ui_name].setPlainText(
-                    self.config.setting[opt['option']])
-            elif opt['type'] == 'Combo':
-                self.ui.__dict__[ui_name].setEditText(
-                    self.config.setting[opt['option']])
-            elif opt['type'] == 'Integer':
-                self.ui.__dict__[ui_name].setValue(
-                    self.config.setting[opt['option']])
-            else:
-                write_log(
-                    'session',
-                    'error',
-                    "Error in loading options for option = %s",
-                    opt['option'])
+        setting = self.config.setting
+        widgets = self.ui.__dict__
+        for option, ui_name, setter, getter, convert in self.bindings:
+            value = setting[option]
+            widget = widgets[ui_name]
+            if ui_name in self.toggle_list:
+                widget.setChecked(not value)
+            getattr(widget, setter)(value)
 
     def save(self):
-        opts = plugin_options('artists') + plugin_options('tag') + plugin_options('tag_detail') +\
-            plugin_options('workparts') + plugin_options('genres') + plugin_options('other')
+        if self.ui is None:
+            # never shown, so nothing can have changed
+            return
 
         # save tab setting
         config.persist['ce_tab'] = self.ui.tabWidget.currentIndex()
 
-        for opt in opts:
-            if opt['option'] == 'classical_work_parts':
-                ui_name = 'use_cwp'
-            elif opt['option'] == 'classical_extra_artists':
-                ui_name = 'use_cea'
-            else:
-                ui_name = opt['option']
-            if opt['type'] == 'Boolean':
-                self.config.setting[opt['option']] = self.ui.__dict__[
-                    ui_name].isChecked()
-            elif opt['type'] == 'Text':
-                self.config.setting[opt['option']] = str(
-                    self.ui.__dict__[ui_name].text())
-            elif opt['type'] == 'PlainText':
-                self.config.setting[opt['option']] = str(
-                    self.ui.__dict__[ui_name].toPlainText())
-            elif opt['type'] == 'Combo':
-                self.config.setting[opt['option']] = str(
-                    self.ui.__dict__[ui_name].currentText())
-            elif opt['type'] == 'Integer':
-                self.config.setting[opt['option']
-                                    ] = self.ui.__dict__[ui_name].value()
-            else:
-                write_log(
-                    'session',
-                    'error',
-                    "Error in saving options for option = %s",
-                    opt['option'])
+        setting = self.config.setting
+        widgets = self.ui.__dict__
+        for option, ui_name, setter, getter, convert in self.bindings:
+            value = getattr(widgets[ui_name], getter)()
+            setting[option] = convert(value) if convert else value
 
 
 #################
@@ -8707,29 +8777,17 @@ config.setting['release_ars'] = True
 
 
 # REFERENCE DATA
-REF_DICT = get_references_from_file(
-    'session',
-    config.setting['cwp_muso_path'],
-    config.setting['cwp_muso_refdb'])
-write_log('session', 'info', 'External references (Muso):')
-write_log('session', 'info', REF_DICT)
-COMPOSER_DICT = REF_DICT['composers']
-if config.setting['cwp_muso_classical'] and not COMPOSER_DICT:
-    write_log('session', 'error', 'No composer roster found')
-for cd in COMPOSER_DICT:
-    cd['lc_name'] = [c.lower() for c in cd['name']]
-    cd['lc_sort'] = [c.lower() for c in cd['sort']]
-PERIOD_DICT = REF_DICT['periods']
-if (config.setting['cwp_muso_dates']
-        or config.setting['cwp_muso_periods']) and not PERIOD_DICT:
-    write_log('session', 'error', 'No period map found')
-GENRE_DICT = REF_DICT['genres']
-if config.setting['cwp_muso_genres'] and not GENRE_DICT:
-    write_log('session', 'error', 'No classical genre list found')
+MUSO_REFERENCES = {}
+# Muso reference data (see muso_references), keyed by reference file path - only read when first needed
 
 # API CALLS
-register_track_metadata_processor(PartLevels().add_work_info)
-register_track_metadata_processor(ExtraArtists().add_artist_info)
+PART_LEVELS = PartLevels()
+EXTRA_ARTISTS = ExtraArtists()
+RELEASES.add_holder(purge_release_status, release_cache_sizes)
+RELEASES.add_holder(PART_LEVELS.purge_release, PART_LEVELS.cache_sizes)
+RELEASES.add_holder(EXTRA_ARTISTS.purge_release, EXTRA_ARTISTS.cache_sizes)
+register_track_metadata_processor(PART_LEVELS.add_work_info)
+register_track_metadata_processor(EXTRA_ARTISTS.add_artist_info)
 register_options_page(ClassicalExtrasOptionsPage)
 
 # END
@@ -789,6 +789,10 @@ OTHER_OPTIONS = [
      'type': 'Boolean',
      'default': True
      },
+    {'option': 'cwp_persistent_cache',
+     'type': 'Boolean',
+     'default': False
+     },
     {'option': 'cwp_aliases',
      'name': 'replace with alias?',
      'value': 'replace',
@@ -1145,4 +1149,23 @@ INSERTIONS = ['writer',
               'orchestrator',
               'instrument arranger',
               'vocal arranger',
-              'chorus master']
\ No newline at end of file
+              'chorus master']
+
+# Persistent works cache (used if cwp_persistent_cache is set)
+WORKS_CACHE_FILE = 'works_cache.sqlite'
+WORKS_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+WORKS_CACHE_MAX_ENTRIES = 50000
+
+# Custom log files - number of lines held for each release before they are passed to the log writer
+LOG_BUFFER_LINES = 256
+
+# Number of normalized strings (see normalize in __init__) and compiled regexes kept
+NORMALIZE_CACHE_SIZE = 4096
+
+# Snapshot of the data read from the Muso reference file
+REFERENCES_SNAPSHOT_FILE = 'muso_references.pickle'
+
+# Works and artist aliases held in memory - once an album is removed, the least recently used are discarded
+# to keep within these numbers (works still needed can be looked up again, or read from the persistent cache)
+WORKS_MEMORY_MAX_ENTRIES = 20000
+ALIASES_MEMORY_MAX_ENTRIES = 20000
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Release lifecycle for Picard Classical Extras plugin
+State kept for each release (by release id, album or track) is discarded when the album is removed
+from Picard, so that it does not accumulate over a long session.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import weakref
+
+from picard import log
+
+
+class ReleaseLifecycle():
+    """
+    Albums are registered (by release id) as their tracks are processed and are only held by weak reference,
+    so the registry itself never keeps an album alive.
+    Holders of per-release state are added with add_holder, giving two functions:
+        purge_release(release_id, album, tracks): discard everything kept for the release
+        cache_sizes(): dict of name -> number of entries, for the debug report
+    The tagger's album_removed signal is connected when the first album is registered.
+    """
+
+    def __init__(self):
+        self.albums = weakref.WeakValueDictionary()
+        self.holders = []
+        self.connected = False
+        self.purged = 0
+
+    def add_holder(self, purge_release, cache_sizes):
+        self.holders.append((purge_release, cache_sizes))
+
+    def register(self, release_id, album):
+        """
+        Note the album for a release (called for each track, so returns quickly if already registered)
+        :param release_id:
+        :param album:
+        :return:
+        """
+        if self.albums.get(release_id) is album:
+            return
+        self.albums[release_id] = album
+        if not self.connected:
+            try:
+                album.tagger.album_removed.connect(self.album_removed)
+                self.connected = True
+            except AttributeError:
+                log.error('Classical Extras: unable to connect to album removal - release data will not be purged')
+
+    def is_live(self, album):
+        """
+        :param album:
+        :return: True if the album is registered and has not been removed
+        """
+        return any(registered_album is album for registered_album in self.albums.values())
+
+    def album_removed(self, album):
+        for release_id, registered_album in list(self.albums.items()):
+            if registered_album is album:
+                del self.albums[release_id]
+                self.purge(release_id, album)
+
+    def purge(self, release_id, album):
+        """
+        Discard all the state kept for a release
+        :param release_id:
+        :param album:
+        :return:
+        """
+        # tracks may be in either list, depending on how far loading got
+        tracks = list(getattr(album, 'tracks', [])) + list(getattr(album, '_new_tracks', []))
+        for purge_release, cache_sizes in self.holders:
+            try:
+                purge_release(release_id, album, tracks)
+            except Exception:
+                log.error('Classical Extras: error purging data for release %s', release_id, exc_info=True)
+        self.purged += 1
+
+    def cache_sizes(self):
+        """
+        :return: dict of name -> number of entries, for all holders
+        """
+        sizes = {'albums': len(self.albums), 'albums purged': self.purged}
+        for purge_release, cache_sizes in self.holders:
+            sizes.update(cache_sizes())
+        return sizes
+
+
+def remove_oldest(mapping, count, keep=()):
+    """
+    Remove the oldest entries of an (insertion- or use-ordered) dict
+    :param mapping: dict or OrderedDict - oldest first
+    :param count: number of entries to remove
+    :param keep: keys not to be removed
+    :return: list of the keys removed
+    """
+    removed = []
+    if count > 0:
+        for key in list(mapping):
+            if key not in keep:
+                del mapping[key]
+                removed.append(key)
+                if len(removed) == count:
+                    break
+    return removed
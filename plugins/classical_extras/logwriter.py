@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Background writer for the custom log files of Picard Classical Extras plugin
+All file operations are done by a single thread, which writes whatever has been queued in one go,
+so that logging does not hold up the processing of releases.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import atexit
+import os
+import queue
+import threading
+
+from picard import log
+
+# operations queued for the writer thread
+_OPEN = 0
+_WRITE = 1
+_CLOSE = 2
+_STOP = 3
+
+
+class LogWriter():
+    """
+    Log files are identified by name (the release id, or 'session') and written to directory as <name>.log.
+    open/write/close only queue the operation - the writer thread is started on first use.
+    Lines are text without the trailing newline.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='Classical Extras log writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def _put(self, item):
+        if self.thread is None:
+            self._start()
+        self.queue.put(item)
+
+    def open(self, name, lines):
+        """
+        (Re-)create the log file
+        :param name: log name
+        :param lines: header lines
+        :return:
+        """
+        self._put((_OPEN, name, lines))
+
+    def write(self, name, lines):
+        self._put((_WRITE, name, lines))
+
+    def close(self, name):
+        self._put((_CLOSE, name, None))
+
+    def stop(self):
+        """
+        Write everything outstanding and stop the thread (called at exit)
+        :return:
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put((_STOP, None, None))
+            self.thread.join()
+
+    def _run(self):
+        files = {}
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            # take everything else that is waiting, so that it is all written together
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            written = set()
+            for operation, name, lines in batch:
+                try:
+                    if operation == _OPEN:
+                        if name in files:
+                            files.pop(name).close()
+                        if not os.path.exists(self.directory):
+                            os.makedirs(self.directory)
+                        files[name] = open(
+                            os.path.join(self.directory, name + '.log'), 'w', encoding='utf8')
+                        operation = _WRITE
+                    if operation == _WRITE:
+                        if name in files:
+                            files[name].write('\n'.join(lines) + '\n')
+                            written.add(name)
+                    elif operation == _CLOSE:
+                        if name in files:
+                            files.pop(name).close()
+                            written.discard(name)
+                    elif operation == _STOP:
+                        stop = True
+                except (IOError, OSError):
+                    log.error('Classical Extras: unable to write log file %s', name, exc_info=True)
+            # keep open files (e.g. session.log) up to date
+            for name in written:
+                try:
+                    files[name].flush()
+                except (IOError, OSError):
+                    log.error('Classical Extras: unable to write log file %s', name, exc_info=True)
+        for log_file in files.values():
+            log_file.close()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Common lyrics for Picard Classical Extras plugin
+Finds the longest run of words which is in the lyrics of every track (e.g. the libretto of an opera),
+so that it can be split from each track's own lyrics.
+Words are replaced by integer ids and the longest common length is found by a search down from an upper limit
+(then by halving), testing each length with rolling hashes of every run of words of that length (Rabin-Karp),
+so the time and memory are close to linear in the total number of words.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+# hashes are modulo a Mersenne prime, so that collisions are very unlikely (and any are detected anyway)
+HASH_MODULUS = (1 << 61) - 1
+HASH_BASE = 1000003
+
+
+class WordSequence():
+    """
+    Word ids of one set of lyrics, with the prefix hashes from which the hash of any run of words is found
+    The ids are also held as a string (one character per word), so that runs can be compared quickly
+    """
+
+    def __init__(self, ids):
+        self.text = ''.join(map(chr, ids))
+        prefix = [0]
+        h = 0
+        for word_id in ids:
+            h = (h * HASH_BASE + word_id + 1) % HASH_MODULUS
+            prefix.append(h)
+        self.prefix = prefix
+
+    def __len__(self):
+        return len(self.text)
+
+    def run_hashes(self, length):
+        """
+        :param length: number of words
+        :return: list of the hashes of each run of length words, by start position
+        """
+        prefix = self.prefix
+        power = pow(HASH_BASE, length, HASH_MODULUS)
+        return [(prefix[i + length] - prefix[i] * power) % HASH_MODULUS
+                for i in range(len(self.text) - length + 1)]
+
+
+def _common_start(sequences, length):
+    """
+    :param sequences: WordSequences (the first being the one in which the position is returned)
+    :param length: number of words
+    :return: start in the first sequence of the first run of length words which is in all the sequences,
+    or None if there is none
+    """
+    first_hashes = sequences[0].run_hashes(length)
+    common = set(first_hashes)
+    # shortest first, as it will usually reduce the candidates most
+    others = sorted(sequences[1:], key=len)
+    for sequence in others:
+        common.intersection_update(sequence.run_hashes(length))
+        if not common:
+            return None
+    first_text = sequences[0].text
+    for i, h in enumerate(first_hashes):
+        if h in common:
+            run = first_text[i:i + length]
+            # check the words themselves, in case of a hash collision
+            if all(run in sequence.text for sequence in others):
+                return i
+    return None
+
+
+def _length_bound(sequences):
+    """
+    :param sequences: WordSequences
+    :return: upper limit for the length of a run of words in all the sequences -
+    every pair of adjacent words in such a run must be in all the sequences, so it can be no longer than
+    the longest stretch of the first sequence in which every pair is in all of them
+    """
+    pair_hashes = sequences[0].run_hashes(2)
+    common = set(pair_hashes)
+    for sequence in sequences[1:]:
+        common.intersection_update(sequence.run_hashes(2))
+    bound = 1
+    stretch = 1
+    for h in pair_hashes:
+        if h in common:
+            stretch += 1
+            bound = max(bound, stretch)
+        else:
+            stretch = 1
+    return min(bound, min(len(sequence) for sequence in sequences))
+
+
+def common_words(word_lists):
+    """
+    Longest run of words which is in every list
+    :param word_lists: list of lists of words
+    :return: list of words (if there is more than one run of the longest length, the first in the first list)
+    """
+    if not word_lists:
+        return []
+    if len(word_lists) == 1:
+        return word_lists[0]
+    word_ids = {}
+    sequences = [WordSequence([word_ids.setdefault(word, len(word_ids)) for word in words])
+                 for words in word_lists]
+    # a run which is in every list of length n must also be in every list of any length < n,
+    # so search for the longest length for which there is one - starting near the upper limit,
+    # as (with a common libretto) the answer is usually close to it
+    low = 0
+    high = _length_bound(sequences)
+    start = None
+    step = 1
+    while low < high:
+        length = max(high - step + 1, (low + high + 1) // 2)
+        found = _common_start(sequences, length)
+        if found is None:
+            high = length - 1
+            step *= 2
+        else:
+            low = length
+            start = found
+    if not low:
+        return []
+    # start is from the last length found, which is low
+    return word_lists[0][start:start + low]
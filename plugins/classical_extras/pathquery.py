@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Path queries on XmlNode and JSON objects for Picard Classical Extras plugin
+A query (as used by parse_data) is a sequence of node names, each optionally with a value test,
+e.g. ('relations', 'target-type:work', 'work', 'id'). Queries are compiled once and cached,
+and evaluated without recursion.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+from functools import lru_cache
+
+from picard.util.xml import XmlNode
+
+
+@lru_cache(maxsize=1024)
+def compile_query(match):
+    """
+    :param match: tuple of query items
+    :return: tuple of steps (name, test) - test is None or (compiled sub-query, value, value == 'True')
+    """
+    steps = []
+    for item in match:
+        if ':' in item:
+            test = item.split(':')
+            # Booleans are stored as such, not as strings, in JSON
+            steps.append((item, (compile_query(tuple(test[0].split('.'))), test[1], test[1] == 'True')))
+        else:
+            steps.append((item, None))
+    return tuple(steps)
+
+
+def evaluate(steps, obj):
+    """
+    Generate all the objects matching the compiled query, in document order
+    :param steps: compiled query
+    :param obj: an XmlNode or JSON object, list or dictionary containing nodes
+    :return: generator
+    """
+    last = len(steps) - 1
+    # depth-first, so items are pushed in reverse order
+    stack = [(obj, 0)]
+    while stack:
+        obj, i = stack.pop()
+        # XmlNode instances are not iterable, so need to convert to dict
+        if isinstance(obj, XmlNode):
+            obj = obj.__dict__
+        if isinstance(obj, list):
+            stack.extend([(item, i) for item in reversed(obj)])
+        elif isinstance(obj, dict):
+            name, test = steps[i]
+            if name in obj:
+                if i == last:
+                    if obj[name] is not None:  # To prevent adding NoneTypes to list
+                        yield obj[name]
+                else:
+                    stack.append((obj[name], i + 1))
+            elif test:
+                sub_steps, value, bool_value = test
+                for data in evaluate(sub_steps, obj):
+                    if data == value or data == bool_value:
+                        if i == last:
+                            yield obj
+                        else:
+                            stack.append((obj, i + 1))
+                        break
+            elif 'children' in obj:
+                stack.append((obj['children'], i))
+
+
+def query(obj, match):
+    """
+    :param obj: an XmlNode or JSON object, list or dictionary containing nodes
+    :param match: tuple of query items
+    :return: a list of matching items
+    """
+    return list(evaluate(compile_query(match), obj))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Indexes of the reference data (Muso composers, periods and genres) for Picard Classical Extras plugin
+Built once, when the reference data is loaded (or, for data in the options, once for each option text),
+so that map_tags does not need to search or re-build them for every track.
+The reference file is read as a stream, extracting each record as it ends, and the data read is also kept
+in a snapshot file, so that the file only needs to be parsed again when it changes.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import hashlib
+import os
+import pickle
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+from PyQt5.QtCore import QXmlStreamReader
+
+from picard import log
+
+# change if the structure of the data read from the reference file changes
+SNAPSHOT_VERSION = 1
+
+
+# records in the reference file (children of the ReferenceDB element):
+# element name -> (key in the data read, ((field element name, key in record), ...))
+REFERENCE_RECORDS = {
+    'Composer': ('composers', (
+        ('Name', 'name'),
+        ('Sort', 'sort'),
+        ('Birth', 'birth'),
+        ('Death', 'death'),
+        ('CountryCode', 'country'),
+        ('Core', 'core'))),
+    'ClassicalPeriod': ('periods', (
+        ('Name', 'name'),
+        ('Start_x0020_Date', 'start'),
+        ('End_x0020_Date', 'end'))),
+    'ClassicalGenre': ('genres', (
+        ('Name', 'name'),))}
+
+_node_name_re = re.compile('[^a-zA-Z0-9]')
+
+
+def _node_name(n):
+    return _node_name_re.sub('_', str(n))
+
+
+def read_references(path, chunk_size=65536):
+    """
+    Read the composer, period and genre records from a Muso Reference.xml (or similar) file
+    The file is fed to the XML reader in chunks and each record is stored as soon as it ends,
+    so only one record is held apart from the results.
+    :param path: reference file
+    :param chunk_size: bytes read at a time
+    :return: dict of 'composers', 'periods' and 'genres' -> list of records (dicts of field key -> list of texts),
+     and an error message if the file is not well-formed (the records before the error are still returned)
+    """
+    data = {key: [] for key, fields in REFERENCE_RECORDS.values()}
+    stream = QXmlStreamReader()
+    error = None
+    depth = 0
+    in_references = False
+    records = None  # list for the current record type
+    record = None  # current record
+    record_fields = None  # field element name -> key, for the current record type
+    field_texts = None  # texts of the current field
+    with open(path, 'rb') as reference_file:
+        while True:
+            token = stream.readNext()
+            if token == QXmlStreamReader.StartElement:
+                depth += 1
+                if depth == 1:
+                    in_references = _node_name(stream.name()) == 'ReferenceDB'
+                elif depth == 2 and in_references:
+                    record_type = REFERENCE_RECORDS.get(_node_name(stream.name()))
+                    if record_type:
+                        records = data[record_type[0]]
+                        record_fields = dict(record_type[1])
+                        record = {key: [] for name, key in record_type[1]}
+                elif depth == 3 and record is not None:
+                    key = record_fields.get(_node_name(stream.name()))
+                    if key:
+                        field_texts = record[key]
+                        field_texts.append('')
+            elif token == QXmlStreamReader.Characters:
+                if depth == 3 and field_texts is not None:
+                    field_texts[-1] += str(stream.text())
+            elif token == QXmlStreamReader.EndElement:
+                if depth == 3:
+                    field_texts = None
+                elif depth == 2 and record is not None:
+                    records.append(record)
+                    record = None
+                depth -= 1
+            elif token == QXmlStreamReader.Invalid:
+                if stream.error() == QXmlStreamReader.PrematureEndOfDocumentError:
+                    chunk = reference_file.read(chunk_size)
+                    if chunk:
+                        stream.addData(chunk)
+                        continue
+                error = stream.errorString()
+                break
+            elif token == QXmlStreamReader.EndDocument:
+                break
+    return data, error
+
+
+def _text(items):
+    # as list_to_str
+    if isinstance(items, list):
+        return '; '.join(items)
+    return items
+
+
+def composer_index(composers):
+    """
+    :param composers: list of composer dicts (as read from the reference file)
+    :return: dict of lower-case name -> composer dict
+    (if more than one composer has the same name, the first is used)
+    """
+    index = {}
+    for composer in composers:
+        for name in composer['name']:
+            index.setdefault(name.lower(), composer)
+    return index
+
+
+def _period(name, start, end):
+    if start.lstrip('-').isdigit() and end.lstrip('-').isdigit():
+        return int(start), int(end)
+    return 9999, 'ERROR - start and/or end of ' + name + ' are not integers'
+
+
+def muso_periods(periods):
+    """
+    :param periods: list of period dicts (as read from the reference file)
+    :return: dict of period name -> (start year, end year), or (9999, error message)
+    """
+    period_dict = {}
+    for period in periods:
+        # missing dates are open-ended
+        name = _text(period.get('name') or ['NOT SPECIFIED']).strip()
+        period_dict[name] = _period(
+            name,
+            _text(period.get('start') or ['-9999']),
+            _text(period.get('end') or ['2525']))
+    return period_dict
+
+
+@lru_cache(maxsize=8)
+def text_periods(period_map):
+    """
+    :param period_map: cwp_period_map option text, e.g. Baroque, 1600, 1750; Classical, 1750, 1820
+    :return: PeriodMap
+    """
+    period_dict = {}
+    periods = [p.strip() for p in period_map.split(';')]
+    for p in periods:
+        p = p.split(',')
+        if len(p) == 3:
+            name = p[0].strip()
+            period_dict[name] = _period(name, p[1].strip(), p[2].strip())
+        else:
+            period_dict[p[0]] = (
+                9999, 'ERROR in period map - each item must contain 3 elements')
+    return PeriodMap(period_dict)
+
+
+class PeriodMap():
+    """
+    Periods in order of start (then end) date, for finding the periods which include a given year
+    Only the periods before the first one with an error (which sort last, with a start of 9999) are used
+    """
+
+    def __init__(self, periods):
+        """
+        :param periods: dict of period name -> (start year, end year), or (9999, error message)
+        """
+        self.count = len(periods)
+        self.names = []
+        self.starts = []
+        self.ends = []
+        self.error = None
+        for name, (start, end) in sorted(periods.items(), key=lambda t: t[1]):
+            if isinstance(end, str) and 'ERROR' in end:
+                self.error = end
+                break
+            self.names.append(name)
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def __len__(self):
+        return self.count
+
+    def including(self, year):
+        """
+        :param year:
+        :return: set of the positions (in self.names) of the periods which include year
+        """
+        return {i for i in range(bisect_right(self.starts, year)) if self.ends[i] >= year}
+
+
+def muso_genres(genres):
+    """
+    :param genres: list of genre dicts (as read from the reference file)
+    :return: list of genre names
+    """
+    return [_text(genre['name']).strip() for genre in genres]
+
+
+@lru_cache(maxsize=32)
+def text_genres(genres):
+    """
+    :param genres: genres option text (comma-separated)
+    :return: tuple of genre names
+    """
+    return tuple(genre.strip() for genre in genres.split(','))
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(65536), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def read_snapshot(snapshot_path, source_path):
+    """
+    :param snapshot_path: snapshot file
+    :param source_path: reference file
+    :return: the data saved by write_snapshot, or None if there is no snapshot of the current reference file
+    The snapshot is current if the reference file has the same modification time and size
+    or, failing that, the same content (e.g. if it has just been copied) - in which case the snapshot is saved
+    with the new modification time, so that the file need not be read again next time
+    """
+    try:
+        source_stat = os.stat(source_path)
+        with open(snapshot_path, 'rb') as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION \
+                or snapshot.get('source') != source_path or snapshot.get('size') != source_stat.st_size:
+            return None
+        if snapshot.get('mtime') != source_stat.st_mtime:
+            if snapshot.get('sha1') != file_sha1(source_path):
+                return None
+            snapshot['mtime'] = source_stat.st_mtime
+            _save_snapshot(snapshot_path, snapshot)
+        return snapshot['data']
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, KeyError, AttributeError, ValueError, pickle.UnpicklingError):
+        log.error('Classical Extras: unable to read reference snapshot %s', snapshot_path, exc_info=True)
+        return None
+
+
+def write_snapshot(snapshot_path, source_path, data):
+    """
+    Save the data read from a reference file
+    :param snapshot_path: snapshot file
+    :param source_path: reference file
+    :param data: data read from the reference file (lists and dicts of strings)
+    :return:
+    """
+    try:
+        source_stat = os.stat(source_path)
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'source': source_path,
+            'mtime': source_stat.st_mtime,
+            'size': source_stat.st_size,
+            'sha1': file_sha1(source_path),
+            'data': data}
+    except OSError:
+        log.error('Classical Extras: unable to read reference file %s', source_path, exc_info=True)
+        return
+    _save_snapshot(snapshot_path, snapshot)
+
+
+def _save_snapshot(snapshot_path, snapshot):
+    temp_path = snapshot_path + '.tmp'
+    try:
+        directory = os.path.dirname(snapshot_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(temp_path, 'wb') as snapshot_file:
+            pickle.dump(snapshot, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        # so that a partly-written snapshot is never read
+        os.replace(temp_path, snapshot_path)
+    except (OSError, pickle.PicklingError):
+        log.error('Classical Extras: unable to write reference snapshot %s', snapshot_path, exc_info=True)
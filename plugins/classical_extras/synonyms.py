@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Synonym and replacement tables for Picard Classical Extras plugin
+The user's synonym (and replacement) option text is parsed once for each distinct text,
+and the regexes used to canonize and split titles are compiled once for each table.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import re
+from functools import lru_cache
+
+# items which listify looks for synonyms of
+OPUS_ITEM = r'(?:op|no|k|kk|kv|L|B|Hob|S|D|M|\w+WV)'
+NOTES_ITEM = r'[ABCDEFG]'
+
+HYPHEN_SPLIT_PATTERN = r"(?:\b|\"|\')(\w+['’]?\w*)|(?:\b\w+\b)|(\B\&\B)"
+# treat em-dash and en-dash as hyphens
+HYPHEN_EMBED_PATTERN = r"(?:\b|\"|\')(\w+['’\-\u2013\u2014]?\w*)|(?:\b\w+\b)|(\B\&\B)"
+
+
+@lru_cache(maxsize=32)
+def parse_text_tuples(text, text_type):
+    """
+    Parse synonym, replacement or ui_tags option text, e.g. (a, b, c) / (d, e)
+    Note that code in this function refers to synonyms (as that was written first), but applies equally to
+    replacements and ui_tags
+    :param text: option text
+    :param text_type: 'replacements' or 'synonyms'
+    :return: tuple of tuples of strings (the last item in each being the canonical form or replacement),
+    and a tuple of problems (log message, log args, warning tag text)
+    """
+    strsyns = re.split(r'(?<!\\)/', text)
+    synonyms = []
+    problems = []
+    for syn in strsyns:
+        tup_match = re.search(r'\((.*)\)', syn)
+        if tup_match:
+            # to ignore escaped commas
+            tup = re.split(r'(?<!\\),', tup_match.group(1))
+        else:
+            tup = ''
+        if len(tup) >= 2:
+            for i, ts in enumerate(tup):
+                tup[i] = ts.strip("' ").strip('"')
+                if len(
+                        tup[i]) > 4 and tup[i][0] == "!" and tup[i][1] == "!" and tup[i][-1] == "!" and tup[i][-2] == "!":
+                    # we have a reg ex inside - this deals with legacy
+                    # replacement text where enclosure in double-shouts was
+                    # required
+                    tup[i] = tup[i][2:-2]
+                if (i < len(tup) - 1 or text_type ==
+                        'synonyms') and not tup[i]:
+                    problems.append((
+                        '%s: entries must not be blank - error in %s',
+                        (text_type, syn),
+                        '7. ' + text_type + ': entries must not be blank - error in ' + syn))
+                    tup[i] = "**BAD**"
+                elif [tup for t in synonyms if tup[i] in t]:
+                    problems.append((
+                        '%s: keys cannot duplicate any in existing %s - error in %s '
+                        '- omitted from %s. To fix, place all %s in one tuple.',
+                        (text_type, text_type, syn, text_type, text_type),
+                        '7. ' + text_type + ': keys cannot duplicate any in existing ' + text_type + ' - error in ' +
+                        syn + ' - omitted from ' + text_type + '. To fix, place all ' + text_type + ' in one tuple.'))
+                    tup[i] = "**BAD**"
+            if "**BAD**" in tup:
+                continue
+            else:
+                synonyms.append(tup)
+        else:
+            problems.append((
+                'Error in %s format for %s',
+                (text_type, syn),
+                '7. Error in ' + text_type + ' format for ' + syn))
+    return tuple(tuple(tup) for tup in synonyms), tuple(problems)
+
+
+@lru_cache(maxsize=32)
+def synonym_table(tuples):
+    """
+    :param tuples: synonym tuples, as returned by parse_text_tuples
+    :return: the SynonymTable for them (built once)
+    """
+    return SynonymTable(tuples)
+
+
+class SynonymTable():
+    """
+    Compiled form of a set of synonym tuples
+    All the synonyms are found in one pass over a string, with a single regex which finds each position at which
+    any synonym starts (each match is zero-width - a look-ahead - so that every position is tried, just as a separate
+    search for each tuple would). Only at those positions are the tuples' own patterns tried.
+    """
+
+    def __init__(self, tuples):
+        self.tuples = tuples
+        # the last synonym in each tuple is the canonical form
+        self.canonical = [syn_tup[-1] for syn_tup in tuples]
+        # patterns as used previously for each tuple, i.e. including any non-word characters either side
+        self.patterns = [
+            re.compile(
+                r'((?:^|\W)' + r'(?:$|\W)|(?:^|\W)'.join(syn_tup) + r'(?:$|\W))',
+                re.IGNORECASE) for syn_tup in tuples]
+        if tuples:
+            self.regex = re.compile(
+                r'(?=(?:^|\W)(?:' + '|'.join([x for y in tuples for x in y]) + r')(?:$|\W))',
+                re.IGNORECASE)
+        else:
+            self.regex = None
+        # just list anything that is a synonym (with word boundary markers)
+        self.word_pattern = '|'.join(
+            [r'(?:^|\W|\b)' + x + r'(?:$|\W)' for y in tuples for x in y])
+        self.found = {}
+        self.listify_regexes = {}
+
+    def canonize(self, s):
+        """
+        Make synonyms equal: replace the first occurrence of each tuple's synonyms by the canonical form
+        :param s: A string
+        :return: canonized string
+        """
+        if self.regex is None:
+            return s
+        first_matches = {}
+        for match in self.regex.finditer(s):
+            position = match.start()
+            for syn_ind, pattern in enumerate(self.patterns):
+                if syn_ind not in first_matches:
+                    syn_match = pattern.match(s, position)
+                    if syn_match:
+                        first_matches[syn_ind] = syn_match.group()
+            if len(first_matches) == len(self.patterns):
+                break
+        s_canon = s
+        for syn_ind in sorted(first_matches):
+            s_canon = s_canon.replace(first_matches[syn_ind].strip(), self.canonical[syn_ind])
+        return s_canon
+
+    def find(self, reg_item):
+        """
+        Extend regex item to include synonyms
+        :param reg_item: A regex portion
+        :return: reg_new: A replacement for reg_item that includes all its synonyms
+         (if reg_item matches the last in a synonym tuple), and a list of all those synonyms
+        """
+        if reg_item not in self.found:
+            syn_others = []
+            syn_all = []
+            regex = re.compile(r'^\s*' + reg_item + r'\s*$', re.IGNORECASE)
+            for syn_tup in self.tuples:
+                if regex.match(syn_tup[-1]):
+                    syn_others += syn_tup[:-1]
+                    syn_all += syn_tup
+            reg_new = reg_item
+            if syn_others:
+                reg_new = '(?:' + ')|(?:'.join(syn_others) + \
+                    ')|(?:' + reg_item + ')'
+            self.found[reg_item] = (reg_new, syn_all)
+        return self.found[reg_item]
+
+    def get_listify_regexes(self, split_hyphenated):
+        """
+        :param split_hyphenated: cwp_split_hyphenated option
+        :return: dict of the regexes used by listify (each compiled once):
+            'regex_1': opus numbers and keys
+            'regex_2': synonyms and remaining words
+            'all_synonyms_lists': synonyms lists for the opus and key groups of regex_1
+        """
+        if split_hyphenated not in self.listify_regexes:
+            op_groups, op_all = self.find(OPUS_ITEM)
+            notes_groups, notes_all = self.find(NOTES_ITEM)
+            sharp_groups, sharp_all = self.find(r'sharp')
+            flat_groups, flat_all = self.find(r'flat')
+            major_groups, major_all = self.find(r'major')
+            minor_groups, minor_all = self.find(r'minor')
+            opus_pattern = r"(?:\b((?:(" + op_groups + \
+                r"))\W?\s?\d+\-?\u2013?\u2014?\d*\w*)\b)"
+            note_pattern = r"(\b" + notes_groups + r")"
+            accent_pattern = r"(?:\-(" + sharp_groups + r")(?:\s+|\b)|\-(" + flat_groups + r")(?:\s+|\b)|\s(" + \
+                             sharp_groups + r")(?:\s+|\b)|\s(" + flat_groups + \
+                             r")(?:\s+|\b)|\u266F(?:\s+|\b)|\u266D(?:\s+|\b)|(?:[:,.]?\s+|$|\-))"
+            scale_pattern = r"(?:((" + major_groups + \
+                r")|(" + minor_groups + r"))?\b)"
+            key_pattern = note_pattern + accent_pattern + scale_pattern
+            # The regex is split into two iterations as putting it all together can have unpredictable consequences
+            # - may match synonyms before op's even though that is later in the string
+            # First match the op's and keys
+            regex_1 = opus_pattern + r"|(" + key_pattern + r")"
+            # Then match the synonyms and remaining words
+            if split_hyphenated:
+                regex_2 = r"(" + self.word_pattern + r")|" + HYPHEN_SPLIT_PATTERN
+                # allow ampersands and non-latin characters as word characters. Treat apostrophes as part of words.
+                # Treat opus and catalogue entries - e.g. K. 657 or OP.5 or op. 35a or CD 144 or BWV 243a - as one word
+                # also treat ranges of opus numbers (connected by dash, en dash or
+                # em dash) as one word
+            else:
+                regex_2 = r"(" + self.word_pattern + r")|" + HYPHEN_EMBED_PATTERN
+                # as previous but also treat embedded hyphens as part of words.
+            self.listify_regexes[split_hyphenated] = {
+                'regex_1': re.compile(regex_1, re.UNICODE | re.IGNORECASE),
+                'regex_2': re.compile(regex_2, re.UNICODE | re.IGNORECASE),
+                'all_synonyms_lists': [
+                    op_all,
+                    notes_all,
+                    sharp_all,
+                    flat_all,
+                    sharp_all,
+                    flat_all,
+                    major_all,
+                    minor_all]}
+        return self.listify_regexes[split_hyphenated]
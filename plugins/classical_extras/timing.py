@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of the main processing phases for Picard Classical Extras plugin
+Each phase's time (inclusive of any other phases called within it) and number of calls are accumulated per release
+for the session log. A single release can also be profiled with cProfile.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import cProfile
+import inspect
+import os
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+from picard import log
+
+# release id -> {phase: [calls, seconds, active calls]}
+_phases = {}
+
+# release id -> number of timed calls running
+_active = {}
+
+# release id -> function to be called with the report when the timed calls running have returned
+_pending_reports = {}
+
+# release id -> cProfile.Profile
+_profiles = {}
+
+
+def _start(release_id, phase):
+    phases = _phases.setdefault(release_id, {})
+    timing = phases.get(phase)
+    if timing is None:
+        timing = phases[phase] = [0, 0.0, 0]
+    timing[0] += 1
+    timing[2] += 1
+    _active[release_id] = _active.get(release_id, 0) + 1
+    return timing
+
+
+def _stop(release_id, timing, elapsed):
+    timing[2] -= 1
+    # for recursive calls, only the outermost is timed
+    if not timing[2]:
+        timing[1] += elapsed
+    _active[release_id] -= 1
+    if not _active[release_id]:
+        del _active[release_id]
+        callback = _pending_reports.pop(release_id, None)
+        if callback is not None:
+            _call_with_report(release_id, callback)
+
+
+def _call_with_report(release_id, callback):
+    try:
+        callback(report(release_id))
+    except Exception:
+        log.error('Classical Extras: error reporting timings for release %s', release_id, exc_info=True)
+
+
+@contextmanager
+def phase(release_id, name):
+    """
+    Time a block of code
+    :param release_id:
+    :param name: phase name
+    :return:
+    """
+    timing = _start(release_id, name)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        _stop(release_id, timing, perf_counter() - start)
+
+
+def timed(name, get_release_id=None):
+    """
+    Decorator to time each call of a function or method
+    :param name: phase name
+    :param get_release_id: function called with the same arguments, to return the release id -
+    if not given, the function's release_id argument is used
+    :return:
+    """
+    def decorator(func):
+        if get_release_id is None:
+            position = list(inspect.signature(func).parameters).index('release_id')
+
+            def release_id_of(*args, **kwargs):
+                return args[position] if len(args) > position else kwargs['release_id']
+        else:
+            release_id_of = get_release_id
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            release_id = release_id_of(*args, **kwargs)
+            timing = _start(release_id, name)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _stop(release_id, timing, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def report(release_id):
+    """
+    Remove the timings for a release (any calls still running are not included)
+    :param release_id:
+    :return: list of (phase, seconds, calls), longest first
+    """
+    phases = _phases.pop(release_id, {})
+    return sorted(
+        [(name, timing[1], timing[0]) for name, timing in phases.items()],
+        key=lambda x: x[1],
+        reverse=True)
+
+
+def report_when_done(release_id, callback):
+    """
+    Report the timings for a release once all the timed calls running for it have returned
+    (immediately if there are none), so that the report is complete and its phases are not started again
+    by the calls still running
+    :param release_id:
+    :param callback: function called with the report (see report)
+    :return:
+    """
+    if release_id in _active:
+        _pending_reports[release_id] = callback
+    else:
+        _call_with_report(release_id, callback)
+
+
+def start_profile(release_id):
+    """
+    Start profiling (if not already started for this release)
+    NB everything run while the release is being processed is included, which may be work for other releases
+    :param release_id:
+    :return:
+    """
+    if release_id not in _profiles:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active
+            log.error('Classical Extras: unable to profile release %s', release_id, exc_info=True)
+            return
+        _profiles[release_id] = profile
+
+
+def stop_profile(release_id, path):
+    """
+    Stop profiling a release and save the statistics (for use with pstats)
+    :param release_id:
+    :param path: statistics file
+    :return: path, or None if the release was not being profiled or the file could not be written
+    """
+    profile = _profiles.pop(release_id, None)
+    if profile is None:
+        return None
+    profile.disable()
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        profile.dump_stats(path)
+    except OSError:
+        log.error('Classical Extras: unable to write profile %s', path, exc_info=True)
+        return None
+    return path
+
+
+def discard(release_id):
+    """
+    Discard any timings and profile for a release
+    :param release_id:
+    :return:
+    """
+    _phases.pop(release_id, None)
+    _pending_reports.pop(release_id, None)
+    profile = _profiles.pop(release_id, None)
+    if profile is not None:
+        profile.disable()
+
+
+def sizes():
+    return {
+        'timed releases': len(_phases),
+        'pending timing reports': len(_pending_reports),
+        'profiled releases': len(_profiles)}
@@ -819,6 +819,9 @@ class Ui_ClassicalExtrasOptionsPage(object):
         self.use_cache = QtWidgets.QCheckBox(self.works_run_frame)
         self.use_cache.setObjectName("use_cache")
         self.horizontalLayout_3.addWidget(self.use_cache)
+        self.cwp_persistent_cache = QtWidgets.QCheckBox(self.works_run_frame)
+        self.cwp_persistent_cache.setObjectName("cwp_persistent_cache")
+        self.horizontalLayout_3.addWidget(self.cwp_persistent_cache)
         self.verticalLayout_25.addWidget(self.works_run_frame)
         self.work_style_frame = QtWidgets.QFrame(self.scrollAreaWidgetContents_3)
         self.work_style_frame.setFrameShape(QtWidgets.QFrame.StyledPanel)
@@ -4183,6 +4186,7 @@ class Ui_ClassicalExtrasOptionsPage(object):
         self.cwp_titles.toggled['bool'].connect(self.source_of_canonical_box.setDisabled)
         self.cwp_titles.toggled['bool'].connect(self.partial_arrangements_medleys_frame.setHidden)
         self.use_cache.toggled['bool'].connect(self.cwp_use_sk.setEnabled)
+        self.use_cache.toggled['bool'].connect(self.cwp_persistent_cache.setEnabled)
         self.ce_show_ui_tags.toggled['bool'].connect(self.groupBox.setVisible)
         QtCore.QMetaObject.connectSlotsByName(ClassicalExtrasOptionsPage)
 
@@ -4295,6 +4299,9 @@ class Ui_ClassicalExtrasOptionsPage(object):
         self.use_cache.setToolTip(_translate("ClassicalExtrasOptionsPage", "<html><head/><body><p>Select to use cached works. Deselect to refesh from MusicBrainz.</p></body></html>"))
         self.use_cache.setWhatsThis(_translate("ClassicalExtrasOptionsPage", "<html><head/><body><p>&quot;Use cache&quot; prevents excessive look-ups of the MB database. Every look-up of a parent work needs to be performed separately (hopefully the MB database might make this easier some day). Network usage constraints by MB means that each look-up takes a minimum of 1 second. Once a release has been looked-up, the works are retained in cache, significantly reducing the time required if, say, the options are changed and the data refreshed. However, if the user edits the works in the MB database then the cache will need to be turned off temporarily for the refresh to find the new/changed works. Also some types of work (e.g. arrangements) will require a full look-up if options have been changed.</p></body></html>"))
         self.use_cache.setText(_translate("ClassicalExtrasOptionsPage", "Use cache (if available)*"))
+        self.cwp_persistent_cache.setToolTip(_translate("ClassicalExtrasOptionsPage", "<html><head/><body><p>Select to keep the works cache between sessions.</p></body></html>"))
+        self.cwp_persistent_cache.setWhatsThis(_translate("ClassicalExtrasOptionsPage", "<html><head/><body><p>&quot;Keep cache between sessions&quot; saves each work look-up in a file in the Classical_Extras folder of the Picard user directory, so that the works (and their parents) do not need to be looked up again when a release is re-loaded in a later session. Saved works are discarded after 30 days. Deselecting &quot;Use cache&quot; will refresh the saved works as well.</p></body></html>"))
+        self.cwp_persistent_cache.setText(_translate("ClassicalExtrasOptionsPage", "Keep cache between sessions"))
         self.work_style_label.setText(_translate("ClassicalExtrasOptionsPage", "<html><head/><body><p><span style=\" font-weight:600;\">Tagging style</span></p></body></html>"))
         self.work_style_box.setWhatsThis(_translate("ClassicalExtrasOptionsPage", "<!DOCTYPE HTML PUBLIC \"-//W3C//DTD HTML 4.0//EN\" \"http://www.w3.org/TR/REC-html40/strict.dtd\">\n"
 "<html><head><meta name=\"qrichtext\" content=\"1\" /><style type=\"text/css\">\n"
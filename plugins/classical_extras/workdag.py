@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Work hierarchy for Picard Classical Extras plugin
+Holds the parent of each work (as the works cache did) together with the inverse links and the
+ancestry of each work, updated as each work look-up is processed, so that the hierarchy for an album
+can be assembled from that album's own works rather than by searching everything looked up so far.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+
+class WorkDag(dict):
+    """
+    Mapping of work id tuple -> list of parent work ids, shared by all albums.
+    Setting or deleting an entry also maintains:
+        parent_ids: work id tuple -> tuple of parent work ids (the key used for the parent's own entries)
+        children: parent tuple -> child work id tuples, in the order in which they were added
+        lineages: work id tuple -> tuple of its ancestors, nearest first (memoized, and discarded
+        for a work and all its descendants when its parent changes)
+    The parent lists are also held (and sometimes extended in place) elsewhere, so the links for a work
+    are checked against its current list whenever they are read.
+    Only item assignment and deletion are used on the works cache, so the other dict methods are not covered.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parent_ids = {}
+        self.children = {}
+        self.lineages = {}
+
+    def __setitem__(self, workId, parentIds):
+        super().__setitem__(workId, parentIds)
+        self._link(workId)
+
+    def __delitem__(self, workId):
+        super().__delitem__(workId)
+        self._link(workId)
+
+    def _link(self, workId):
+        parentIds = tuple(self[workId]) if workId in self else None
+        old_parentIds = self.parent_ids.get(workId)
+        if parentIds == old_parentIds:
+            return
+        if old_parentIds is not None:
+            siblings = self.children[old_parentIds]
+            del siblings[workId]
+            if not siblings:
+                del self.children[old_parentIds]
+        if parentIds is None:
+            del self.parent_ids[workId]
+        else:
+            self.parent_ids[workId] = parentIds
+            # dict used as an ordered set
+            self.children.setdefault(parentIds, {})[workId] = None
+        self._forget_lineage(workId)
+
+    def _forget_lineage(self, workId):
+        stack = [workId]
+        seen = set()
+        while stack:
+            work = stack.pop()
+            if work in seen:
+                continue
+            seen.add(work)
+            self.lineages.pop(work, None)
+            stack.extend(self.children.get(work, ()))
+
+    def discard(self, workId):
+        """
+        Remove a work altogether (its entry, if it has one, and its memoized ancestry)
+        :param workId: work id tuple
+        :return:
+        """
+        if workId in self:
+            del self[workId]
+        self.lineages.pop(workId, None)
+
+    def parents(self, workId):
+        """
+        :param workId: work id tuple
+        :return: tuple of parent work ids, or None if the work has no entry
+        """
+        if workId not in self:
+            return None
+        self._link(workId)
+        return self.parent_ids[workId]
+
+    def lineage(self, workId):
+        """
+        :param workId: work id tuple
+        :return: tuple of the ancestors of the work, nearest first
+        (stopping before any work that would repeat, in case of a cycle in the data)
+        """
+        works = [workId]
+        cycle = False
+        while works[-1] not in self.lineages:
+            parentIds = self.parents(works[-1])
+            if parentIds is None:
+                break
+            if parentIds in works:
+                cycle = True
+                break
+            works.append(parentIds)
+        if cycle:
+            return tuple(works[1:])
+        lineage = self.lineages.get(works[-1], ())
+        self.lineages[works[-1]] = lineage
+        for i in range(len(works) - 2, -1, -1):
+            lineage = (works[i + 1],) + lineage
+            self.lineages[works[i]] = lineage
+        return lineage
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent store of MusicBrainz work look-ups for Picard Classical Extras plugin
+Keeps the JSON response of each /ws/2/work/<id> look-up in an SQLite database so that
+the parent hierarchy of a work does not need to be fetched again in a later session.
+"""
+# Copyright (C) 2018 Mark Evens
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import json
+import os
+import sqlite3
+import time
+
+from picard import log
+
+
+class WorksStore():
+    """
+    Work look-up responses keyed by work id and a version stamp.
+    The version stamp is the 'inc=' query argument used for the look-up, so a response
+    fetched with different includes (e.g. with or without user tags) is never re-used.
+    Entries older than ttl seconds are ignored and, once there are more than max_entries,
+    the least recently used entries are evicted.
+    The database is only opened on first use; any database error disables the store
+    for the rest of the session (the plugin then simply falls back to network look-ups).
+    """
+    SCHEMA = 1
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.connection = None
+        self.disabled = False
+        self.puts = 0
+
+    def _connect(self):
+        if self.connection is None and not self.disabled:
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                self.connection = sqlite3.connect(self.path, isolation_level=None)
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+                version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+                if version != self.SCHEMA:
+                    self.connection.execute('DROP TABLE IF EXISTS works')
+                    self.connection.execute('PRAGMA user_version=%d' % self.SCHEMA)
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS works ('
+                    'work_id TEXT NOT NULL, '
+                    'version TEXT NOT NULL, '
+                    'fetched REAL NOT NULL, '
+                    'accessed REAL NOT NULL, '
+                    'data TEXT NOT NULL, '
+                    'PRIMARY KEY (work_id, version))')
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS works_accessed ON works (accessed)')
+                self.connection.execute(
+                    'DELETE FROM works WHERE fetched < ?', (time.time() - self.ttl,))
+            except (sqlite3.Error, OSError):
+                log.error('Classical Extras: unable to open works cache %s', self.path, exc_info=True)
+                self.disable()
+        return self.connection
+
+    def get(self, work_id, version):
+        """
+        :param work_id: MusicBrainz work id
+        :param version: version stamp (inc= query argument)
+        :return: the stored JSON response or None if there is no current entry
+        """
+        connection = self._connect()
+        if connection is None:
+            return None
+        now = time.time()
+        try:
+            row = connection.execute(
+                'SELECT fetched, data FROM works WHERE work_id = ? AND version = ?',
+                (work_id, version)).fetchone()
+            if row is None:
+                return None
+            if row[0] < now - self.ttl:
+                connection.execute(
+                    'DELETE FROM works WHERE work_id = ? AND version = ?', (work_id, version))
+                return None
+            connection.execute(
+                'UPDATE works SET accessed = ? WHERE work_id = ? AND version = ?',
+                (now, work_id, version))
+            return json.loads(row[1])
+        except sqlite3.Error:
+            log.error('Classical Extras: error reading works cache - not used for the rest of the session',
+                      exc_info=True)
+            self.disable()
+            return None
+        except ValueError:
+            log.error('Classical Extras: error reading works cache', exc_info=True)
+            return None
+
+    def put(self, work_id, version, data):
+        """
+        Store a look-up response, evicting the least recently used entries if the store is full
+        :param work_id: MusicBrainz work id
+        :param version: version stamp (inc= query argument)
+        :param data: JSON response (dict)
+        :return:
+        """
+        connection = self._connect()
+        if connection is None:
+            return
+        now = time.time()
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO works (work_id, version, fetched, accessed, data) VALUES (?, ?, ?, ?, ?)',
+                (work_id, version, now, now, json.dumps(data)))
+            self.puts += 1
+            # only check the size occasionally - counting is not free on a large table
+            if self.puts % 100 == 1:
+                count = connection.execute('SELECT COUNT(*) FROM works').fetchone()[0]
+                if count > self.max_entries:
+                    connection.execute(
+                        'DELETE FROM works WHERE rowid IN '
+                        '(SELECT rowid FROM works ORDER BY accessed LIMIT ?)',
+                        (count - self.max_entries,))
+        except sqlite3.Error:
+            log.error('Classical Extras: error writing works cache - not used for the rest of the session',
+                      exc_info=True)
+            self.disable()
+        except (TypeError, ValueError):
+            log.error('Classical Extras: error writing works cache', exc_info=True)
+
+    def disable(self):
+        self.close()
+        self.disabled = True
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+        self.connection = None
@@ -6,12 +6,15 @@ PLUGIN_DESCRIPTION = 'Use tags from Last.fm as genre.'
 PLUGIN_VERSION = "0.10"
 PLUGIN_API_VERSIONS = ["2.0"]
 
+import os
 import re
-from functools import partial
+from functools import lru_cache, partial
 from PyQt5 import QtCore
 from picard import config, log
 from picard.config import BoolOption, IntOption, TextOption
+from picard.const import USER_DIR
 from picard.metadata import register_track_metadata_processor
+from picard.plugins.lastfm.tagcache import TagCache
 from picard.plugins.lastfm.ui_options_lastfm import Ui_LastfmOptionsPage
 from picard.ui.options import register_options_page, OptionsPage
 from picard.util import build_qurl
@@ -27,13 +30,25 @@ LASTFM_API_KEY = '0a210a4a6741f2ec8f27a791b9d5d971'
 # second, averaged over a 5 minute period, without prior written consent. […]
 ratecontrol.set_minimum_delay((LASTFM_HOST, LASTFM_PORT), 200)
 
-# Cache for Tags to avoid re-requesting tags within same Picard session
+# Cache for Tags to avoid re-requesting tags within same Picard session.
+# Holds the tags as returned by Last.fm, as lists of (name, count): the
+# filtering options are applied each time the tags are used.
 _cache = {}
 
+# Tags are also kept between sessions, for CACHE_TTL seconds
+CACHE_TTL = 14 * 24 * 60 * 60
+_tag_cache = TagCache(os.path.join(USER_DIR, 'lastfm_tags.sqlite'), CACHE_TTL)
+
 # Keeps track of requests for tags made to webservice API but not yet returned
-# (to avoid re-requesting the same URIs)
+# (to avoid re-requesting the same URIs): URL -> functions to pass the tags to
 _pending_requests = {}
 
+# Tags being collected for albums whose tracks are being processed
+_album_tags = {}
+
+# Numbers of tag look-ups needed by tracks, and of requests actually sent
+_counts = {'lookups': 0, 'requests': 0}
+
 # TODO: move this to an options page
 TRANSLATE_TAGS = {
     "hip hop": "Hip-Hop",
@@ -43,110 +58,112 @@ TRANSLATE_TAGS = {
 TITLE_CASE = True
 
 
+# Flags of an expression without any inline flags
+_DEFAULT_FLAGS = re.compile('').flags
+
+
+class IgnoreTagsMatcher(object):
+    """Matches tags against the ignored tags setting.
+
+    Plain tags are held in a set, and the regular expressions are combined
+    into one alternation, so matching a tag takes one look-up and at most one
+    expression match. Expressions with groups or inline flags, which could
+    change meaning when combined, are kept apart.
+    """
+
+    def __init__(self, literals, patterns):
+        self.literals = frozenset(literals)
+        simple = []
+        others = []
+        for pattern in patterns:
+            if not pattern.groups and pattern.flags == _DEFAULT_FLAGS:
+                simple.append(pattern)
+            else:
+                others.append(pattern)
+        if len(simple) > 1:
+            try:
+                simple = [re.compile(
+                    '|'.join('(?:%s)' % p.pattern for p in simple))]
+            except re.error:
+                pass
+        self.patterns = simple + others
+
+    def matches(self, tag):
+        tag = tag.lower().strip()
+        if tag in self.literals:
+            return True
+        for pattern in self.patterns:
+            if pattern.match(tag):
+                return True
+        return False
+
+
+@lru_cache(maxsize=8)
 def parse_ignored_tags(ignore_tags_setting):
-    ignore_tags = []
+    literals = []
+    patterns = []
     for tag in ignore_tags_setting.lower().split(','):
         tag = tag.strip()
         if tag.startswith('/') and tag.endswith('/'):
             try:
-                tag = re.compile(tag[1:-1])
+                patterns.append(re.compile(tag[1:-1]))
+                continue
             except re.error:
                 log.error(
                     'Error parsing ignored tag "%s"', tag, exc_info=True)
-        ignore_tags.append(tag)
-    return ignore_tags
-
-
-def matches_ignored(ignore_tags, tag):
-    tag = tag.lower().strip()
-    for pattern in ignore_tags:
-        if hasattr(pattern, 'match'):
-            match = pattern.match(tag)
-        else:
-            match = pattern == tag
-        if match:
-            return True
-    return False
+        literals.append(tag)
+    return IgnoreTagsMatcher(literals, patterns)
 
 
-def _tags_finalize(album, metadata, tags, next_):
-    if next_:
-        next_(tags)
-    else:
-        tags = list(set(tags))
-        if tags:
-            join_tags = config.setting["lastfm_join_tags"]
-            if join_tags:
-                tags = join_tags.join(tags)
-            metadata["genre"] = tags
+def filter_tags(raw_tags, min_usage, ignore):
+    """Apply the tag options to a list of (name, count), most used first."""
+    tags = []
+    for name, count in raw_tags:
+        if count < min_usage:
+            break
+        try:
+            name = TRANSLATE_TAGS[name]
+        except KeyError:
+            pass
+        if not ignore.matches(name):
+            tags.append(name.title())
+    return tags
+
 
+def _set_genre(metadata, tags):
+    tags = list(set(tags))
+    if tags:
+        join_tags = config.setting["lastfm_join_tags"]
+        if join_tags:
+            tags = join_tags.join(tags)
+        metadata["genre"] = tags
 
-def _tags_downloaded(album, metadata, min_usage, ignore, next_, current, data,
-                     reply, error):
-    if error:
-        album._requests -= 1
-        album._finalize_loading(None)
-        return
 
+def _tags_downloaded(url, data, reply, error):
+    raw_tags = None
     try:
-        try:
-            intags = data.lfm[0].toptags[0].tag
-        except AttributeError:
-            intags = []
-        tags = []
-        for tag in intags:
-            name = tag.name[0].text.strip()
-            try:
-                count = int(tag.count[0].text.strip())
-            except ValueError:
-                count = 0
-            if count < min_usage:
-                break
+        if not error:
             try:
-                name = TRANSLATE_TAGS[name]
-            except KeyError:
-                pass
-            if not matches_ignored(ignore, name):
-                tags.append(name.title())
-        url = reply.url().toString()
-        _cache[url] = tags
-        _tags_finalize(album, metadata, current + tags, next_)
-
-        # Process any pending requests for the same URL
-        if url in _pending_requests:
-            pending = _pending_requests[url]
-            del _pending_requests[url]
-            for delayed_call in pending:
-                delayed_call()
-
+                intags = data.lfm[0].toptags[0].tag
+            except AttributeError:
+                intags = []
+            raw_tags = []
+            for tag in intags:
+                name = tag.name[0].text.strip()
+                try:
+                    count = int(tag.count[0].text.strip())
+                except ValueError:
+                    count = 0
+                raw_tags.append((name, count))
+            _cache[url] = raw_tags
+            _tag_cache.put(url, raw_tags)
     except Exception:
         log.error('Problem processing download tags', exc_info=True)
+        raw_tags = None
     finally:
-        album._requests -= 1
-        album._finalize_loading(None)
-
-
-def get_tags(album, metadata, queryargs, min_usage, ignore, next_, current):
-    """Get tags from an URL."""
-    url = build_qurl(
-        LASTFM_HOST, LASTFM_PORT, LASTFM_PATH, queryargs).toString()
-    if url in _cache:
-        _tags_finalize(album, metadata, current + _cache[url], next_)
-    else:
-        # If we have already sent a request for this URL, delay this call
-        if url in _pending_requests:
-            _pending_requests[url].append(
-                partial(get_tags, album, metadata, queryargs, min_usage,
-                        ignore, next_, current))
-        else:
-            _pending_requests[url] = []
-            album._requests += 1
-            album.tagger.webservice.get(
-                LASTFM_HOST, LASTFM_PORT, LASTFM_PATH,
-                partial(_tags_downloaded, album, metadata, min_usage, ignore,
-                        next_, current),
-                queryargs=queryargs, parse_response_type='xml',
-                priority=True, important=True)
+        # Pass the tags (None on error) to everything waiting for this URL
+        for received in _pending_requests.pop(url, []):
+            received(raw_tags)
 
 
 def encode_str(s):
@@ -160,47 +177,131 @@ def get_queryargs(queryargs):
     return queryargs
 
 
-def get_track_tags(album, metadata, artist, track, min_usage,
-                   ignore, next_, current):
-    """Get track top tags."""
-    queryargs = get_queryargs({
-        'method': 'Track.getTopTags',
-        'artist': artist,
-        'track': track,
-    })
-    get_tags(album, metadata, queryargs, min_usage, ignore, next_, current)
-
-
-def get_artist_tags(album, metadata, artist, min_usage,
-                    ignore, next_, current):
-    """Get artist top tags."""
-    queryargs = get_queryargs({
-        'method': 'Artist.getTopTags',
-        'artist': artist,
-    })
-    get_tags(album, metadata, queryargs, min_usage, ignore, next_, current)
+class AlbumTags(object):
+    """Tags wanted for the tracks of one album.
+
+    The tracks of an album are all processed in the same pass of the event
+    loop, so the tags each track needs are only noted here, and requested
+    once the album's tracks have all been seen. Each artist and each
+    (artist, title) is then looked up once however many tracks share it, and
+    the genres of all the tracks are set in one step when the last of the
+    album's tags has arrived.
+    """
+
+    def __init__(self, album):
+        self.album = album
+        self.min_usage = config.setting["lastfm_min_tag_usage"]
+        self.ignore = parse_ignored_tags(config.setting["lastfm_ignore_tags"])
+        # (metadata, keys) for each track
+        self.tracks = []
+        # key -> query arguments, for each key needed by the album
+        self.queryargs = {}
+        # key -> list of (name, count), or None if the request failed
+        self.raw_tags = {}
+        self.waiting = 0
+        self.lookups = 0
+        self.requests = 0
+
+    def add_track(self, metadata, artist, title, use_track_tags,
+                  use_artist_tags):
+        keys = []
+        if title and use_track_tags:
+            keys.append(('track', artist, title))
+            self._add_key(keys[-1], {
+                'method': 'Track.getTopTags',
+                'artist': artist,
+                'track': title,
+            })
+        if use_artist_tags:
+            keys.append(('artist', artist))
+            self._add_key(keys[-1], {
+                'method': 'Artist.getTopTags',
+                'artist': artist,
+            })
+        if keys:
+            self.tracks.append((metadata, keys))
+
+    def _add_key(self, key, queryargs):
+        self.lookups += 1
+        if key not in self.queryargs:
+            self.queryargs[key] = get_queryargs(queryargs)
+
+    def request(self):
+        """Request each of the album's tags not already cached."""
+        del _album_tags[self.album]
+        self.waiting = len(self.queryargs)
+        for key, queryargs in self.queryargs.items():
+            url = build_qurl(
+                LASTFM_HOST, LASTFM_PORT, LASTFM_PATH, queryargs).toString()
+            if url not in _cache:
+                raw_tags = _tag_cache.get(url)
+                if raw_tags is not None:
+                    _cache[url] = raw_tags
+            if url in _cache:
+                self.received(key, _cache[url])
+            elif url in _pending_requests:
+                # already requested, for another album
+                _pending_requests[url].append(partial(self.received, key))
+            else:
+                _pending_requests[url] = [partial(self.received, key)]
+                self.requests += 1
+                self.album.tagger.webservice.get(
+                    LASTFM_HOST, LASTFM_PORT, LASTFM_PATH,
+                    partial(_tags_downloaded, url),
+                    queryargs=queryargs, parse_response_type='xml',
+                    priority=True, important=True)
+        if not self.queryargs:
+            self.finish()
+
+    def received(self, key, raw_tags):
+        self.raw_tags[key] = raw_tags
+        self.waiting -= 1
+        if not self.waiting:
+            self.finish()
+
+    def finish(self):
+        try:
+            tags = {}
+            for key, raw_tags in self.raw_tags.items():
+                if raw_tags is not None:
+                    tags[key] = filter_tags(raw_tags, self.min_usage,
+                                            self.ignore)
+            for metadata, keys in self.tracks:
+                # as before, a track whose tags could not all be loaded is
+                # left unchanged
+                if all(key in tags for key in keys):
+                    _set_genre(metadata, sum((tags[key] for key in keys), []))
+            _counts['lookups'] += self.lookups
+            _counts['requests'] += self.requests
+            log.debug(
+                'Last.fm: %d tag look-ups for %d tracks, %d requests sent '
+                '(%d saved, %d this session)',
+                self.lookups, len(self.tracks), self.requests,
+                self.lookups - self.requests,
+                _counts['lookups'] - _counts['requests'])
+        except Exception:
+            log.error('Problem setting tags', exc_info=True)
+        finally:
+            self.album._requests -= 1
+            self.album._finalize_loading(None)
 
 
 def process_track(album, metadata, track, release):
     use_track_tags = config.setting["lastfm_use_track_tags"]
     use_artist_tags = config.setting["lastfm_use_artist_tags"]
-    min_tag_usage = config.setting["lastfm_min_tag_usage"]
-    ignore_tags = parse_ignored_tags(config.setting["lastfm_ignore_tags"])
     if use_track_tags or use_artist_tags:
         artist = metadata["artist"]
         title = metadata["title"]
         if artist:
-            if use_artist_tags:
-                get_artist_tags_func = partial(get_artist_tags, album,
-                                               metadata, artist, min_tag_usage,
-                                               ignore_tags, None)
-            else:
-                get_artist_tags_func = None
-            if title and use_track_tags:
-                get_track_tags(album, metadata, artist, title, min_tag_usage,
-                               ignore_tags, get_artist_tags_func, [])
-            elif get_artist_tags_func:
-                get_artist_tags_func([])
+            album_tags = _album_tags.get(album)
+            if album_tags is None:
+                album_tags = _album_tags[album] = AlbumTags(album)
+                # hold the album until its tags are set, and request them once
+                # the rest of its tracks have been added
+                album._requests += 1
+                QtCore.QTimer.singleShot(0, album_tags.request)
+            album_tags.add_track(metadata, artist, title, use_track_tags,
+                                 use_artist_tags)
 
 
 class LastfmOptionsPage(OptionsPage):
@@ -232,11 +333,8 @@ class LastfmOptionsPage(OptionsPage):
         self.ui.join_tags.setEditText(setting["lastfm_join_tags"])
 
     def save(self):
-        global _cache
+        # the cached tags are unfiltered, so they stay valid when the options change
         setting = config.setting
-        if setting["lastfm_min_tag_usage"] != self.ui.min_tag_usage.value() \
-           or setting["lastfm_ignore_tags"] != str(self.ui.ignore_tags.text()):
-            _cache = {}
         setting["lastfm_use_track_tags"] = self.ui.use_track_tags.isChecked()
         setting["lastfm_use_artist_tags"] = self.ui.use_artist_tags.isChecked()
         setting["lastfm_min_tag_usage"] = self.ui.min_tag_usage.value()
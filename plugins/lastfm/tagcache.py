@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+import time
+
+from picard import log
+
+
+class TagCache:
+    """Persistent cache of the top tags returned by Last.fm, keyed by request URL.
+
+    The tags are stored as returned (name and count, before any filtering), so
+    the cached entries stay valid when the plugin options change. Entries older
+    than ttl seconds are ignored and removed. The database is opened on first
+    use; on any database error the cache is disabled for the rest of the
+    session and tags are simply requested again.
+    """
+
+    SCHEMA = 1
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.connection = None
+        self.disabled = False
+
+    def _connect(self):
+        if self.connection is None and not self.disabled:
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                self.connection = sqlite3.connect(self.path, isolation_level=None)
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+                version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+                if version != self.SCHEMA:
+                    self.connection.execute('DROP TABLE IF EXISTS tags')
+                    self.connection.execute('PRAGMA user_version=%d' % self.SCHEMA)
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS tags ('
+                    'url TEXT PRIMARY KEY, '
+                    'fetched REAL NOT NULL, '
+                    'data TEXT NOT NULL)')
+                self.connection.execute(
+                    'DELETE FROM tags WHERE fetched < ?',
+                    (time.time() - self.ttl,))
+            except (sqlite3.Error, OSError):
+                log.error('Last.fm: unable to open tag cache %s', self.path,
+                          exc_info=True)
+                self.disable()
+        return self.connection
+
+    def get(self, url):
+        """Return the cached list of (name, count) for url, or None."""
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                'SELECT fetched, data FROM tags WHERE url = ?',
+                (url,)).fetchone()
+            if row is None or row[0] < time.time() - self.ttl:
+                return None
+            return [(name, count) for name, count in json.loads(row[1])]
+        except sqlite3.Error:
+            log.error('Last.fm: error reading tag cache, not used for the rest '
+                      'of the session', exc_info=True)
+            self.disable()
+            return None
+        except (ValueError, TypeError):
+            log.error('Last.fm: error reading tag cache', exc_info=True)
+            return None
+
+    def put(self, url, tags):
+        """Store the list of (name, count) returned for url."""
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO tags (url, fetched, data) VALUES (?, ?, ?)',
+                (url, time.time(), json.dumps(tags)))
+        except sqlite3.Error:
+            log.error('Last.fm: error writing tag cache, not used for the rest '
+                      'of the session', exc_info=True)
+            self.disable()
+        except (ValueError, TypeError):
+            log.error('Last.fm: error writing tag cache', exc_info=True)
+
+    def disable(self):
+        self.close()
+        self.disabled = True
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+        self.connection = None
@@ -13,10 +13,14 @@ PLUGIN_API_VERSIONS = ["2.0", "2.1", "2.2"]
 PLUGIN_LICENSE = 'WTFPL'
 PLUGIN_LICENSE_URL = 'http://www.wtfpl.net/'
 
+import os
 import re
-from functools import partial
+from functools import lru_cache, partial
+from PyQt5 import QtCore
 from picard import config, log
+from picard.const import USER_DIR
 from picard.metadata import register_track_metadata_processor
+from picard.plugins.wikidata.genrecache import GenreCache
 from picard.plugins.wikidata.ui_options_wikidata import Ui_WikidataOptionsPage
 from picard.ui.options import register_options_page, OptionsPage
 from picard.webservice import ratecontrol
@@ -24,37 +28,78 @@ from picard.webservice import ratecontrol
 
 WIKIDATA_HOST = 'www.wikidata.org'
 WIKIDATA_PORT = 443
+WIKIDATA_API_PATH = '/w/api.php'
+# Most entities the Wikidata API returns for one request
+WIKIDATA_BATCH = 50
 
 ratecontrol.set_minimum_delay((WIKIDATA_HOST, WIKIDATA_PORT), 0)
 
+# Wikidata ids, genres and labels are kept between sessions for CACHE_TTL seconds
+CACHE_TTL = 30 * 24 * 60 * 60
 
+
+# Flags of an expression without any inline flags
+_DEFAULT_FLAGS = re.compile('').flags
+
+
+class IgnoreTagsMatcher:
+    """
+    Ignored genres or artists, from a setting: the plain names as a set, and the
+    regular expressions as one combined expression where they can be (those with
+    groups or inline flags are kept apart)
+    """
+
+    def __init__(self, literals, patterns):
+        self.literals = frozenset(literals)
+        simple = []
+        others = []
+        for pattern in patterns:
+            if not pattern.groups and pattern.flags == _DEFAULT_FLAGS:
+                simple.append(pattern)
+            else:
+                others.append(pattern)
+        if len(simple) > 1:
+            try:
+                simple = [re.compile('|'.join('(?:%s)' % p.pattern for p in simple))]
+            except re.error:
+                pass
+        self.patterns = simple + others
+
+    def __bool__(self):
+        return bool(self.literals or self.patterns)
+
+    def matches(self, tag):
+        tag = tag.lower().strip()
+        if tag in self.literals:
+            return True
+        for pattern in self.patterns:
+            if pattern.match(tag):
+                return True
+        return False
+
+
+# parsed once for each value of a setting
+@lru_cache(maxsize=8)
 def parse_ignored_tags(ignore_tags_setting):
-    ignore_tags = []
+    literals = []
+    patterns = []
     for tag in ignore_tags_setting.lower().split(','):
         if not tag:
             break
         tag = tag.strip()
         if tag.startswith('/') and tag.endswith('/'):
             try:
-                tag = re.compile(tag[1:-1])
+                patterns.append(re.compile(tag[1:-1]))
+                continue
             except re.error:
                 log.error(
                     'Error parsing ignored tag "%s"', tag, exc_info=True)
-        ignore_tags.append(tag)
-    return ignore_tags
+        literals.append(tag)
+    return IgnoreTagsMatcher(literals, patterns)
 
 
 def matches_ignored(ignore_tags, tag):
-    if ignore_tags:
-        tag = tag.lower().strip()
-        for pattern in ignore_tags:
-            if hasattr(pattern, 'match'):
-                match = pattern.match(tag)
-            else:
-                match = pattern == tag
-            if match:
-                return True
-    return False
+    return bool(ignore_tags) and ignore_tags.matches(tag)
 
 
 class Wikidata:
@@ -63,6 +108,22 @@ class Wikidata:
     ARTIST = 2
     WORK = 3
 
+    SOURCE_TYPES = {
+        'release-group': RELEASE_GROUP,
+        'artist': ARTIST,
+        'work': WORK,
+    }
+
+    # Settings which the cached genres depend on
+    CACHE_SETTINGS = (
+        "wikidata_use_release_group_genres",
+        "wikidata_use_artist_genres",
+        "wikidata_use_artist_only_if_no_release",
+        "wikidata_ignore_genres_from_these_artists",
+        "wikidata_use_work_genres",
+        "wikidata_ignore_these_genres",
+    )
+
     def __init__(self):
         # Key: mbid, value: List of metadata entries to be updated when we have parsed everything
         self.requests = {}
@@ -73,6 +134,13 @@ class Wikidata:
         # cache, items that have been found
         # key: mbid, value: list of strings containing the genre's
         self.cache = {}
+        self.cache_counts = {'hits': 0, 'pending': 0, 'stored': 0, 'misses': 0}
+
+        # persistent cache of the Wikidata ids, genres and labels looked up
+        self.genre_cache = GenreCache(os.path.join(USER_DIR, 'wikidata_genres.sqlite'), CACHE_TTL)
+
+        # values of CACHE_SETTINGS when the cache was filled
+        self.settings = None
 
         # metabrainz url
         self.mb_host = ''
@@ -87,11 +155,17 @@ class Wikidata:
         self.use_artist_genres = False
         self.use_artist_only_if_no_release = False
         self.ignore_genres_from_these_artists = ''
-        self.ignore_genres_from_these_artists_list = []
+        self.ignore_genres_from_these_artists_list = parse_ignored_tags('')
         self.use_work_genres = True
         self.ignore_these_genres = ''
-        self.ignore_these_genres_list = []
+        self.ignore_these_genres_list = parse_ignored_tags('')
         self.genre_delimiter = ''
+        self.use_json_api = True
+
+        # QIDs to be requested from the Wikidata API, and the (item_id, genre_source_type) waiting for each
+        # QID requested
+        self.entity_queue = []
+        self.entity_waiting = {}
 
     # not used
     def process_release(self, album, metadata, release):
@@ -107,10 +181,12 @@ class Wikidata:
             self.process_request(metadata, album, item_id, item_type='artist')
 
     # Main processing function
-    # First see if we have already found what we need in the cache, finalize loading
+    # First see if we have already found what we need in the cache, or everything needed to find it in the
+    # persistent cache, and if so set the genres straight away
     # Next see if we are already looking for the item
     #   If we are, add this item to the list of items to be updated once we find what we are looking for.
     #   Otherwise we are the first one to look up this item, start a new request
+    #   (from the Wikidata ids in the persistent cache if they are there, or from MusicBrainz)
     # metadata, map containing the new metadata
     #
     def process_request(self, metadata, album, item_id, item_type):
@@ -119,11 +195,10 @@ class Wikidata:
         log.debug('WIKIDATA: Item type %s' % item_type)
         if item_id in self.cache:
             log.debug('WIKIDATA: Found item in cache')
+            self.cache_counts['hits'] += 1
             genre_list = self.cache[item_id]
-            new_genre = set(metadata.getall("genre"))
-            new_genre.update(genre_list)
-            #sort the new genre list so that they don't appear as new entries (not a change) next time
-            metadata["genre"] = self.genre_delimiter.join(sorted(new_genre))
+            if genre_list:
+                self.set_genres(item_id, self.SOURCE_TYPES[item_type], genre_list, [metadata])
             return
         else:
             # pending requests are handled by adding the metadata object to a
@@ -132,27 +207,65 @@ class Wikidata:
                 log.debug(
                     'WIKIDATA: Request already pending, add it to the list of items to update once this has been'
                     'found')
+                self.cache_counts['pending'] += 1
                 self.requests[item_id].append(metadata)
-            else:
-                self.requests[item_id] = [metadata]
-                self.itemAlbums[item_id] = album
-                album._requests += 1
-
-                log.debug('WIKIDATA: First request for this item')
-                log.debug('WIKIDATA: About to call Musicbrainz to look up %s ' % item_id)
-
-                path = '/ws/2/%s/%s' % (item_type, item_id)
-                queryargs = {"inc": "url-rels"}
-
-                self.ws.get(self.mb_host, self.mb_port, path, partial(self.musicbrainz_release_lookup, item_id,
-                                                                      metadata),
-                            parse_response_type="xml", priority=False, important=False, queryargs=queryargs)
+                return
+            genre_list = self.stored_genres(item_id)
+            if genre_list is not None:
+                log.debug('WIKIDATA: Found item in persistent cache')
+                self.cache_counts['stored'] += 1
+                if genre_list:
+                    self.set_genres(item_id, self.SOURCE_TYPES[item_type], genre_list, [metadata])
+                self.cache.setdefault(item_id, [])
+                return
+            self.cache_counts['misses'] += 1
+            self.requests[item_id] = [metadata]
+            self.itemAlbums[item_id] = album
+            qids = self.genre_cache.get('qids', item_id)
+            if qids:
+                log.debug('WIKIDATA: Wikidata ids found in persistent cache: %s' % qids)
+                for qid in qids:
+                    self.process_wikidata(self.SOURCE_TYPES[item_type], qid, item_id)
+                return
+            album._requests += 1
+
+            log.debug('WIKIDATA: First request for this item')
+            log.debug('WIKIDATA: About to call Musicbrainz to look up %s ' % item_id)
+
+            path = '/ws/2/%s/%s' % (item_type, item_id)
+            queryargs = {"inc": "url-rels"}
+
+            self.ws.get(self.mb_host, self.mb_port, path, partial(self.musicbrainz_release_lookup, item_id,
+                                                                  metadata),
+                        parse_response_type="xml", priority=False, important=False, queryargs=queryargs)
+
+    # Genres for an item from the persistent cache, with the settings applied
+    # returns None unless everything needed is there
+    def stored_genres(self, item_id):
+        qids = self.genre_cache.get('qids', item_id)
+        if qids is None:
+            return None
+        genre_list = []
+        for qid in qids:
+            genre_qids = self.genre_cache.get('genres', qid)
+            if genre_qids is None:
+                return None
+            for genre_qid in genre_qids:
+                label = self.genre_cache.get('labels', genre_qid)
+                if label is None:
+                    return None
+                if label:
+                    genre = label.title()
+                    if not matches_ignored(self.ignore_these_genres_list, genre):
+                        genre_list.append(genre)
+        return genre_list
 
     def musicbrainz_release_lookup(self, item_id, metadata, response, reply, error):
         found = False
         if error:
             log.error('WIKIDATA: Error retrieving release group info')
         else:
+            qids = []
             if 'metadata' in response.children:
                 if 'release_group' in response.metadata[0].children and self.use_release_group_genres:
                     if 'relation_list' in response.metadata[0].release_group[0].children:
@@ -161,14 +274,16 @@ class Wikidata:
                                 found = True
                                 wikidata_url = relation.target[0].text
                                 log.debug('WIKIDATA: wikidata url found for RELEASE_GROUP: %s ', wikidata_url)
-                                self.process_wikidata(Wikidata.RELEASE_GROUP, wikidata_url, item_id)
+                                qids.append(wikidata_url.split('/')[4])
+                                self.process_wikidata(Wikidata.RELEASE_GROUP, qids[-1], item_id)
                 if 'artist' in response.metadata[0].children and self.use_artist_genres:
                     if 'relation_list' in response.metadata[0].artist[0].children:
                         for relation in response.metadata[0].artist[0].relation_list[0].relation:
                             if relation.type == 'wikidata' and 'target' in relation.children:
                                 found = True
                                 wikidata_url = relation.target[0].text
-                                self.process_wikidata(Wikidata.ARTIST, wikidata_url, item_id)
+                                qids.append(wikidata_url.split('/')[4])
+                                self.process_wikidata(Wikidata.ARTIST, qids[-1], item_id)
                                 log.debug('WIKIDATA: wikidata url found for ARTIST: %s ', wikidata_url)
                 if 'work' in response.metadata[0].children and self.use_work_genres:
                     if 'relation_list' in response.metadata[0].work[0].children:
@@ -177,9 +292,14 @@ class Wikidata:
                                 found = True
                                 wikidata_url = relation.target[0].text
                                 log.debug('WIKIDATA: wikidata url found for WORK: %s ', wikidata_url)
-                                self.process_wikidata(Wikidata.WORK, wikidata_url, item_id)
+                                qids.append(wikidata_url.split('/')[4])
+                                self.process_wikidata(Wikidata.WORK, qids[-1], item_id)
+                self.genre_cache.put('qids', item_id, qids)
         if not found:
             log.debug('WIKIDATA: No wikidata url found for item_id: %s ', item_id)
+            # nothing to wait for, so the genres (none) can be cached for the session
+            if not error:
+                self.cache.setdefault(item_id, [])
 
         album = self.itemAlbums[item_id]
         album._requests -= 1
@@ -190,11 +310,14 @@ class Wikidata:
         if not self.itemAlbums:
             self.requests.clear()
             log.info('WIKIDATA: Finished (A)')
+            log.info('WIKIDATA: Cache: %s' % self.cache_stats())
 
-    def process_wikidata(self, genre_source_type, wikidata_url, item_id):
+    def process_wikidata(self, genre_source_type, item, item_id):
         album = self.itemAlbums[item_id]
         album._requests += 1
-        item = wikidata_url.split('/')[4]
+        if self.use_json_api:
+            self.queue_entity(genre_source_type, item, item_id)
+            return
         path = "/wiki/Special:EntityData/" + item + ".rdf"
         log.debug('WIKIDATA: Fetching from wikidata.org%s' % path)
         self.ws.get(WIKIDATA_HOST, WIKIDATA_PORT, path,
@@ -208,6 +331,7 @@ class Wikidata:
             log.error('WIKIDATA: error getting data from wikidata.org')
         else:
             if 'RDF' in response.children:
+                labels = {}
                 node = response.RDF[0]
                 for node1 in node.Description:
                     if 'about' in node1.attribs:
@@ -228,52 +352,28 @@ class Wikidata:
                                     list1 = node1.children.get('name')
                                     for node2 in list1:
                                         if node2.attribs.get('lang') == 'en':
+                                            labels[tmp.split('/')[4]] = node2.text
                                             genre = node2.text.title()
                                             if not matches_ignored(self.ignore_these_genres_list, genre):
                                                 genre_list.append(genre)
                                                 log.debug('New genre has been found and ALLOWED: %s' % genre)
                                             else:
                                                 log.debug('New genre has been found, but IGNORED: %s' % genre)
+                genre_qids = [tmp.split('/')[4] for tmp in genre_entries]
+                self.genre_cache.put('genres', item, genre_qids)
+                for genre_qid in genre_qids:
+                    self.genre_cache.put('labels', genre_qid, labels.get(genre_qid, ''))
 
+        self.genres_found(item_id, genre_source_type, genre_list, genre_entries)
+
+    # Set the genres found for an entity, and finish the request for it
+    def genres_found(self, item_id, genre_source_type, genre_list, genre_entries):
         if len(genre_list) > 0:
             log.debug('WIKIDATA: item_id: %s' % item_id)
             log.debug('WIKIDATA: Final list of wikidata id found: %s' % genre_entries)
             log.debug('WIKIDATA: Final list of genre: %s' % genre_list)
             log.info('WIKIDATA: Total items to update: %d ' % len(self.requests[item_id]))
-
-            for metadata in self.requests[item_id]:
-                if genre_source_type == Wikidata.RELEASE_GROUP:
-                    metadata['~release_group_genre_sourced'] = True
-                elif genre_source_type == Wikidata.ARTIST:
-                    if self.use_artist_only_if_no_release and metadata['~release_group_genre_sourced'] or \
-                            matches_ignored(self.ignore_genres_from_these_artists_list, metadata.get("artist")):
-                        if item_id not in self.cache:
-                            self.cache[item_id] = []
-                        log.debug('WIKIDATA: NOT setting Artist-sourced genre: %s ' % genre_list)
-                        continue
-                    else:
-                        log.debug('WIKIDATA: Setting Artist-sourced genre: %s ' % genre_list)
-
-                # getall doesn't handle delimiters so we need to check-n-parse here
-                old_genre_metadata = metadata.getall("genre")
-                old_genre_list = []
-                for genre in old_genre_metadata:
-                    if self.genre_delimiter and self.genre_delimiter in genre:
-                        old_genre_list.extend(genre.split(self.genre_delimiter))
-                    else:
-                        old_genre_list.append(genre)
-
-                new_genre = set(old_genre_list)
-                new_genre.update(genre_list)
-                # Sort the new genre list so that they don't appear as new entries (not a change) next time
-                log.debug('WIKIDATA: setting metadata genre to : %s ' % new_genre)
-                if self.genre_delimiter:
-                    metadata["genre"] = self.genre_delimiter.join(sorted(new_genre))
-                else:
-                    metadata["genre"] = sorted(new_genre)
-
-                log.debug('WIKIDATA: setting cache genre to : %s ' % genre_list)
-                self.cache[item_id] = genre_list
+            self.set_genres(item_id, genre_source_type, genre_list, self.requests[item_id])
         else:
             log.debug('WIKIDATA: genre not found in wikidata')
 
@@ -288,6 +388,166 @@ class Wikidata:
         if not self.itemAlbums:
             self.requests.clear()
             log.info('WIKIDATA: Finished (B)')
+            log.info('WIKIDATA: Cache: %s' % self.cache_stats())
+
+    # Entities are requested with the Wikidata API (wbgetentities) for just their genre claims, WIKIDATA_BATCH
+    # at a time, and then the English labels of any genres not already known, in the same way. The entities
+    # wanted while the tracks of an album are processed are collected and requested together.
+    def queue_entity(self, genre_source_type, item, item_id):
+        log.debug('WIKIDATA: Queueing %s for the Wikidata API' % item)
+        if item in self.entity_waiting:
+            self.entity_waiting[item].append((item_id, genre_source_type))
+            return
+        self.entity_waiting[item] = [(item_id, genre_source_type)]
+        if not self.entity_queue:
+            QtCore.QTimer.singleShot(0, self.request_entities)
+        self.entity_queue.append(item)
+
+    def request_entities(self):
+        queue = self.entity_queue
+        self.entity_queue = []
+        for i in range(0, len(queue), WIKIDATA_BATCH):
+            batch = queue[i:i + WIKIDATA_BATCH]
+            self.request_api(batch, 'claims', partial(self.parse_claims_response, batch))
+
+    def request_api(self, ids, props, handler):
+        queryargs = {
+            'action': 'wbgetentities',
+            'ids': '|'.join(ids),
+            'props': props,
+            'languages': 'en',
+            'format': 'json',
+        }
+        log.debug('WIKIDATA: Fetching %s of %s from the Wikidata API' % (props, queryargs['ids']))
+        self.ws.get(WIKIDATA_HOST, WIKIDATA_PORT, WIKIDATA_API_PATH, handler,
+                    parse_response_type="json", priority=False, important=False, queryargs=queryargs)
+
+    # Errors are answered with an error body rather than an HTTP error, so check for both
+    def api_error(self, response, error):
+        if error:
+            return True
+        if 'error' in response:
+            log.error('WIKIDATA: Wikidata API error: %s' % response['error'])
+            return True
+        return False
+
+    # The entities of a response, by the ids they were requested with (ids which do not exist are left out)
+    def api_entities(self, response):
+        entities = {}
+        for key, entity in response.get('entities', {}).items():
+            if 'missing' in entity:
+                continue
+            entities[key] = entity
+            # a redirected id is answered with the entity it redirects to
+            redirected = entity.get('redirects', {}).get('from')
+            if redirected:
+                entities[redirected] = entity
+        return entities
+
+    def parse_claims_response(self, batch, response, reply, error):
+        genres = {}
+        labels = {}
+        try:
+            if self.api_error(response, error):
+                log.error('WIKIDATA: error getting data from the Wikidata API')
+            else:
+                entities = self.api_entities(response)
+                for item in batch:
+                    if item not in entities:
+                        log.debug('WIKIDATA: %s not found by the Wikidata API' % item)
+                        continue
+                    genre_qids = []
+                    for claim in entities.get(item, {}).get('claims', {}).get('P136', []):
+                        try:
+                            genre_qids.append(claim['mainsnak']['datavalue']['value']['id'])
+                        except (KeyError, TypeError):
+                            # no value, or unknown value
+                            pass
+                    genres[item] = genre_qids
+                    self.genre_cache.put('genres', item, genre_qids)
+                    for genre_qid in genre_qids:
+                        label = self.genre_cache.get('labels', genre_qid)
+                        if label is not None:
+                            labels[genre_qid] = label
+        except Exception:
+            log.error('WIKIDATA: error parsing the response of the Wikidata API', exc_info=True)
+        missing = sorted(set(qid for genre_qids in genres.values() for qid in genre_qids) - set(labels))
+        if not missing:
+            self.entities_found(batch, genres, labels)
+            return
+        # more requests, for the labels - the genres are found once they have all been answered
+        groups = [missing[i:i + WIKIDATA_BATCH] for i in range(0, len(missing), WIKIDATA_BATCH)]
+        pending = set(range(len(groups)))
+        for number, group in enumerate(groups):
+            self.request_api(group, 'labels',
+                             partial(self.parse_labels_response, batch, genres, labels, group, pending, number))
+
+    def parse_labels_response(self, batch, genres, labels, missing, pending, number, response, reply, error):
+        try:
+            if self.api_error(response, error):
+                log.error('WIKIDATA: error getting genre labels from the Wikidata API')
+            else:
+                entities = self.api_entities(response)
+                for genre_qid in missing:
+                    if genre_qid in entities:
+                        label = entities[genre_qid].get('labels', {}).get('en', {}).get('value', '')
+                        labels[genre_qid] = label
+                        self.genre_cache.put('labels', genre_qid, label)
+        except Exception:
+            log.error('WIKIDATA: error parsing the response of the Wikidata API', exc_info=True)
+        pending.discard(number)
+        if not pending:
+            self.entities_found(batch, genres, labels)
+
+    def entities_found(self, batch, genres, labels):
+        for item in batch:
+            genre_entries = genres.get(item, [])
+            genre_list = []
+            for genre_qid in genre_entries:
+                if labels.get(genre_qid):
+                    genre = labels[genre_qid].title()
+                    if not matches_ignored(self.ignore_these_genres_list, genre):
+                        genre_list.append(genre)
+                        log.debug('New genre has been found and ALLOWED: %s' % genre)
+                    else:
+                        log.debug('New genre has been found, but IGNORED: %s' % genre)
+            for item_id, genre_source_type in self.entity_waiting.pop(item, []):
+                self.genres_found(item_id, genre_source_type, genre_list, genre_entries)
+
+    def set_genres(self, item_id, genre_source_type, genre_list, metadata_list):
+        for metadata in metadata_list:
+            if genre_source_type == Wikidata.RELEASE_GROUP:
+                metadata['~release_group_genre_sourced'] = True
+            elif genre_source_type == Wikidata.ARTIST:
+                if self.use_artist_only_if_no_release and metadata['~release_group_genre_sourced'] or \
+                        matches_ignored(self.ignore_genres_from_these_artists_list, metadata.get("artist")):
+                    if item_id not in self.cache:
+                        self.cache[item_id] = []
+                    log.debug('WIKIDATA: NOT setting Artist-sourced genre: %s ' % genre_list)
+                    continue
+                else:
+                    log.debug('WIKIDATA: Setting Artist-sourced genre: %s ' % genre_list)
+
+            # getall doesn't handle delimiters so we need to check-n-parse here
+            old_genre_metadata = metadata.getall("genre")
+            old_genre_list = []
+            for genre in old_genre_metadata:
+                if self.genre_delimiter and self.genre_delimiter in genre:
+                    old_genre_list.extend(genre.split(self.genre_delimiter))
+                else:
+                    old_genre_list.append(genre)
+
+            new_genre = set(old_genre_list)
+            new_genre.update(genre_list)
+            # Sort the new genre list so that they don't appear as new entries (not a change) next time
+            log.debug('WIKIDATA: setting metadata genre to : %s ' % new_genre)
+            if self.genre_delimiter:
+                metadata["genre"] = self.genre_delimiter.join(sorted(new_genre))
+            else:
+                metadata["genre"] = sorted(new_genre)
+
+            log.debug('WIKIDATA: setting cache genre to : %s ' % genre_list)
+            self.cache[item_id] = genre_list
 
     def process_track(self, album, metadata, track, release):
         self.update_settings()
@@ -318,33 +578,35 @@ class Wikidata:
     def update_settings(self):
         self.mb_host = config.setting["server_host"]
         self.mb_port = config.setting["server_port"]
-        self.use_release_group_genres = config.setting[""]
-        self.use_work_genres = config.setting["wikidata_use_work_genres"]
-        # Some changed settings could invalidate the cache, so clear it to be safe
-        if self.use_release_group_genres != config.setting["wikidata_use_release_group_genres"]:
-            self.use_release_group_genres = config.setting["wikidata_use_release_group_genres"]
-            self.cache.clear()
-        if self.use_artist_genres != config.setting["wikidata_use_artist_genres"]:
-            self.use_artist_genres = config.setting["wikidata_use_artist_genres"]
-            self.cache.clear()
-        if self.use_artist_only_if_no_release != config.setting["wikidata_use_artist_only_if_no_release"]:
-            self.use_artist_only_if_no_release = config.setting["wikidata_use_artist_only_if_no_release"]
-            self.cache.clear()
-        if self.ignore_genres_from_these_artists != parse_ignored_tags(
-                config.setting["wikidata_ignore_genres_from_these_artists"]):
-            self.ignore_genres_from_these_artists_list = parse_ignored_tags(
-                config.setting["wikidata_ignore_genres_from_these_artists"])
-            self.cache.clear()
-        if self.use_work_genres != config.setting["wikidata_use_work_genres"]:
-            self.use_work_genres = config.setting["wikidata_use_work_genres"]
-            self.cache.clear()
-        if self.ignore_these_genres != parse_ignored_tags(config.setting["wikidata_ignore_these_genres"]):
-            self.ignore_these_genres = parse_ignored_tags(config.setting["wikidata_ignore_these_genres"])
-            self.ignore_these_genres_list = parse_ignored_tags(
-                config.setting["wikidata_ignore_these_genres"])
-            self.cache.clear()
+        # Some changed settings could invalidate the cache, so clear it, and rebuild what is derived
+        # from the settings, only when one of them has changed
+        settings = tuple(config.setting[name] for name in self.CACHE_SETTINGS)
+        if settings != self.settings:
+            if self.cache:
+                log.info('WIKIDATA: Settings changed, clearing the cache of %d items' % len(self.cache))
+                self.cache.clear()
+            self.settings = settings
+            (self.use_release_group_genres,
+             self.use_artist_genres,
+             self.use_artist_only_if_no_release,
+             self.ignore_genres_from_these_artists,
+             self.use_work_genres,
+             self.ignore_these_genres) = settings
+            self.ignore_genres_from_these_artists_list = parse_ignored_tags(self.ignore_genres_from_these_artists)
+            self.ignore_these_genres_list = parse_ignored_tags(self.ignore_these_genres)
         if config.setting["write_id3v23"]:
             self.genre_delimiter = config.setting["wikidata_genre_delimiter"]
+        self.use_json_api = config.setting["wikidata_use_json_api"]
+
+    def cache_stats(self):
+        """
+        :return: dict of the number of items looked up and found in the cache ('hits'), joined to a request
+        already pending ('pending'), found in the persistent cache ('stored') or requested ('misses'),
+        and of the items cached ('size')
+        """
+        stats = dict(self.cache_counts)
+        stats['size'] = len(self.cache)
+        return stats
 
 
 class WikidataOptionsPage(OptionsPage):
@@ -360,6 +622,7 @@ class WikidataOptionsPage(OptionsPage):
         config.BoolOption("setting", "wikidata_use_work_genres", True),
         config.TextOption("setting", "wikidata_ignore_these_genres", "seen live, favorites, /\\d+ of \\d+ stars/"),
         config.TextOption("setting", "wikidata_genre_delimiter", "; "),
+        config.BoolOption("setting", "wikidata_use_json_api", True),
     ]
 
     def __init__(self, parent=None):
@@ -381,6 +644,7 @@ class WikidataOptionsPage(OptionsPage):
         self.ui.ignore_genres_from_these_artists.setText(setting["wikidata_ignore_genres_from_these_artists"])
         self.ui.use_work_genres.setChecked(setting["wikidata_use_work_genres"])
         self.ui.ignore_these_genres.setText(setting["wikidata_ignore_these_genres"])
+        self.ui.use_json_api.setChecked(setting["wikidata_use_json_api"])
         if config.setting["write_id3v23"]:
             self.ui.genre_delimiter.setEditText(setting["wikidata_genre_delimiter"])
 
@@ -392,6 +656,7 @@ class WikidataOptionsPage(OptionsPage):
         setting["wikidata_ignore_genres_from_these_artists"] = str(self.ui.ignore_genres_from_these_artists.text())
         setting["wikidata_use_work_genres"] = self.ui.use_work_genres.isChecked()
         setting["wikidata_ignore_these_genres"] = str(self.ui.ignore_these_genres.text())
+        setting["wikidata_use_json_api"] = self.ui.use_json_api.isChecked()
         if config.setting["write_id3v23"]:
             setting["wikidata_genre_delimiter"] = str(self.ui.genre_delimiter.currentText())
 
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+import time
+
+from picard import log
+
+
+class GenreCache:
+    """
+    Persistent cache of what has been looked up to find genres, kept between sessions:
+        qids: MusicBrainz id -> list of the Wikidata entity ids (QIDs) it links to (may be empty)
+        genres: QID -> list of the QIDs of its genres
+        labels: genre QID -> English label ('' if it has none)
+    Nothing here depends on the plugin settings, which are applied to the cached data as it is used.
+    Entries older than ttl seconds are ignored and removed. On any database error the cache is disabled
+    for the rest of the session and everything is looked up again.
+    """
+
+    SCHEMA = 1
+    TABLES = ('qids', 'genres', 'labels')
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.connection = None
+        self.disabled = False
+
+    def _connect(self):
+        if self.connection is None and not self.disabled:
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                self.connection = sqlite3.connect(self.path, isolation_level=None)
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+                version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+                if version != self.SCHEMA:
+                    for table in self.TABLES:
+                        self.connection.execute('DROP TABLE IF EXISTS %s' % table)
+                    self.connection.execute('PRAGMA user_version=%d' % self.SCHEMA)
+                expired = time.time() - self.ttl
+                for table in self.TABLES:
+                    self.connection.execute(
+                        'CREATE TABLE IF NOT EXISTS %s ('
+                        'id TEXT PRIMARY KEY, '
+                        'fetched REAL NOT NULL, '
+                        'data TEXT NOT NULL)' % table)
+                    self.connection.execute('DELETE FROM %s WHERE fetched < ?' % table, (expired,))
+            except (sqlite3.Error, OSError):
+                log.error('WIKIDATA: unable to open genre cache %s', self.path, exc_info=True)
+                self.disable()
+        return self.connection
+
+    def get(self, table, key):
+        """
+        :param table: one of TABLES
+        :param key: MusicBrainz id or QID
+        :return: the cached value, or None if there is none (or it has expired)
+        """
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                'SELECT fetched, data FROM %s WHERE id = ?' % table, (key,)).fetchone()
+            if row is None or row[0] < time.time() - self.ttl:
+                return None
+            return json.loads(row[1])
+        except sqlite3.Error:
+            log.error('WIKIDATA: error reading genre cache, not used for the rest of the session', exc_info=True)
+            self.disable()
+            return None
+        except ValueError:
+            log.error('WIKIDATA: error reading genre cache', exc_info=True)
+            return None
+
+    def put(self, table, key, value):
+        """
+        :param table: one of TABLES
+        :param key: MusicBrainz id or QID
+        :param value: list of QIDs, or label
+        """
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO %s (id, fetched, data) VALUES (?, ?, ?)' % table,
+                (key, time.time(), json.dumps(value)))
+        except sqlite3.Error:
+            log.error('WIKIDATA: error writing genre cache, not used for the rest of the session', exc_info=True)
+            self.disable()
+        except (ValueError, TypeError):
+            log.error('WIKIDATA: error writing genre cache', exc_info=True)
+
+    def disable(self):
+        self.close()
+        self.disabled = True
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+        self.connection = None
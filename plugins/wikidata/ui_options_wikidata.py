@@ -166,6 +166,10 @@ class Ui_WikidataOptionsPage(object):
         spacerItem5 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.hLayout_genre_delimiter.addItem(spacerItem5)
         self.verticalLayout.addLayout(self.hLayout_genre_delimiter)
+        self.use_json_api = QtWidgets.QCheckBox(self.generalSettings_groupBox)
+        self.use_json_api.setChecked(True)
+        self.use_json_api.setObjectName("use_json_api")
+        self.verticalLayout.addWidget(self.use_json_api)
         self.verticalLayout_2.addWidget(self.generalSettings_groupBox)
         spacerItem6 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.verticalLayout_2.addItem(spacerItem6)
@@ -191,6 +195,7 @@ class Ui_WikidataOptionsPage(object):
         self.genre_delimiter_label.setText(_translate("WikidataOptionsPage", "Genre Delimiter: (only applicable to ID3v2.3 tags)"))
         self.genre_delimiter.setItemText(1, _translate("WikidataOptionsPage", "; "))
         self.genre_delimiter.setItemText(3, _translate("WikidataOptionsPage", " ; "))
+        self.use_json_api.setText(_translate("WikidataOptionsPage", "Fetch only the genres from Wikidata, for several items at once"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+"""Brute-force searches, to check the faster ones used by the plugins."""
+
+
+def contains(sequence, run):
+    return any(sequence[i:i + len(run)] == run for i in range(len(sequence) - len(run) + 1))
+
+
+def longest_common_run(s1, s2):
+    """The longest run of items in both s1 and s2 (the first in s1), as
+    returned by classical_extras' lcs_rows."""
+    best_start, best_length = 0, 0
+    for end in range(1, len(s1) + 1):
+        for start in range(end - best_length):
+            run = s1[start:end]
+            if contains(s2, run):
+                best_start, best_length = start, len(run)
+                break
+    return {'string': s1[best_start:best_start + best_length], 'start': best_start, 'length': best_length}
+
+
+def longest_run_in_all(sequences):
+    """The longest run of items in every sequence (the first in the first
+    sequence), or an empty run if there is none."""
+    first = sequences[0]
+    for length in range(len(first), 0, -1):
+        for start in range(len(first) - length + 1):
+            run = first[start:start + length]
+            if all(contains(sequence, run) for sequence in sequences[1:]):
+                return run
+    return first[:0]
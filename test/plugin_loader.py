@@ -0,0 +1,63 @@
+import importlib.util
+import os
+import sys
+
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins")
+
+
+def load_plugin_module(plugin, module):
+    """Load one module of a plugin package on its own, without running the
+    package's __init__ (for modules which do not import the rest of the
+    plugin)."""
+    name = "test_%s_%s" % (plugin, module)
+    if name not in sys.modules:
+        path = os.path.join(PLUGINS_DIR, plugin, module + ".py")
+        spec = importlib.util.spec_from_file_location(name, path)
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+        sys.modules[name] = loaded
+    return sys.modules[name]
+
+
+class DefaultSettings(dict):
+    """Settings which fall back to the default of each registered option,
+    as Picard's own settings do."""
+
+    def __missing__(self, name):
+        from picard import config
+        option = config.Option.get("setting", name)
+        if option is None:
+            raise KeyError(name)
+        return option.default
+
+
+def setup_config(**settings):
+    """Give picard.config settings for use outside Picard (as Picard's own
+    tests do), with the options registered so far at their defaults."""
+    from picard import config
+    if not isinstance(config.setting, DefaultSettings):
+        config.setting = DefaultSettings()
+        config.persist = {}
+    config.setting.update(settings)
+    return config.setting
+
+
+def load_plugin(plugin):
+    """Load a plugin package as Picard's plugin manager does, as
+    picard.plugins.<plugin>, so that its own imports of its modules work."""
+    name = "picard.plugins." + plugin
+    if name not in sys.modules:
+        setup_config()
+        path = os.path.join(PLUGINS_DIR, plugin)
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(path, "__init__.py"),
+            submodule_search_locations=[path])
+        loaded = importlib.util.module_from_spec(spec)
+        sys.modules[name] = loaded
+        try:
+            spec.loader.exec_module(loaded)
+        except Exception:
+            del sys.modules[name]
+            raise
+    return sys.modules[name]
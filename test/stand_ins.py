@@ -0,0 +1,58 @@
+"""Stand-ins for the parts of Picard the plugins call, for tests run outside
+Picard."""
+
+from collections import namedtuple
+from types import SimpleNamespace
+
+
+Request = namedtuple('Request', 'host port path queryargs handler')
+
+
+class StandInWebService:
+    """Stands in for the tagger's web service: records each request, which is
+    only answered when the test asks - with the response given, or else with
+    respond(request)."""
+
+    def __init__(self, respond=None):
+        self.respond = respond
+        # every request made, and those not yet answered (oldest first)
+        self.requests = []
+        self.pending = []
+
+    def get(self, host, port, path, handler, **kwargs):
+        request = Request(host, port, path, kwargs.get('queryargs', {}), handler)
+        self.requests.append(request)
+        self.pending.append(request)
+
+    def answer(self, response=None, error=None):
+        """Answer the oldest request not yet answered."""
+        request = self.pending.pop(0)
+        if response is None and error is None:
+            response = self.respond(request)
+        request.handler(response, None, error)
+
+    def answer_pending(self):
+        """Answer the requests made so far (but not any made as they are answered)."""
+        for _ in range(len(self.pending)):
+            self.answer()
+
+
+class StandInSignal:
+
+    def connect(self, slot):
+        pass
+
+
+class StandInAlbum:
+    """Stands in for a Picard album, counting its outstanding requests as
+    Picard does. (Unlike a SimpleNamespace it can be weakly referenced.)"""
+
+    def __init__(self, webservice=None):
+        self.tagger = SimpleNamespace(webservice=webservice, album_removed=StandInSignal())
+        self._requests = 0
+        # times the album has finished loading
+        self.finalized = 0
+
+    def _finalize_loading(self, error):
+        if not self._requests:
+            self.finalized += 1
@@ -0,0 +1,151 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from test.brute_force import longest_common_run
+from test.plugin_loader import load_plugin, setup_config
+from test.stand_ins import StandInAlbum, StandInWebService
+
+
+def work_response(request):
+    """A MusicBrainz work record for a work look-up."""
+    work_id = request.path.rsplit('/', 1)[1]
+    return {'id': work_id, 'title': 'Work ' + work_id, 'relations': []}
+
+
+def recording(*works):
+    relations = []
+    for work_id, parent_id in works:
+        work = {'id': work_id, 'relations': []}
+        if parent_id:
+            work['relations'].append({
+                'target-type': 'work',
+                'type': 'parts',
+                'direction': 'backward',
+                'work': {'id': parent_id}})
+        relations.append({'target-type': 'work', 'work': work})
+    return {'relations': relations}
+
+
+class PrefetchTest(unittest.TestCase):
+
+    RELEASE_ID = 'prefetch-test-release'
+
+    def setUp(self):
+        self.plugin = load_plugin('classical_extras')
+        setup_config(server_host='localhost', server_port=5000)
+        self.part_levels = self.plugin.PartLevels()
+        self.part_levels.USE_CACHE = True
+        self.part_levels.PERSISTENT_CACHE = False
+        self.webservice = StandInWebService(work_response)
+        self.album = StandInAlbum(self.webservice)
+        self.plugin.RELEASES.register(self.RELEASE_ID, self.album)
+        self.addCleanup(self.plugin.RELEASES.albums.pop, self.RELEASE_ID, None)
+        self.release = {'media': [{'tracks': [
+            {'recording': recording(('w1', 'p1'))},
+            {'recording': recording(('w2', 'p1'))},
+            {'recording': recording(('w2', None), ('w3', None))}]}]}
+        self.addCleanup(self.plugin.release_status.pop, self.RELEASE_ID, None)
+
+    def prefetch(self):
+        self.part_levels.prefetch_works(self.RELEASE_ID, self.album, self.release)
+
+    def test_each_work_requested_once(self):
+        self.prefetch()
+        self.assertEqual(
+            sorted(request.path for request in self.webservice.requests),
+            ['/ws/2/work/p1', '/ws/2/work/w1', '/ws/2/work/w2', '/ws/2/work/w3'])
+        self.prefetch()
+        self.assertEqual(len(self.webservice.requests), 4)
+
+    def test_unused_responses_held_until_album_processed(self):
+        self.prefetch()
+        self.webservice.answer_pending()
+        self.assertEqual(sorted(self.part_levels.prefetched), ['p1', 'w1', 'w2', 'w3'])
+        self.prefetch()
+        self.assertEqual(len(self.webservice.requests), 4)
+        self.part_levels.drop_prefetches(self.album)
+        self.assertEqual(self.part_levels.prefetched, {})
+
+    def test_responses_after_album_processed_ignored(self):
+        self.prefetch()
+        self.part_levels.drop_prefetches(self.album)
+        self.webservice.answer_pending()
+        self.assertEqual(self.part_levels.prefetched, {})
+        self.assertEqual(self.part_levels.prefetching, {})
+        self.assertEqual(list(self.part_levels.works_queue), [])
+
+    def test_other_albums_kept(self):
+        self.prefetch()
+        self.webservice.answer_pending()
+        self.part_levels.drop_prefetches(SimpleNamespace())
+        self.assertEqual(len(self.part_levels.prefetched), 4)
+
+    def test_removed_album_purged(self):
+        self.prefetch()
+        self.plugin.RELEASES.albums.pop(self.RELEASE_ID)
+        self.part_levels.purge_release(self.RELEASE_ID, self.album, [])
+        self.assertEqual(self.part_levels.prefetching, {})
+        self.assertEqual(list(self.part_levels.works_queue), [])
+        self.webservice.answer_pending()
+        self.assertEqual(self.part_levels.prefetched, {})
+
+    def test_responses_for_removed_album_ignored(self):
+        self.prefetch()
+        self.plugin.RELEASES.albums.pop(self.RELEASE_ID)
+        self.webservice.answer_pending()
+        self.assertEqual(self.part_levels.prefetched, {})
+        self.assertEqual(self.part_levels.prefetching, {})
+
+
+class LcsRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = load_plugin('classical_extras')
+        self.random = random.Random(1)
+
+    def random_sequence(self, alphabet, as_list):
+        items = [self.random.choice(alphabet) for _ in range(self.random.randint(0, 30))]
+        return items if as_list else ''.join(items)
+
+    def test_strings(self):
+        for _ in range(300):
+            s1 = self.random_sequence('abc', False)
+            s2 = self.random_sequence('abc', False)
+            self.assertEqual(self.plugin.lcs_rows(s1, s2), longest_common_run(s1, s2), (s1, s2))
+
+    def test_word_lists(self):
+        words = ['Allegro', 'ma', 'non', 'troppo', 'Adagio']
+        for _ in range(300):
+            s1 = self.random_sequence(words, True)
+            s2 = self.random_sequence(words, True)
+            self.assertEqual(self.plugin.lcs_rows(s1, s2), longest_common_run(s1, s2), (s1, s2))
+
+    def test_unhashable_items(self):
+        items = [['a'], ['b'], ['c', 'd']]
+        for _ in range(100):
+            s1 = self.random_sequence(items, True)
+            s2 = self.random_sequence(items, True)
+            self.assertEqual(self.plugin.lcs_rows(s1, s2), longest_common_run(s1, s2), (s1, s2))
+
+    def test_no_common_items(self):
+        self.assertEqual(self.plugin.lcs_rows('abc', 'xyz'), {'string': '', 'start': 0, 'length': 0})
+        self.assertEqual(self.plugin.lcs_rows([], ['a']), {'string': [], 'start': 0, 'length': 0})
+
+    def test_cached_per_release(self):
+        release_id = 'lcs-test-release'
+        self.addCleanup(self.plugin.lcs_cache.pop, release_id, None)
+        s1 = ['Symphony', 'No.', '5', 'Allegro']
+        s2 = ['Symphony', 'No.', '5', 'Andante']
+        first = self.plugin.longest_common_substring(s1, s2, release_id)
+        first['string'].append('changed')
+        self.assertEqual(len(self.plugin.lcs_cache[release_id]), 1)
+        self.assertEqual(self.plugin.longest_common_substring(s1, s2, release_id),
+                         {'string': ['Symphony', 'No.', '5'], 'start': 0, 'length': 3})
+        # unhashable items are not cached
+        self.assertEqual(self.plugin.longest_common_substring([['a']], [['a']], release_id)['length'], 1)
+        self.assertEqual(len(self.plugin.lcs_cache[release_id]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
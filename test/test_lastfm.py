@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from test.plugin_loader import load_plugin, load_plugin_module, setup_config
+from test.stand_ins import StandInAlbum, StandInWebService
+
+
+def toptags_response(request):
+    """A Last.fm top tags response, with the same tags for every artist."""
+    from picard.util.xml import parse_xml
+    return parse_xml(
+        '<lfm status="ok"><toptags artist="%s">'
+        '<tag><name>baroque</name><count>100</count></tag>'
+        '<tag><name>classical</name><count>60</count></tag>'
+        '<tag><name>harpsichord</name><count>5</count></tag>'
+        '</toptags></lfm>' % request.queryargs['artist'])
+
+
+class TagCacheTest(unittest.TestCase):
+
+    URL = '/2.0/?method=artist.gettoptags&artist=Bach'
+
+    def setUp(self):
+        tagcache = load_plugin_module('lastfm', 'tagcache')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = tagcache.TagCache(os.path.join(directory, 'lastfm_tags.sqlite'), 60)
+        self.addCleanup(self.cache.close)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get(self.URL))
+        self.cache.put(self.URL, [('baroque', 100), ('classical', 80)])
+        self.assertEqual(self.cache.get(self.URL), [('baroque', 100), ('classical', 80)])
+
+    def test_read_error_disables_cache(self):
+        self.cache.put(self.URL, [('baroque', 100)])
+        self.cache.connection.execute('DROP TABLE tags')
+        self.assertIsNone(self.cache.get(self.URL))
+        self.assertTrue(self.cache.disabled)
+        self.assertIsNone(self.cache.connection)
+        # no more attempts to use the database
+        self.cache.put(self.URL, [('baroque', 100)])
+        self.assertIsNone(self.cache.get(self.URL))
+        self.assertIsNone(self.cache.connection)
+
+    def test_write_error_disables_cache(self):
+        self.cache.put(self.URL, [('baroque', 100)])
+        self.cache.connection.execute('DROP TABLE tags')
+        self.cache.put(self.URL, [('baroque', 100)])
+        self.assertTrue(self.cache.disabled)
+
+
+class AlbumTagsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = load_plugin('lastfm')
+        setup_config(
+            lastfm_use_track_tags=False,
+            lastfm_use_artist_tags=True,
+            lastfm_min_tag_usage=10,
+            lastfm_ignore_tags='',
+            lastfm_join_tags='')
+        from picard.metadata import Metadata
+        self.Metadata = Metadata
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        tag_cache = self.plugin.TagCache(os.path.join(directory, 'lastfm_tags.sqlite'), 60)
+        self.addCleanup(tag_cache.close)
+        for patch in (
+                mock.patch.object(self.plugin, '_tag_cache', tag_cache),
+                mock.patch.dict(self.plugin._cache, clear=True),
+                mock.patch.dict(self.plugin._pending_requests, clear=True),
+                mock.patch.dict(self.plugin._album_tags, clear=True)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        # the albums' requests are made from timers, run here by run_timers
+        self.timers = []
+        patch = mock.patch.object(self.plugin.QtCore.QTimer, 'singleShot',
+                                  side_effect=lambda msec, function: self.timers.append(function))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.webservice = StandInWebService(toptags_response)
+
+    def run_timers(self):
+        timers, self.timers = self.timers, []
+        for function in timers:
+            function()
+
+    def track(self, album, artist, genre=None):
+        metadata = self.Metadata()
+        metadata['artist'] = artist
+        metadata['title'] = 'Partita'
+        if genre:
+            metadata['genre'] = genre
+        self.plugin.process_track(album, metadata, None, None)
+        return metadata
+
+    def test_shared_artist_requested_once(self):
+        album = StandInAlbum(self.webservice)
+        tracks = [self.track(album, 'J. S. Bach'), self.track(album, 'J. S. Bach')]
+        self.assertEqual(album._requests, 1)
+        self.run_timers()
+        self.assertEqual(len(self.webservice.requests), 1)
+        self.assertEqual(album._requests, 1)
+        self.webservice.answer()
+        self.assertEqual(album._requests, 0)
+        self.assertEqual(album.finalized, 1)
+        for metadata in tracks:
+            self.assertEqual(sorted(metadata.getall('genre')), ['Baroque', 'Classical'])
+        # the tags are now cached
+        other_album = StandInAlbum(self.webservice)
+        metadata = self.track(other_album, 'J. S. Bach')
+        self.run_timers()
+        self.assertEqual(len(self.webservice.requests), 1)
+        self.assertEqual(other_album._requests, 0)
+        self.assertEqual(sorted(metadata.getall('genre')), ['Baroque', 'Classical'])
+
+    def test_request_pending_for_another_album(self):
+        first_album = StandInAlbum(self.webservice)
+        first = self.track(first_album, 'J. S. Bach')
+        self.run_timers()
+        second_album = StandInAlbum(self.webservice)
+        second = self.track(second_album, 'J. S. Bach')
+        self.run_timers()
+        self.assertEqual(len(self.webservice.requests), 1)
+        self.assertEqual((first_album._requests, second_album._requests), (1, 1))
+        self.webservice.answer()
+        self.assertEqual((first_album._requests, second_album._requests), (0, 0))
+        self.assertEqual((first_album.finalized, second_album.finalized), (1, 1))
+        self.assertEqual(sorted(first.getall('genre')), ['Baroque', 'Classical'])
+        self.assertEqual(sorted(second.getall('genre')), ['Baroque', 'Classical'])
+        self.assertEqual(self.plugin._pending_requests, {})
+
+    def test_failed_request(self):
+        album = StandInAlbum(self.webservice)
+        metadata = self.track(album, 'J. S. Bach', genre='Keyboard')
+        self.run_timers()
+        self.webservice.answer(error='network error')
+        self.assertEqual(album._requests, 0)
+        self.assertEqual(album.finalized, 1)
+        self.assertEqual(metadata.getall('genre'), ['Keyboard'])
+        self.assertEqual(self.plugin._cache, {})
+        self.assertEqual(self.plugin._pending_requests, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import time
+import unittest
+
+from test.brute_force import longest_run_in_all
+from test.plugin_loader import load_plugin_module
+
+
+class CommonWordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lyrics = load_plugin_module('classical_extras', 'lyrics')
+        self.random = random.Random(1)
+
+    def random_words(self, vocabulary, longest):
+        return [self.random.choice(vocabulary) for _ in range(self.random.randint(0, longest))]
+
+    def test_brute_force(self):
+        vocabulary = ['la', 'ci', 'darem', 'mano', 'vorrei', 'e', 'non']
+        for _ in range(500):
+            word_lists = [self.random_words(vocabulary[:self.random.randint(2, 7)], 25)
+                          for _ in range(self.random.randint(2, 5))]
+            self.assertEqual(self.lyrics.common_words(word_lists), longest_run_in_all(word_lists), word_lists)
+
+    def test_shared_runs(self):
+        # lists which share a run of words, with others around it
+        vocabulary = [str(i) for i in range(30)]
+        for _ in range(200):
+            shared = self.random_words(vocabulary, 15)
+            word_lists = [self.random_words(vocabulary, 10) + shared + self.random_words(vocabulary, 10)
+                          for _ in range(self.random.randint(2, 6))]
+            expected = longest_run_in_all(word_lists)
+            self.assertGreaterEqual(len(expected), len(shared))
+            self.assertEqual(self.lyrics.common_words(word_lists), expected, word_lists)
+
+    def test_edge_cases(self):
+        common_words = self.lyrics.common_words
+        self.assertEqual(common_words([]), [])
+        self.assertEqual(common_words([['Voi', 'che', 'sapete']]), ['Voi', 'che', 'sapete'])
+        self.assertEqual(common_words([['Voi', 'che'], []]), [])
+        self.assertEqual(common_words([['Voi', 'che'], ['sapete']]), [])
+        self.assertEqual(common_words([['che', 'Voi'], ['Voi', 'che'], ['Voi']]), ['Voi'])
+
+    def test_libretto(self):
+        # 40 tracks of an opera, each with the whole libretto and some words of its own
+        libretto = ['libretto%d' % (i % 1500) for i in range(3000)]
+        word_lists = []
+        for track in range(40):
+            own_words = ['track%d_%d' % (track, i) for i in range(200)]
+            word_lists.append(own_words[:100] + libretto + own_words[100:])
+        start = time.perf_counter()
+        common = self.lyrics.common_words(word_lists)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(common, libretto)
+        self.assertLess(elapsed, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
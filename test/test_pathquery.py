@@ -0,0 +1,115 @@
+import unittest
+
+from test.plugin_loader import load_plugin_module
+
+
+WORK = {
+    'id': 'w1',
+    'title': 'Symphony No. 5',
+    'relations': [
+        {
+            'type': 'parts',
+            'target-type': 'work',
+            'direction': 'backward',
+            'ended': True,
+            'work': {'id': 'p1', 'title': 'Symphonies'},
+            'attributes': [],
+        },
+        {
+            'type': 'composer',
+            'target-type': 'artist',
+            'direction': 'backward',
+            'ended': False,
+            'artist': {'id': 'a1', 'name': 'Beethoven', 'sort-name': 'Beethoven, Ludwig van'},
+        },
+        {
+            'type': 'parts',
+            'target-type': 'work',
+            'direction': 'forward',
+            'ended': False,
+            'work': {'id': 'm1', 'title': 'Allegro con brio'},
+        },
+        {
+            'type': 'parts',
+            'target-type': 'work',
+            'direction': 'forward',
+            'ended': False,
+            'work': {'id': 'm2', 'title': 'Andante con moto', 'disambiguation': None},
+        },
+    ],
+}
+
+RELEASE = {
+    'media': [
+        {'tracks': [{'recording': {'id': 'r1'}}, {'recording': {'id': 'r2'}}]},
+        {'tracks': [{'recording': {'id': 'r3'}}]},
+    ],
+}
+
+
+class PathQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pathquery = load_plugin_module('classical_extras', 'pathquery')
+
+    def query(self, obj, *match):
+        return self.pathquery.query(obj, match)
+
+    def test_path(self):
+        self.assertEqual(self.query(WORK, 'title'), ['Symphony No. 5'])
+        self.assertEqual(self.query(WORK, 'relations', 'artist', 'name'), ['Beethoven'])
+        self.assertEqual(self.query(WORK, 'missing'), [])
+
+    def test_nested_lists(self):
+        self.assertEqual(self.query(RELEASE, 'media', 'tracks', 'recording', 'id'), ['r1', 'r2', 'r3'])
+        self.assertEqual(self.query([RELEASE, [RELEASE]], 'media', 'tracks', 'recording', 'id'),
+                         ['r1', 'r2', 'r3'] * 2)
+
+    def test_value_filter(self):
+        self.assertEqual(
+            self.query(WORK, 'relations', 'target-type:work', 'type:parts', 'direction:forward', 'work', 'id'),
+            ['m1', 'm2'])
+        self.assertEqual(
+            self.query(WORK, 'relations', 'direction:backward', 'target-type:work', 'work', 'title'),
+            ['Symphonies'])
+
+    def test_dotted_filter(self):
+        self.assertEqual(self.query(WORK, 'relations', 'work.title:Andante con moto', 'work', 'id'), ['m2'])
+        self.assertEqual(self.query(WORK, 'relations', 'artist.id:a1', 'type'), ['composer'])
+
+    def test_boolean_filter(self):
+        self.assertEqual(self.query(WORK, 'relations', 'ended:True', 'work', 'id'), ['p1'])
+
+    def test_filter_as_last_item(self):
+        self.assertEqual(self.query(WORK, 'relations', 'target-type:artist'), [WORK['relations'][1]])
+
+    def test_none_not_returned(self):
+        self.assertEqual(self.query(WORK, 'relations', 'work', 'disambiguation'), [])
+
+    def test_compiled_once(self):
+        match = ('relations', 'type:parts', 'work', 'id')
+        self.assertIs(self.pathquery.compile_query(match), self.pathquery.compile_query(match))
+
+    def test_xml_nodes(self):
+        from picard.util.xml import XmlNode
+        metadata = XmlNode()
+        work = metadata.append_child('work')
+        work.attribs['id'] = 'w1'
+        relation_list = work.append_child('relation_list')
+        relation_list.attribs['target_type'] = 'work'
+        for relation_type, target in (('parts', 'p1'), ('based on', 'b1')):
+            relation = relation_list.append_child('relation')
+            relation.attribs['type'] = relation_type
+            relation.append_child('target').text = target
+        # XmlNode attributes and children are found under 'attribs' and 'children'
+        self.assertEqual(
+            self.query(metadata, 'work', 'relation_list', 'attribs.target_type:work', 'relation',
+                       'attribs.type:parts', 'target', 'text'),
+            ['p1'])
+        self.assertEqual(self.query(metadata, 'work', 'attribs', 'id'), ['w1'])
+        # a list is returned as one item
+        self.assertEqual(len(self.query(metadata, 'work', 'relation_list', 'relation')[0]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import xml.etree.ElementTree as ET
+
+from test.plugin_loader import load_plugin_module
+
+
+COMPOSERS = ['Antonín Dvořák', 'Léonin', 'Pérotin', 'Johann Sebastian Bach', 'Alban Berg & co']
+
+
+def reference_xml(count):
+    """A Reference.xml of count composers, with periods, genres and some
+    records and fields which are not read."""
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', '<ReferenceDB>']
+    for i in range(count):
+        name = COMPOSERS[i % len(COMPOSERS)].replace('&', '&amp;')
+        lines.append(
+            '  <Composer>'
+            '<Name>%s %d</Name><Sort>%d, %s</Sort>'
+            '<Birth>%d</Birth><Death>%d</Death>'
+            '<CountryCode>CZ</CountryCode>'
+            '<Nickname>not read</Nickname>'
+            '<Core>%s</Core>'
+            '</Composer>' % (name, i, i, name, 1600 + i % 300, 1650 + i % 300, 'true' if i % 3 else ''))
+    lines.append('  <ClassicalPeriod><Name>Baroque</Name>'
+                 '<Start_x0020_Date>1600</Start_x0020_Date><End_x0020_Date>1750</End_x0020_Date>'
+                 '</ClassicalPeriod>')
+    lines.append('  <ClassicalPeriod><Name>Modern</Name>'
+                 '<Start_x0020_Date>1900</Start_x0020_Date></ClassicalPeriod>')
+    lines.append('  <Orchestra><Name>not read</Name></Orchestra>')
+    for genre in ['Symphony', 'Opera', 'Chamber music']:
+        lines.append('  <ClassicalGenre><Name>%s</Name></ClassicalGenre>' % genre)
+    lines.append('</ReferenceDB>')
+    return '\n'.join(lines)
+
+
+def read_whole_file(references, path):
+    """Read the records from the whole parsed file, as the plugin did before
+    the file was streamed: one list of texts per field, holding each field
+    element's own text."""
+    data = {key: [] for key, fields in references.REFERENCE_RECORDS.values()}
+    root = ET.parse(path).getroot()
+    for element in root:
+        record_type = references.REFERENCE_RECORDS.get(element.tag)
+        if record_type:
+            record = {}
+            for name, key in record_type[1]:
+                record[key] = [(field.text or '') + ''.join(child.tail or '' for child in field)
+                               for field in element if field.tag == name]
+            data[record_type[0]].append(record)
+    return data
+
+
+class ReadReferencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.references = load_plugin_module('classical_extras', 'references')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'Reference.xml')
+
+    def write(self, text):
+        with open(self.path, 'w', encoding='utf8') as reference_file:
+            reference_file.write(text)
+
+    def test_chunks_match_whole_file(self):
+        self.write(reference_xml(1500))
+        self.assertGreater(os.path.getsize(self.path), 3 * 64 * 1024)
+        expected = read_whole_file(self.references, self.path)
+        self.assertEqual(len(expected['composers']), 1500)
+        self.assertEqual(self.references.read_references(self.path, 64 * 1024), (expected, None))
+
+    def test_small_chunks(self):
+        # chunk boundaries inside tags, entities and multi-byte characters
+        self.write(reference_xml(20))
+        expected = read_whole_file(self.references, self.path)
+        for chunk_size in (1, 7, 64):
+            self.assertEqual(self.references.read_references(self.path, chunk_size), (expected, None))
+
+    def test_records(self):
+        self.write(reference_xml(2))
+        data, error = self.references.read_references(self.path)
+        self.assertIsNone(error)
+        self.assertEqual(data['composers'][0], {
+            'name': ['Antonín Dvořák 0'],
+            'sort': ['0, Antonín Dvořák'],
+            'birth': ['1600'],
+            'death': ['1650'],
+            'country': ['CZ'],
+            'core': ['']})
+        self.assertEqual(data['periods'][1], {'name': ['Modern'], 'start': ['1900'], 'end': []})
+        self.assertEqual(data['genres'], [{'name': ['Symphony']}, {'name': ['Opera']}, {'name': ['Chamber music']}])
+
+    def test_not_well_formed(self):
+        text = reference_xml(10)
+        self.write(text[:text.index('<Composer>', text.index('Pérotin'))] + '<Composer><Name>x</Nme>')
+        data, error = self.references.read_references(self.path, 64)
+        self.assertTrue(error)
+        self.assertEqual([c['name'] for c in data['composers']],
+                         [['Antonín Dvořák 0'], ['Léonin 1'], ['Pérotin 2']])
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.references = load_plugin_module('classical_extras', 'references')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'Reference.xml')
+        self.snapshot = os.path.join(self.directory, 'snapshots', 'Reference.pickle')
+        with open(self.source, 'w', encoding='utf8') as source_file:
+            source_file.write(reference_xml(3))
+        self.data, error = self.references.read_references(self.source)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.references.read_snapshot(self.snapshot, self.source))
+        self.references.write_snapshot(self.snapshot, self.source, self.data)
+        self.assertEqual(self.references.read_snapshot(self.snapshot, self.source), self.data)
+
+    def test_changed_file(self):
+        self.references.write_snapshot(self.snapshot, self.source, self.data)
+        with open(self.source, 'a') as source_file:
+            source_file.write('\n')
+        self.assertIsNone(self.references.read_snapshot(self.snapshot, self.source))
+
+    def test_touched_file(self):
+        self.references.write_snapshot(self.snapshot, self.source, self.data)
+        mtime = os.stat(self.source).st_mtime + 10
+        os.utime(self.source, (mtime, mtime))
+        self.assertEqual(self.references.read_snapshot(self.snapshot, self.source), self.data)
+        # the snapshot now has the new modification time, so the file is not read again
+        with mock.patch.object(self.references, 'file_sha1') as file_sha1:
+            self.assertEqual(self.references.read_snapshot(self.snapshot, self.source), self.data)
+        file_sha1.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from test.plugin_loader import load_plugin_module
+
+
+class ReportWhenDoneTest(unittest.TestCase):
+
+    RELEASE_ID = 'timing-test-release'
+
+    def setUp(self):
+        self.timing = load_plugin_module('classical_extras', 'timing')
+        self.addCleanup(self.timing.discard, self.RELEASE_ID)
+        self.reports = []
+
+    def test_no_timed_calls_running(self):
+        self.timing.report_when_done(self.RELEASE_ID, self.reports.append)
+        self.assertEqual(self.reports, [[]])
+
+    def test_reported_after_outermost_call(self):
+        timing = self.timing
+
+        @timing.timed('logging')
+        def write_log(release_id):
+            pass
+
+        @timing.timed('process_album')
+        def process_album(release_id):
+            write_log(release_id)
+            # as close_log
+            timing.report_when_done(release_id, self.reports.append)
+            write_log(release_id)
+            self.assertEqual(self.reports, [])
+
+        @timing.timed('track')
+        def track(release_id):
+            process_album(release_id)
+            self.assertEqual(self.reports, [])
+
+        track(self.RELEASE_ID)
+        self.assertEqual(len(self.reports), 1)
+        self.assertEqual(
+            sorted((name, calls) for name, seconds, calls in self.reports[0]),
+            [('logging', 2), ('process_album', 1), ('track', 1)])
+        self.assertEqual(self.timing.sizes()['timed releases'], 0)
+        self.assertEqual(self.timing.sizes()['pending timing reports'], 0)
+
+    def test_reported_after_exception(self):
+        @self.timing.timed('process_album')
+        def process_album(release_id):
+            self.timing.report_when_done(release_id, self.reports.append)
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            process_album(self.RELEASE_ID)
+        self.assertEqual([name for name, seconds, calls in self.reports[0]], ['process_album'])
+
+    def test_other_releases_not_waited_for(self):
+        @self.timing.timed('process_album')
+        def process_album(release_id):
+            self.timing.report_when_done(self.RELEASE_ID, self.reports.append)
+
+        process_album('other-release')
+        self.addCleanup(self.timing.discard, 'other-release')
+        self.assertEqual(self.reports, [[]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from test.plugin_loader import load_plugin, load_plugin_module
+from test.stand_ins import StandInAlbum, StandInWebService
+
+
+def genre_claim(qid):
+    return {'mainsnak': {'snaktype': 'value', 'property': 'P136',
+                         'datavalue': {'type': 'wikibase-entityid', 'value': {'entity-type': 'item', 'id': qid}}}}
+
+
+NO_VALUE_CLAIM = {'mainsnak': {'snaktype': 'novalue', 'property': 'P136'}}
+
+API_ERROR = {'error': {'code': 'maxlag', 'info': 'Waiting for a database server'}}
+
+
+def labels_response(request, missing=()):
+    """A wbgetentities response with a label for each id requested (except those missing)."""
+    entities = {}
+    for qid in request.queryargs['ids'].split('|'):
+        if qid in missing:
+            entities[qid] = {'id': qid, 'missing': ''}
+        else:
+            entities[qid] = {'id': qid, 'labels': {'en': {'language': 'en', 'value': 'genre ' + qid}}}
+    return {'entities': entities}
+
+
+class JsonApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = load_plugin('wikidata')
+        from picard.metadata import Metadata
+        self.Metadata = Metadata
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.wikidata = self.plugin.Wikidata()
+        self.wikidata.genre_cache = self.plugin.GenreCache(
+            os.path.join(directory, 'wikidata_genres.sqlite'), self.plugin.CACHE_TTL)
+        self.addCleanup(self.wikidata.genre_cache.close)
+        self.webservice = StandInWebService(labels_response)
+        self.wikidata.ws = self.webservice
+        self.album = StandInAlbum()
+        self.metadata = {}
+
+    def wait_for(self, qids):
+        """Set up a work waiting for the genres of each entity, as process_wikidata does."""
+        for qid in qids:
+            item_id = 'work-' + qid
+            self.metadata[qid] = self.Metadata()
+            self.wikidata.requests[item_id] = [self.metadata[qid]]
+            self.wikidata.itemAlbums[item_id] = self.album
+            self.wikidata.entity_waiting[qid] = [(item_id, self.plugin.Wikidata.WORK)]
+            self.album._requests += 1
+
+    def requested_ids(self):
+        return [request.queryargs['ids'].split('|') for request in self.webservice.pending]
+
+    def test_claims(self):
+        batch = ['Q1', 'Q2', 'Q3', 'Q4']
+        self.wait_for(batch)
+        self.wikidata.genre_cache.put('labels', 'Q101', 'classical music')
+        many_genres = ['Q%d' % i for i in range(200, 260)]
+        self.wikidata.parse_claims_response(batch, {'entities': {
+            # Q1 redirects to Q10
+            'Q10': {'id': 'Q10', 'redirects': {'from': 'Q1', 'to': 'Q10'},
+                    'claims': {'P136': [genre_claim('Q100'), genre_claim('Q101')]}},
+            'Q2': {'id': 'Q2', 'claims': {'P136': [NO_VALUE_CLAIM, genre_claim('Q101')]}},
+            'Q3': {'id': 'Q3', 'missing': ''},
+            'Q4': {'id': 'Q4', 'claims': {'P136': [genre_claim(qid) for qid in many_genres]}},
+        }}, None, None)
+
+        cache = self.wikidata.genre_cache
+        self.assertEqual(cache.get('genres', 'Q1'), ['Q100', 'Q101'])
+        self.assertEqual(cache.get('genres', 'Q2'), ['Q101'])
+        self.assertIsNone(cache.get('genres', 'Q3'))
+        self.assertEqual(cache.get('genres', 'Q4'), many_genres)
+
+        # the labels not already known, at most 50 to a request
+        requested = self.requested_ids()
+        self.assertEqual([len(ids) for ids in requested], [50, 11])
+        self.assertEqual(sorted(requested[0] + requested[1]), sorted(['Q100'] + many_genres))
+
+        self.webservice.answer()
+        # nothing is found until all the labels have been answered
+        self.assertEqual(self.album._requests, 4)
+        self.assertEqual(self.metadata['Q1'].getall('genre'), [])
+        self.webservice.answer(labels_response(self.webservice.pending[0], missing=['Q259']))
+        self.assertEqual(self.album._requests, 0)
+        self.assertEqual(self.album.finalized, 1)
+        self.assertEqual(self.wikidata.entity_waiting, {})
+
+        self.assertEqual(self.metadata['Q1'].getall('genre'), ['Classical Music', 'Genre Q100'])
+        self.assertEqual(self.metadata['Q2'].getall('genre'), ['Classical Music'])
+        self.assertEqual(self.metadata['Q3'].getall('genre'), [])
+        self.assertEqual(len(self.metadata['Q4'].getall('genre')), 59)
+        self.assertEqual(cache.get('labels', 'Q100'), 'genre Q100')
+        self.assertIsNone(cache.get('labels', 'Q259'))
+
+    def test_claims_error_body(self):
+        self.wait_for(['Q1'])
+        self.wikidata.parse_claims_response(['Q1'], API_ERROR, None, None)
+        self.assertIsNone(self.wikidata.genre_cache.get('genres', 'Q1'))
+        self.assertEqual(self.webservice.requests, [])
+        self.assertEqual(self.album._requests, 0)
+        self.assertEqual(self.metadata['Q1'].getall('genre'), [])
+
+    def test_claims_request_failed(self):
+        self.wait_for(['Q1'])
+        self.wikidata.parse_claims_response(['Q1'], {}, None, 'network error')
+        self.assertIsNone(self.wikidata.genre_cache.get('genres', 'Q1'))
+        self.assertEqual(self.album._requests, 0)
+
+    def test_labels_error_body(self):
+        many_genres = ['Q%d' % i for i in range(200, 260)]
+        self.wait_for(['Q1'])
+        self.wikidata.parse_claims_response(['Q1'], {'entities': {
+            'Q1': {'id': 'Q1', 'claims': {'P136': [genre_claim(qid) for qid in many_genres]}}}}, None, None)
+        first_group = self.requested_ids()[0]
+        self.webservice.answer(API_ERROR)
+        self.assertEqual(self.album._requests, 1)
+        self.webservice.answer()
+        self.assertEqual(self.album._requests, 0)
+        cache = self.wikidata.genre_cache
+        self.assertTrue(all(cache.get('labels', qid) is None for qid in first_group))
+        self.assertEqual(cache.get('labels', 'Q259'), 'genre Q259')
+        self.assertEqual(len(self.metadata['Q1'].getall('genre')), 10)
+
+
+class GenreCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        genrecache = load_plugin_module('wikidata', 'genrecache')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = genrecache.GenreCache(os.path.join(directory, 'wikidata_genres.sqlite'), 60)
+        self.addCleanup(self.cache.close)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get('genres', 'Q1'))
+        self.cache.put('genres', 'Q1', ['Q100'])
+        self.cache.put('labels', 'Q100', 'classical music')
+        self.assertEqual(self.cache.get('genres', 'Q1'), ['Q100'])
+        self.assertEqual(self.cache.get('labels', 'Q100'), 'classical music')
+        self.assertIsNone(self.cache.get('labels', 'Q1'))
+
+    def test_read_error_disables_cache(self):
+        self.cache.put('genres', 'Q1', ['Q100'])
+        self.cache.connection.execute('DROP TABLE genres')
+        self.assertIsNone(self.cache.get('genres', 'Q1'))
+        self.assertTrue(self.cache.disabled)
+        self.assertIsNone(self.cache.connection)
+        # no more attempts to use the database
+        self.cache.put('genres', 'Q1', ['Q100'])
+        self.assertIsNone(self.cache.connection)
+
+    def test_write_error_disables_cache(self):
+        self.cache.put('genres', 'Q1', ['Q100'])
+        self.cache.connection.execute('DROP TABLE genres')
+        self.cache.put('genres', 'Q2', ['Q100'])
+        self.assertTrue(self.cache.disabled)
+        self.assertIsNone(self.cache.get('labels', 'Q100'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from test.plugin_loader import load_plugin_module
+
+
+class WorksStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        workscache = load_plugin_module('classical_extras', 'workscache')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = workscache.WorksStore(os.path.join(directory, 'works.sqlite'), 60, 3)
+        self.addCleanup(self.store.close)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.store.get('w1', 'rels'))
+        self.store.put('w1', 'rels', {'id': 'w1'})
+        self.assertEqual(self.store.get('w1', 'rels'), {'id': 'w1'})
+        # another version stamp is another entry
+        self.assertIsNone(self.store.get('w1', 'rels+tags'))
+
+    def test_evicts_least_recently_used(self):
+        self.store.put('w1', 'rels', {'id': 'w1'})
+        self.store.puts = 0
+        for work_id in ('w2', 'w3', 'w4'):
+            self.store.put(work_id, 'rels', {'id': work_id})
+        self.store.puts = 0
+        self.store.put('w5', 'rels', {'id': 'w5'})
+        self.assertIsNone(self.store.get('w1', 'rels'))
+        self.assertEqual(self.store.get('w5', 'rels'), {'id': 'w5'})
+
+    def test_database_error_disables_store(self):
+        self.store.put('w1', 'rels', {'id': 'w1'})
+        self.store.connection.execute('DROP TABLE works')
+        self.assertIsNone(self.store.get('w1', 'rels'))
+        self.assertTrue(self.store.disabled)
+        self.assertIsNone(self.store.connection)
+        # no more attempts to use the database
+        self.store.put('w1', 'rels', {'id': 'w1'})
+        self.assertIsNone(self.store.connection)
+
+    def test_write_error_disables_store(self):
+        self.store.put('w1', 'rels', {'id': 'w1'})
+        self.store.connection.execute('DROP TABLE works')
+        self.store.put('w2', 'rels', {'id': 'w2'})
+        self.assertTrue(self.store.disabled)
+
+
+if __name__ == '__main__':
+    unittest.main()